@@ -10,6 +10,9 @@ import os
 import sys
 import csv
 from collections import defaultdict
+from handclassifier.tsvsampler import TSVSampler
+from handclassifier.hashsample import merge_samples
+from handclassifier.resume import ResumeIndex
 
 categories = ("SI - Service Informational",
               "ST - Service Transactional",
@@ -20,6 +23,9 @@ categories = ("SI - Service Informational",
               "? - Unable to determine")
 
 nodemapfn = 'output/nodes-all-reduced.tsv'
+# With selection='hash' (below), the node map can be split into shards
+# sampled separately and merged; list them all here in place of nodemapfn
+nodemapfns = (nodemapfn,)
 outfn = 'govUK-hand-classifications-validation.tsv'
 # Base URL of the Wayback Machine (or OpenWayback) instance being used to
 # supply the raw pages
@@ -28,57 +34,53 @@ wburl = 'http://192.168.1.103:8080/'
 # Total number of items is ~9.1m, so this generates
 # ~200 hand classifications
 proptoclassify = 0.000024
+# How nodes are selected: 'skip' jumps straight to randomly chosen lines of
+# the node map, using a line index; 'hash' reads every line and selects each
+# node by a seeded hash of its URL, so that shards of the node map give
+# exactly the sample of the whole (see handclassifier.hashsample)
+selection = 'skip'
 
 r = random.Random()
 r.seed(1818118181) # Arbitrary
 
 rejects = defaultdict(int)
-content = []
 
-#Load all the objects into memory first
-with open(nodemapfn, 'r', newline='') as f:
-    reader = csv.reader(f, dialect='excel-tab')
-    for row in reader:
-        if r.random() > proptoclassify:
-#            print "Not selecting ("+str(rval)+")", record.url
-            rejects['not sampled'] += 1
-            continue
-#        print "Adding:", ccode, cmime, record.url
-        # Read article URL into memory. Don't need the article body with
-        # the Wayback classfier as it's fetched through the Wayback index.
-        # Not sending it through here as the second part of the tuple
-        # saves a good deal of memory.
-        content.append((row[0],None))
-
-# Shuffle content so it's not in alphabetical order for classifying
-r.shuffle(content)
+# Pick the sample. With selection='skip' the first run builds a line index
+# next to each node map file, which later runs reuse.
+# Don't need the article body with the Wayback classfier as it's fetched
+# through the Wayback index. Not sending it through here as the second part
+# of the tuple saves a good deal of memory.
+samples = []
+for fn in nodemapfns:
+    sampler = TSVSampler(fn, dialect='excel-tab', debug=sys.stderr)
+    sample = [(row[0],None) for row in sampler.sample(proptoclassify,
+                                                      seed=1818118181,
+                                                      selection=selection)]
+    rejects['not sampled'] += len(sampler) - len(sample)
+    sampler.close()
+    samples.append(sample)
+
+if selection == 'hash':
+    # The samples are in file order; merging puts them in an order which
+    # depends only on the items, and is the same for one file as for shards
+    content = merge_samples(samples, seed=1818118181)
+else:
+    # Shuffle content so it's not in alphabetical order for classifying
+    content = [item for sample in samples for item in sample]
+    r.shuffle(content)
 
 print("There are", len(content), "objects to classify.")
 print("Rejects:", rejects)
 
-completed = 0
-try:
-    with open(outfn, 'r', newline='') as output:
-        #first check how many classifications have already been done
-        for line in output:
-            completed = completed + 1
-    print(completed, "classifications already completed")
-    content = content[completed:]
-except IOError:
-    print("Nothing classified yet")
-#    output = open(outfn, 'w', newline='')
-#    output.write("URL;Classification\r\n")
-
-output = open(outfn, 'a', newline='')
-writer = csv.writer(output, dialect='excel-tab')
+# Skip anything already classified, and re-queue records recorded as
+# "? - Unable to determine" to the end of the session to try again
+resume = ResumeIndex(outfn)
+print(len(resume), "classifications already completed")
 
-
-if len(content) == 0:
+if all(resume.is_done(item) for item in content):
     exit("Nothing to classify. Exiting.")
 
-# TODO: Check for records which are recorded as "? - Unable to determine",
-# remove them from the output file and add them to the end of the content
-# list to try again
+output = open(outfn, 'a', newline='')
 
 
 #Initialise and run the GUI
@@ -86,7 +88,7 @@ classifier = handclassifier.ManualWaybackPlusMongoDBClassifierSingle(
                 'warctext', 'bs', urlfield='url', contentfield='text',
                 client=pymongo.mongo_client.MongoClient(host='192.168.1.103'),
                 items=content, labels=categories, output=output,
-                wburl=wburl, nprevclass=completed, debug=sys.stderr)
+                wburl=wburl, resume=resume, debug=sys.stderr)
 tkinter.mainloop()
 output.close()
 
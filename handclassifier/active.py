@@ -0,0 +1,254 @@
+"""Active learning: presenting the most informative items first.
+
+ActiveQueue is an itemqueue.ItemQueue which holds a pool of upcoming items
+rather than a short FIFO window. As items are labelled it trains a simple
+incremental classifier (softmax regression on hashed bag-of-words features)
+and re-ranks the pool so that the items the model is least sure about come
+next. Training and re-ranking happen in a background thread; the classifier
+window only ever reads the latest ranking, so it never waits for the model.
+
+Pass an ActiveQueue as the 'items' of a ManualTextClassifier, which feeds
+each label back through the queue's learn() method.
+
+This needs NumPy.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+import re
+import zlib
+import random
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import numpy as np
+from .itemqueue import ItemQueue
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+def default_text(item):
+    """The text used to learn from an item: its content if it has any,
+    otherwise its identifier (usually a URL, which has useful words too)."""
+    text = item[1] if item[1] else item[0]
+    if isinstance(text, bytes) and not isinstance(text, str):
+        text = text.decode('utf-8', 'replace')
+    return text
+
+class HashedSoftmax(object):
+    """Multinomial logistic regression over hashed bag-of-words features,
+    trained by stochastic gradient descent one example at a time. Classes
+    are added as new labels are seen.
+
+    dim -- the number of hashed features; a power of 2 (default: 2**18)
+    lr -- the learning rate (default: 0.5)
+    """
+    def __init__(self, dim=2**18, lr=0.5):
+        self.dim = dim
+        self.lr = lr
+        self.classes = []
+        self.W = np.zeros((0, dim))
+        self.b = np.zeros(0)
+
+    def features(self, text):
+        """Return the L2-normalised hashed word counts of text as a pair of
+        arrays (indices, values)."""
+        words = _WORD.findall(text.lower())
+        if not words:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        h = np.fromiter((zlib.crc32(w.encode('utf-8')) for w in words),
+                        dtype=np.int64, count=len(words)) & (self.dim - 1)
+        idx, counts = np.unique(h, return_counts=True)
+        vals = counts.astype(np.float64)
+        return idx, vals / np.sqrt((vals * vals).sum())
+
+    def _class(self, label):
+        try:
+            return self.classes.index(label)
+        except ValueError:
+            self.classes.append(label)
+            self.W = np.vstack([self.W, np.zeros((1, self.dim))])
+            self.b = np.append(self.b, 0.0)
+            return len(self.classes) - 1
+
+    @staticmethod
+    def _softmax(z):
+        z = z - z.max(axis=-1, keepdims=True)
+        e = np.exp(z)
+        return e / e.sum(axis=-1, keepdims=True)
+
+    def partial_fit(self, feats, label, lr=None):
+        """Take one gradient step on a single (features, label) example."""
+        k = self._class(label)
+        idx, vals = feats
+        p = self._softmax(self.W[:, idx].dot(vals) + self.b)
+        p[k] -= 1.0
+        step = self.lr if lr is None else lr
+        self.W[:, idx] -= step * np.outer(p, vals)
+        self.b -= step * p
+
+    def predict_proba(self, featlist):
+        """Return an (n, nclasses) array of class probabilities."""
+        n = len(featlist)
+        if not n or not self.classes:
+            return np.zeros((n, len(self.classes)))
+        lengths = np.array([len(f[0]) for f in featlist])
+        scores = np.tile(self.b, (n, 1))
+        nonempty = lengths > 0
+        if nonempty.any():
+            idx = np.concatenate([f[0] for f in featlist])
+            vals = np.concatenate([f[1] for f in featlist])
+            starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            contrib = self.W[:, idx] * vals
+            sums = np.add.reduceat(contrib, starts[nonempty], axis=1)
+            scores[nonempty] += sums.T
+        return self._softmax(scores)
+
+    def uncertainty(self, featlist):
+        """Return 1 - (margin between the two most probable classes) for
+        each example; 0 for all while fewer than 2 classes are known."""
+        if len(self.classes) < 2:
+            return np.zeros(len(featlist))
+        p = np.sort(self.predict_proba(featlist), axis=1)
+        return 1.0 - (p[:, -1] - p[:, -2])
+
+class ActiveQueue(ItemQueue):
+    """An ItemQueue which presents the most uncertain items of a pool
+    first.
+
+    Until the model has seen two different labels, items come in their
+    original order and only the usual lookahead window is held.
+
+    items -- any iterable of (identifier, content, ...) item tuples
+    poolsize -- the number of upcoming items to choose among (default: 500)
+    text -- a function giving the text to learn from for an item (default:
+        default_text)
+    dim -- the number of hashed features (default: 2**18)
+    epochs -- passes over all labelled items after each new label
+        (default: 3)
+    seed -- the random seed for training order (default: 1818118181)
+    lookahead, resume -- as for ItemQueue
+    """
+    def __init__(self, items, poolsize=500, text=None, dim=2**18, epochs=3,
+                 seed=1818118181, lookahead=16, resume=None):
+        super(ActiveQueue, self).__init__(items, lookahead=lookahead,
+                                          resume=resume)
+        self.poolsize = max(poolsize, self.lookahead)
+        self.model = HashedSoftmax(dim)
+        self.epochs = epochs
+        self._text = text if text else default_text
+        self._r = random.Random(seed)
+        self.labelled = []
+        # id(item) -> uncertainty; replaced wholesale by the worker
+        self._scores = {}
+        # id(item) -> (item, features); the item is kept to detect id reuse
+        self._feats = {}
+        self._lock = threading.Lock()
+        self._events = queue.Queue()
+        self._worker = None
+        self.nranked = 0
+
+    def _fill(self, n):
+        while len(self._window) < n:
+            try:
+                item = self._pull()
+            except StopIteration:
+                break
+            with self._lock:
+                self._window.append(item)
+
+    def _ranked(self):
+        # Don't hold up the first items by filling the whole pool before
+        # there is a model to rank it with
+        if len(self.model.classes) >= 2:
+            self._fill(self.poolsize)
+        else:
+            self._fill(self.lookahead)
+        scores = self._scores
+        with self._lock:
+            pool = list(self._window)
+        # sorted() is stable, so ties keep their arrival order
+        return sorted(pool, key=lambda item: -scores.get(id(item), 0.0))
+
+    def peek(self, n=None):
+        if n is None or n > self.lookahead:
+            n = self.lookahead
+        return self._ranked()[:n]
+
+    def advance(self):
+        ranked = self._ranked()
+        if not ranked:
+            self.current = None
+            raise IndexError("No more items")
+        item = ranked[0]
+        with self._lock:
+            for i, pooled in enumerate(self._window):
+                if pooled is item:
+                    del self._window[i]
+                    break
+        self.current = item
+        self.position += 1
+        return item
+
+    def learn(self, item, label):
+        """Queue item's label for training and re-ranking."""
+        self._events.put((item, label))
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run)
+            self._worker.daemon = True
+            self._worker.start()
+
+    def _features(self, item):
+        cached = self._feats.get(id(item))
+        if cached is not None and cached[0] is item:
+            return cached[1]
+        feats = self.model.features(self._text(item))
+        self._feats[id(item)] = (item, feats)
+        return feats
+
+    def _run(self):
+        while True:
+            batch = [self._events.get()]
+            while True:
+                try:
+                    batch.append(self._events.get_nowait())
+                except queue.Empty:
+                    break
+            for item, label in batch:
+                self.labelled.append((self._features(item), label))
+            self._train()
+            self._rerank()
+
+    def _train(self):
+        examples = list(self.labelled)
+        for epoch in range(self.epochs):
+            self._r.shuffle(examples)
+            lr = self.model.lr / (1 + epoch)
+            for feats, label in examples:
+                self.model.partial_fit(feats, label, lr=lr)
+
+    def _rerank(self):
+        with self._lock:
+            pool = list(self._window)
+        feats = [self._features(item) for item in pool]
+        # Drop cached features of items which have left the pool
+        keep = set(id(item) for item in pool)
+        for key in list(self._feats):
+            if key not in keep:
+                del self._feats[key]
+        u = self.model.uncertainty(feats)
+        self._scores = dict((id(item), float(s)) for item, s in zip(pool, u))
+        self.nranked += 1
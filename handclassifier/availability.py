@@ -0,0 +1,235 @@
+"""Checking which items can be replayed before they are shown.
+
+An AvailabilityChecker asks a Wayback CDX server (OpenWayback's or pywb's)
+whether it holds a capture of each URL, many at a time from an asyncio event
+loop, and tags each URL as:
+
+* REPLAYABLE -- there is a capture to replay
+* FALLBACK -- there is no capture, but the fallback (such as MongoDB text)
+  has the content
+* MISSING -- neither has it
+
+URLs whose check failed (the CDX server could not be reached, say) have no
+tag, and are shown as they would be without a checker.
+
+Checks can all be made before the session, with check(), or as it goes: the
+Wayback classifiers given an 'availability' checker submit the upcoming
+items to it and route each item to the replay, the fallback or a "not
+available" page according to its tag.
+
+    checker = AvailabilityChecker('http://localhost:8080/wayback/cdx')
+    classifier = ManualWaybackPlusMongoDBClassifierSingle(...,
+                                                          availability=checker)
+
+This needs Python 3.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+import os
+import asyncio
+import threading
+from collections import Counter
+from urllib.parse import urlsplit, urlencode
+
+from .backends import REPLAYABLE, FALLBACK, MISSING
+
+def _text(s):
+    if isinstance(s, bytes):
+        return s.decode('utf-8')
+    return s
+
+class AvailabilityChecker(object):
+    """Tag URLs by whether a Wayback CDX server (or a fallback) has them.
+
+    cdxurl -- the URL of the CDX server, such as
+        http://localhost:8080/wayback/cdx
+    fallback -- a function taking a list of URLs and returning the set of
+        them available from the fallback, such as
+        backends.MongoDBBackend.available (default: None, so anything not
+        replayable is MISSING)
+    concurrency -- the maximum number of CDX queries at once (default: 16)
+    timeout -- seconds to wait for each CDX query (default: 30)
+    params -- extra CDX query parameters, such as
+        {'filter': 'statuscode:200'} (default: None)
+    debug -- a text output stream for printing debug messages (default:
+        None)
+
+    statuses -- a dict of the tag of each URL checked so far
+    """
+    def __init__(self, cdxurl, fallback=None, concurrency=16, timeout=30,
+                 params=None, debug=None):
+        self.cdxurl = cdxurl
+        self.fallback = fallback
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.params = dict(params or {})
+        self._debug = debug if debug else open(os.devnull, 'w')
+        self.statuses = {}
+        self.nerrors = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+
+    def query_url(self, url):
+        """The CDX query for captures of url."""
+        params = dict(self.params, url=_text(url), limit='1')
+        sep = '&' if '?' in self.cdxurl else '?'
+        return self.cdxurl + sep + urlencode(sorted(params.items()))
+
+    async def _get(self, url):
+        """GET url; return (status, body)."""
+        parts = urlsplit(url)
+        https = parts.scheme == 'https'
+        path = (parts.path or '/') + ('?'+parts.query if parts.query else '')
+        reader, writer = await asyncio.open_connection(
+            parts.hostname, parts.port or (443 if https else 80),
+            ssl=True if https else None)
+        try:
+            # HTTP/1.0, so the response is neither chunked nor kept alive
+            writer.write(('GET %s HTTP/1.0\r\nHost: %s\r\n'
+                          'User-Agent: handclassifier\r\n\r\n' %
+                          (path, parts.netloc)).encode('latin-1'))
+            await writer.drain()
+            data = b''
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                data += chunk
+        finally:
+            writer.close()
+        head, _, body = data.partition(b'\r\n\r\n')
+        status = int(head.split(None, 2)[1])
+        return status, body
+
+    async def _replayable(self, url):
+        """True if the CDX server has a capture of url, False if not, None
+        if it could not be asked."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            try:
+                status, body = await asyncio.wait_for(
+                    self._get(self.query_url(url)), self.timeout)
+            except Exception as e:
+                print("CDX query failed for", url, e, file=self._debug)
+                self.nerrors += 1
+                return None
+        if status == 404:
+            return False
+        if status != 200:
+            print("CDX query for", url, "returned", status,
+                  file=self._debug)
+            self.nerrors += 1
+            return None
+        return bool(body.strip())
+
+    async def _check(self, urls):
+        results = await asyncio.gather(*[self._replayable(url)
+                                         for url in urls])
+        statuses = {}
+        unreplayable = []
+        for url, replayable in zip(urls, results):
+            if replayable:
+                statuses[url] = REPLAYABLE
+            elif replayable is False:
+                unreplayable.append(url)
+        found = set()
+        if unreplayable and self.fallback is not None:
+            loop = asyncio.get_event_loop()
+            try:
+                found = await loop.run_in_executor(None, self.fallback,
+                                                   unreplayable)
+            except Exception as e:
+                print("Fallback check failed:", e, file=self._debug)
+                self.nerrors += 1
+                # Leave them untagged
+                unreplayable = []
+        for url in unreplayable:
+            statuses[url] = FALLBACK if url in found else MISSING
+        with self._lock:
+            self.statuses.update(statuses)
+            for url in urls:
+                self._pending.pop(url, None)
+        return statuses
+
+    def start(self):
+        """Start the background event loop used by submit() and
+        status()."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background event loop."""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = self._thread = self._semaphore = None
+            self._pending = {}
+
+    def submit(self, urls):
+        """Start checking those of urls not already checked or under way,
+        in the background."""
+        self.start()
+        with self._lock:
+            urls = [url for url in dict.fromkeys(urls)
+                    if url not in self.statuses and url not in self._pending]
+            if not urls:
+                return
+            future = asyncio.run_coroutine_threadsafe(self._check(urls),
+                                                      self._loop)
+            for url in urls:
+                self._pending[url] = future
+
+    def status(self, url, timeout=None):
+        """Return the tag of url (None if it could not be checked), waiting
+        for its check, and starting it if need be."""
+        self.submit([url])
+        with self._lock:
+            if url in self.statuses:
+                return self.statuses[url]
+            future = self._pending.get(url)
+        if future is None:
+            # Finished between submit() and here
+            return self.statuses.get(url)
+        return future.result(timeout).get(url)
+
+    def check(self, urls):
+        """Check every one of urls, in the background loop, and return a
+        dict of their tags. URLs which could not be checked are left out."""
+        urls = list(urls)
+        self.submit(urls)
+        with self._lock:
+            futures = set(self._pending[url] for url in urls
+                          if url in self._pending)
+        for future in futures:
+            future.result()
+        return dict((url, self.statuses[url]) for url in urls
+                    if url in self.statuses)
+
+    def counts(self):
+        """Return a Counter of the tags given so far."""
+        return Counter(self.statuses.values())
@@ -0,0 +1,398 @@
+"""Content backends, which supply what the classifiers show for each item.
+
+Backends are looked up by name in a registry, and each is only imported
+(along with anything heavy it depends on, such as pymongo) when it is first
+asked for:
+
+* text -- TextBackend, the content carried in the items themselves
+* browser -- BrowserBackend, which makes pages available to the system web
+  browser through temporary files or a loopback httpserve.ContentServer
+* wayback -- WaybackBackend, which gives the URL of each item in an
+  OpenWayback installation
+* mongodb -- MongoDBBackend, text looked up in a MongoDB collection
+* warc -- warcbackend.WarcBackend, records read from WARC files by location
+
+get_backend('wayback', wburl) makes a backend; register_backend() adds
+others, given as a class (or other factory) or as a 'module:name' string to
+be imported on first use.
+
+MongoDBBackend fetches text from a MongoDB collection. Rather than a
+find_one() per item it looks up the URLs of the upcoming items together with
+a single $in query, projects only the wanted field, and keeps the decoded text
+in a least-recently-used cache bounded by the total amount of text held.
+
+The backend only needs the find() and index_information() methods of a
+pymongo Collection, so any object providing those (for example a small
+in-memory fake) can stand in for a real database.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+from __future__ import print_function
+import os
+import sys
+import atexit
+import tempfile
+import mimetypes
+import threading
+import warnings
+import importlib
+from collections import OrderedDict
+try:
+    from urllib.parse import unquote
+except ImportError:
+    from urllib import unquote
+
+_REGISTRY = {
+    'text': 'handclassifier.backends:TextBackend',
+    'browser': 'handclassifier.backends:BrowserBackend',
+    'wayback': 'handclassifier.backends:WaybackBackend',
+    'mongodb': 'handclassifier.backends:MongoDBBackend',
+    'warc': 'handclassifier.warcbackend:WarcBackend',
+}
+
+def register_backend(name, factory):
+    """Register a backend under name.
+
+    factory -- a class or other callable making the backend, or a string
+        'module:name' naming one, which is imported when first needed
+    """
+    _REGISTRY[name] = factory
+
+def backend_names():
+    """Return the sorted names of the registered backends."""
+    return sorted(_REGISTRY)
+
+def backend_factory(name):
+    """Return the factory registered as name, importing it if need be.
+
+    Raises ValueError for an unknown name."""
+    try:
+        factory = _REGISTRY[name]
+    except KeyError:
+        raise ValueError("Unknown backend '%s'; known backends are %s" %
+                         (name, ', '.join(backend_names())))
+    if isinstance(factory, str):
+        modname, _, attr = factory.partition(':')
+        factory = getattr(importlib.import_module(modname), attr)
+        _REGISTRY[name] = factory
+    return factory
+
+def get_backend(name, *args, **kw):
+    """Make the backend registered as name with the given arguments."""
+    return backend_factory(name)(*args, **kw)
+
+class LRUCache(object):
+    """A mapping which discards its least recently used entries once the
+    total size of its values exceeds maxsize.
+
+    maxsize -- the maximum total size of the values held
+    sizeof -- a function giving the size of a value (default: len, with
+        None counting as 0)
+    """
+    def __init__(self, maxsize, sizeof=None):
+        self.maxsize = maxsize
+        self._sizeof = sizeof if sizeof else (
+            lambda v: 0 if v is None else len(v))
+        self._data = OrderedDict()
+        self.size = 0
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, key):
+        value = self._data.pop(key)
+        self._data[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self._data:
+            self.size -= self._sizeof(self._data.pop(key))
+        self._data[key] = value
+        self.size += self._sizeof(value)
+        # Always keep the newest entry, even if it is oversized
+        while self.size > self.maxsize and len(self._data) > 1:
+            _, old = self._data.popitem(last=False)
+            self.size -= self._sizeof(old)
+
+class TextBackend(object):
+    """The content of each item is its second field, and the content of the
+    second item of a pair its fourth."""
+    def get(self, item, second=False):
+        """Return the content of item, or with second=True that of the
+        second item of the pair."""
+        return item[3] if second else item[1]
+
+class BrowserBackend(object):
+    """Make pages available to the system web browser, either as temporary
+    files (removed at exit) or, with serve=True, from memory through a
+    loopback httpserve.ContentServer.
+
+    serve -- serve pages rather than writing files (default: False)
+    cachesize -- the maximum number of bytes of pages the server holds
+        (default: 64*1024*1024)
+    debug -- a text output stream for printing debug messages (default:
+        None)
+    """
+    def __init__(self, serve=False, cachesize=64*1024*1024, debug=None):
+        self._tempfns = []
+        self._debug = debug if debug else open(os.devnull, 'w')
+        if serve:
+            from .httpserve import ContentServer
+            self.server = ContentServer(cachesize=cachesize)
+        else:
+            self.server = None
+        atexit.register(self.close)
+
+    def store(self, origurl, page_content, ctype=None):
+        """Make page_content available to the browser, returning the URL to
+        open.
+
+        page_content -- the page, as text (sent as UTF-8 HTML) or as bytes
+            (sent as they are)
+        ctype -- the MIME type of bytes page_content, which also chooses
+            the file extension (default: text/html)
+        """
+        if isinstance(page_content, type(u'')):
+            page_content = page_content.encode('utf-8')
+            ctype = 'text/html; charset=utf-8'
+        elif ctype is None:
+            ctype = 'text/html'
+        ext = mimetypes.guess_extension(ctype.split(';')[0].strip())
+        if not ext or ext in ('.htm', '.shtml'):
+            ext = '.html'
+        if self.server is not None:
+            return self.server.add(self.page_name(origurl, ext),
+                                   page_content, ctype)
+        return self.write_tempfile(origurl, page_content, ext)
+
+    @staticmethod
+    def page_name(origurl, ext='.html'):
+        # Mangle URL into filename, so it shows up in the titlebar.
+        # Take the first 100 characters, to avoid hitting OS limits.
+        # Try Py3, fall back to Py2
+        if isinstance(origurl, bytes) and not isinstance(origurl, str):
+            origurl = origurl.decode('utf-8', 'replace')
+        f = b'/#* '
+        t = b'____'
+        if sys.version_info >= (3,):
+            trantab = bytes.maketrans(f,t)
+        else:
+            import string
+            trantab = string.maketrans(f,t)
+        return '__'+unquote(origurl).translate(trantab)[:100]+ext
+
+    def write_tempfile(self, origurl, page_content, ext='.html'):
+        """Write page_content (bytes) to a new temporary file and return
+        its URL."""
+        suf = self.page_name(origurl, ext)
+        with tempfile.NamedTemporaryFile(suffix=suf, delete=False) as fh:
+            self._tempfns.append(fh.name)
+            fh.write(page_content)
+            return 'file://'+fh.name
+
+    def close(self):
+        """Remove the temporary files and stop the server."""
+        for fn in self._tempfns:
+            try:
+                os.unlink(fn)
+            except OSError:
+                print("File", fn, "already deleted.", file=self._debug)
+        self._tempfns = []
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+
+# Tags an availability.AvailabilityChecker gives each URL. They live here,
+# rather than in availability (which needs Python 3), so the Wayback
+# classifiers can route items by them under Python 2.
+REPLAYABLE = 'replayable'
+FALLBACK = 'fallback'
+MISSING = 'missing'
+
+class WaybackBackend(object):
+    """Look up items by URL in an OpenWayback installation.
+
+    wburl -- the URL of the OpenWayback installation (default:
+        http://localhost:8080/wayback/)
+    timeout -- seconds to wait for warm() (default: 60)
+    debug -- a text output stream for printing debug messages (default:
+        None)
+    """
+    def __init__(self, wburl='http://localhost:8080/wayback/', timeout=60,
+                 debug=None):
+        self.wburl = wburl
+        self.timeout = timeout
+        self._debug = debug if debug else open(os.devnull, 'w')
+
+    def url(self, url):
+        """Return the replay URL of url."""
+        # XXX: Make this configurable (via __init__?)
+#        url = re.sub(r'^https?://', '', url)
+        return self.wburl+url
+
+    def warm(self, url):
+        """Request the replay URL url and discard the response, so that
+        the replay is ready by the time the browser asks for it."""
+        try:
+            from urllib.request import urlopen
+        except ImportError:
+            from urllib2 import urlopen
+        try:
+            fh = urlopen(url, timeout=self.timeout)
+            try:
+                while fh.read(65536):
+                    pass
+            finally:
+                fh.close()
+        except Exception as e:
+            print("Unable to prefetch", url, e, file=self._debug)
+
+class MongoDBBackend(object):
+    """Fetch text by URL from a MongoDB collection, in batches.
+
+    URLs which are expected to be wanted soon are registered with want().
+    When get() has to go to the database it also fetches up to batchsize of
+    the wanted URLs in the same query. The backend is safe to use from
+    several threads.
+
+    A warning is issued on construction if urlfield is not the first field
+    of any index on the collection, as each lookup will then scan the whole
+    collection.
+
+    collection -- a pymongo Collection (or equivalent)
+    urlfield -- the field holding the URL (default: 'url')
+    contentfield -- the field holding the text (default: 'content')
+    batchsize -- the maximum number of URLs per query (default: 50)
+    cachesize -- the maximum number of characters of text to cache
+        (default: 32*1024*1024)
+    """
+    def __init__(self, collection, urlfield='url', contentfield='content',
+                 batchsize=50, cachesize=32*1024*1024):
+        self.collection = collection
+        self.urlfield = urlfield
+        self.contentfield = contentfield
+        self.batchsize = max(1, batchsize)
+        self.cache = LRUCache(cachesize)
+        self._wanted = OrderedDict()
+        self._lock = threading.Lock()
+        self.nqueries = 0
+        self.check_index()
+
+    @classmethod
+    def connect(cls, database, collection, client=None, **kw):
+        """Make a backend for a collection in a MongoDB database. pymongo
+        is imported here, so it is only needed if MongoDB is used.
+
+        database -- the name of the MongoDB database
+        collection -- the name of the collection
+        client -- a pymongo client (default: a new
+            pymongo.mongo_client.MongoClient(), which by default tries to
+            connect to the local machine)
+        Other keyword arguments are as for the constructor."""
+        import pymongo
+        if client is None:
+            client = pymongo.mongo_client.MongoClient()
+        db = pymongo.database.Database(client, database)
+        return cls(pymongo.collection.Collection(db, collection), **kw)
+
+    def check_index(self):
+        """Warn if there is no index which can be used to look up urlfield.
+        Returns True if there is one."""
+        if self.urlfield == '_id':
+            return True
+        try:
+            indexes = self.collection.index_information()
+        except Exception as e:
+            warnings.warn("Unable to check indexes on "+str(self.collection)+
+                          ": "+str(e))
+            return False
+        for info in indexes.values():
+            keys = info.get('key', [])
+            if keys and keys[0][0] == self.urlfield:
+                return True
+        warnings.warn("No index on '"+self.urlfield+"' in "+
+                      str(self.collection)+"; every lookup will scan the "
+                      "collection. Consider "
+                      "collection.create_index('"+self.urlfield+"').")
+        return False
+
+    def want(self, urls):
+        """Note that urls are likely to be asked for soon."""
+        with self._lock:
+            for url in urls:
+                if url not in self.cache:
+                    self._wanted[url] = True
+            # Forget the oldest wishes if nobody is asking
+            while len(self._wanted) > 4*self.batchsize:
+                self._wanted.popitem(last=False)
+
+    def _decode(self, text):
+        if isinstance(text, bytes) and not isinstance(text, str):
+            return text.decode('utf-8', 'replace')
+        return text
+
+    def _fetch(self, urls):
+        """Fetch urls in one query and cache the results. URLs with no
+        document are cached as None. Called with the lock held."""
+        found = {}
+        cursor = self.collection.find(
+            {self.urlfield: {'$in': list(urls)}},
+            {self.urlfield: 1, self.contentfield: 1, '_id': 0})
+        self.nqueries += 1
+        for doc in cursor:
+            url = doc.get(self.urlfield)
+            # As with find_one(), the first matching document wins
+            if url not in found:
+                found[url] = self._decode(doc.get(self.contentfield))
+        # Cache the first URL (the one actually asked for) last, so it is
+        # the most recently used
+        for url in reversed(urls):
+            self._wanted.pop(url, None)
+            self.cache[url] = found.get(url)
+
+    def available(self, urls):
+        """Return the set of urls which have text, in one query. Their text
+        is not fetched."""
+        urls = list(urls)
+        if not urls:
+            return set()
+        cursor = self.collection.find(
+            {self.urlfield: {'$in': urls}, self.contentfield: {'$ne': None}},
+            {self.urlfield: 1, '_id': 0})
+        with self._lock:
+            self.nqueries += 1
+        return set(doc.get(self.urlfield) for doc in cursor)
+
+    def get(self, url):
+        """Return the text for url.
+
+        Raises KeyError if there is no document (or no text) for url."""
+        with self._lock:
+            if url not in self.cache:
+                batch = [url]
+                for wanted in list(self._wanted):
+                    if len(batch) >= self.batchsize:
+                        break
+                    if wanted != url and wanted not in self.cache:
+                        batch.append(wanted)
+                self._fetch(batch)
+            text = self.cache[url]
+        if text is None:
+            raise KeyError("No %s found for %s" % (self.contentfield, url))
+        return text
@@ -0,0 +1,467 @@
+"""Benchmarks for the sampling, loading, resume and output paths.
+
+'python -m handclassifier.bench' generates synthetic corpora shaped like the
+ones the example scripts work on -- a directory of WARC files like the
+Darlington crawl, a large TSV node map like govUK's and a CSV of news
+articles for pairing -- and times:
+
+* warc_sample -- WarcSampler over the WARC directory, in one process and
+  in a pool (needs warctools)
+* tsv_index, tsv_sample -- building the TSVSampler line index, and sampling
+  with it once built
+* pairing -- finding candidate pairs among the articles (needs NumPy)
+* item_loading -- time to the first item of a TSV sample, and the rate at
+  which an ItemQueue hands out items
+* resume -- restarting a session: loading the output written so far and
+  skipping to the first unclassified item
+* write_result -- writing results through a CSVSink and a JournalSink
+* next_item -- latency of ClassificationEngine.next() with no user
+  interface, with a plain and an active learning queue (the latter needs
+  NumPy)
+
+The corpora are kept in the work directory and only regenerated if the
+scale changes. '--scale full' builds corpora of realistic size (several GB
+of WARCs, a 10 million row node map), which takes a while and plenty of
+disk; the default 'small' scale runs in a minute or two.
+
+Results are written as JSON (to --output, or stdout) with the details of
+the run; '--compare OLD.json' prints how each measurement has changed since
+an earlier report.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+from __future__ import print_function, division
+import os
+import sys
+import csv
+import json
+import time
+import zlib
+import random
+import shutil
+import argparse
+import platform
+import subprocess
+from .metrics import percentile
+
+clock = getattr(time, 'perf_counter', time.time)
+
+SCALES = {
+    'small': {'warcfiles': 4, 'warcrecords': 2000, 'bodysize': 2000,
+              'nodes': 200000, 'articles': 2000, 'resumerows': 50000,
+              'writes': 20000, 'syncwrites': 500, 'nexts': 20000,
+              'activenexts': 500},
+    'full': {'warcfiles': 64, 'warcrecords': 20000, 'bodysize': 5000,
+             'nodes': 10000000, 'articles': 50000, 'resumerows': 1000000,
+             'writes': 200000, 'syncwrites': 2000, 'nexts': 200000,
+             'activenexts': 2000},
+}
+
+CORPUS_VERSION = 1
+
+def _words(r, n):
+    return [''.join(r.choice('abcdefghijklmnopqrstuvwxyz')
+                    for _ in range(r.randint(2, 10))) for _ in range(n)]
+
+def _text(r, vocab, nchars):
+    words = []
+    size = 0
+    while size < nchars:
+        w = r.choice(vocab)
+        words.append(w)
+        size += len(w)+1
+    return ' '.join(words)
+
+def _gzip_member(data):
+    c = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return c.compress(data) + c.flush()
+
+def _warc_record(wtype, url, block, n, extra=b''):
+    header = (b'WARC/1.0\r\n'
+              b'WARC-Type: ' + wtype + b'\r\n'
+              b'WARC-Target-URI: ' + url + b'\r\n'
+              b'WARC-Date: 2016-01-01T00:00:00Z\r\n'
+              b'WARC-Record-ID: <urn:uuid:00000000-0000-0000-0000-' +
+              ('%012x' % n).encode('ascii') + b'>\r\n' + extra +
+              b'Content-Length: ' + str(len(block)).encode('ascii') +
+              b'\r\n\r\n')
+    return _gzip_member(header + block + b'\r\n\r\n')
+
+def make_warcs(dirname, nfiles, nrecords, bodysize, seed=1818118181):
+    """Write nfiles WARC files of nrecords request/response pairs each,
+    with bodies of around bodysize bytes, a mix of status codes and MIME
+    types, and one gzip member per record as crawlers write them."""
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    r = random.Random(seed)
+    vocab = _words(r, 5000)
+    # Bodies are drawn from a pool to keep generation fast
+    pool = [_text(r, vocab, r.randint(bodysize//4, bodysize*7//4))
+            .encode('ascii') for _ in range(256)]
+    statuses = [b'200 OK']*90 + [b'404 Not Found']*5 + \
+               [b'301 Moved Permanently']*3 + \
+               [b'500 Internal Server Error']*2
+    mimes = [b'text/html']*8 + [b'application/pdf', b'text/plain']
+    n = 0
+    for f in range(nfiles):
+        fn = os.path.join(dirname, 'bench-%05d.warc.gz' % f)
+        with open(fn, 'wb') as out:
+            for i in range(nrecords):
+                n += 1
+                url = ('http://site%d.example.gov.uk/section/%d/page-%d.html'
+                       % (f, i % 97, i)).encode('ascii')
+                host = url.split(b'/')[2]
+                out.write(_warc_record(
+                    b'request', url,
+                    b'GET ' + url[len(b'http://')+len(host):] +
+                    b' HTTP/1.1\r\nHost: ' + host + b'\r\n\r\n', n,
+                    b'Content-Type: application/http; msgtype=request\r\n'))
+                n += 1
+                body = (b'<html><body><p>' + url + b'</p>' + r.choice(pool)
+                        + b'</body></html>')
+                block = (b'HTTP/1.1 ' + r.choice(statuses) + b'\r\n'
+                         b'Content-Type: ' + r.choice(mimes) + b'\r\n'
+                         b'Content-Length: ' + str(len(body)).encode('ascii')
+                         + b'\r\n\r\n' + body)
+                out.write(_warc_record(
+                    b'response', url, block, n,
+                    b'Content-Type: application/http; msgtype=response\r\n'))
+
+def make_nodemap(fn, nrows, seed=1818118181):
+    """Write a govUK-style TSV node map of nrows URLs."""
+    r = random.Random(seed)
+    with open(fn, 'w') as out:
+        for i in range(nrows):
+            out.write('https://www.gov.uk/dept-%d/guidance/item-%d\t'
+                      'www.gov.uk\t%d\t%d\n' % (i % 400, i, r.randint(1, 8),
+                                                r.randint(0, 500)))
+
+def make_articles(fn, narticles, dupfraction=0.1, seed=1818118181):
+    """Write a CSV of news articles (link, title, date, text), a fraction
+    of which are lightly edited copies of others, as syndicated stories
+    are."""
+    r = random.Random(seed)
+    vocab = _words(r, 20000)
+    texts = []
+    with open(fn, 'w') as out:
+        writer = csv.writer(out)
+        for i in range(narticles):
+            if texts and r.random() < dupfraction:
+                words = r.choice(texts).split()
+                for _ in range(max(1, len(words)//20)):
+                    words[r.randrange(len(words))] = r.choice(vocab)
+                text = ' '.join(words)
+            else:
+                text = _text(r, vocab, r.randint(1500, 5000))
+            texts.append(text)
+            writer.writerow(['http://news.example.com/story/%d' % i,
+                             'Story %d' % i, '2013-04-27T12:00:00Z', text])
+
+def read_articles(fn):
+    with open(fn) as fh:
+        return [(row[0], row[3]) for row in csv.reader(fh)]
+
+def prepare_corpora(workdir, params, debug=sys.stderr):
+    """Generate the corpora in workdir, unless those already there were
+    made with the same parameters. Returns a dict of their paths."""
+    paths = {'warcs': os.path.join(workdir, 'warcs'),
+             'nodemap': os.path.join(workdir, 'nodes.tsv'),
+             'articles': os.path.join(workdir, 'articles.csv')}
+    manifestfn = os.path.join(workdir, 'corpus.json')
+    wanted = dict(params, version=CORPUS_VERSION)
+    try:
+        with open(manifestfn) as fh:
+            if json.load(fh) == wanted:
+                return paths
+    except (IOError, ValueError):
+        pass
+    if os.path.isdir(workdir):
+        shutil.rmtree(workdir)
+    os.makedirs(workdir)
+    print("Generating WARCs", file=debug)
+    make_warcs(paths['warcs'], params['warcfiles'], params['warcrecords'],
+               params['bodysize'])
+    print("Generating node map", file=debug)
+    make_nodemap(paths['nodemap'], params['nodes'])
+    print("Generating articles", file=debug)
+    make_articles(paths['articles'], params['articles'])
+    with open(manifestfn, 'w') as fh:
+        json.dump(wanted, fh)
+    return paths
+
+def _dirsize(dirname):
+    return sum(os.path.getsize(os.path.join(dirname, fn))
+               for fn in os.listdir(dirname))
+
+def _latencies(values):
+    return {'n': len(values), 'mean': sum(values)/len(values) if values
+            else None, 'p50': percentile(values, 50),
+            'p90': percentile(values, 90), 'p99': percentile(values, 99),
+            'max': max(values) if values else None}
+
+def bench_warc_sample(paths, params, scratch):
+    from .warcsampler import WarcSampler
+    results = {}
+    size = _dirsize(paths['warcs'])
+    for name, processes in (('serial', 1), ('pool', None)):
+        sampler = WarcSampler(paths['warcs'], 0.01, processes=processes)
+        t = clock()
+        items = sampler.sample()
+        elapsed = clock() - t
+        records = params['warcfiles'] * params['warcrecords']
+        results[name] = {'seconds': elapsed, 'items': len(items),
+                         'records_per_second': records / elapsed,
+                         'mb_per_second': size / 1e6 / elapsed}
+    results['bytes'] = size
+    return results
+
+def bench_tsv(paths, params, scratch):
+    from .tsvsampler import TSVSampler
+    indexfn = os.path.join(scratch, 'nodes.tsv.idx')
+    if os.path.exists(indexfn):
+        os.unlink(indexfn)
+    t = clock()
+    sampler = TSVSampler(paths['nodemap'], indexfn=indexfn)
+    built = clock() - t
+    sampler.close()
+    t = clock()
+    sampler = TSVSampler(paths['nodemap'], indexfn=indexfn)
+    opened = clock() - t
+    prop = 1000.0 / params['nodes']
+    t = clock()
+    rows = sampler.sample(prop)
+    sampled = clock() - t
+    sampler.close()
+    return {'tsv_index': {'seconds': built,
+                          'lines_per_second': params['nodes'] / built},
+            'tsv_sample': {'open_seconds': opened, 'seconds': sampled,
+                           'items': len(rows)}}
+
+def bench_pairing(paths, params, scratch):
+    from .pairing import candidate_pairs
+    texts = [a[1] for a in read_articles(paths['articles'])]
+    t = clock()
+    pairs = candidate_pairs(texts, threshold=0.5)
+    elapsed = clock() - t
+    return {'seconds': elapsed, 'articles': len(texts), 'pairs': len(pairs),
+            'articles_per_second': len(texts) / elapsed}
+
+def bench_item_loading(paths, params, scratch):
+    from .tsvsampler import TSVSampler
+    from .itemqueue import ItemQueue
+    from .engine import ClassificationEngine
+    # The index is left from bench_tsv if that ran; either way this is
+    # how long an annotator waits for the first item
+    indexfn = os.path.join(scratch, 'nodes.tsv.idx')
+    t = clock()
+    sampler = TSVSampler(paths['nodemap'], indexfn=indexfn)
+    items = [(row[0], None) for row in
+             sampler.sample(1000.0 / params['nodes'])]
+    with open(os.path.join(scratch, 'loading.tsv'), 'w') as out:
+        engine = ClassificationEngine(items, output=out)
+        engine.next()
+        first = clock() - t
+        engine.finish()
+    sampler.close()
+    n = params['nexts']
+    source = (('http://example.com/%d' % i, None) for i in range(n))
+    t = clock()
+    count = sum(1 for _ in ItemQueue(source))
+    drained = clock() - t
+    return {'first_item_seconds': first, 'queue_items': count,
+            'queue_items_per_second': count / drained}
+
+def bench_resume(paths, params, scratch):
+    from .resume import ResumeIndex
+    from .itemqueue import ItemQueue
+    n = params['resumerows']
+    outfn = os.path.join(scratch, 'resume.tsv')
+    with open(outfn, 'w') as out:
+        for i in range(n):
+            out.write('http://example.com/%d\t%d\n' % (i, i % 2))
+    items = [('http://example.com/%d' % i, None) for i in range(n + 1000)]
+    t = clock()
+    resume = ResumeIndex(outfn)
+    loaded = clock() - t
+    queue = ItemQueue(items, resume=resume)
+    queue.advance()
+    skipped = clock() - t
+    return {'rows': n, 'load_seconds': loaded, 'restart_seconds': skipped,
+            'rows_per_second': n / loaded}
+
+def bench_write_result(paths, params, scratch):
+    from .engine import ClassificationEngine
+    from .sinks import CSVSink, JournalSink
+    results = {}
+    item = ('http://example.com/page', None, 200, 'text/html')
+
+    def run(name, sink, n):
+        engine = ClassificationEngine([], labels=['a', 'b'], sink=sink)
+        t = clock()
+        for i in range(n):
+            engine.write_result(item, 'a' if i % 2 else 'b')
+        sink.flush()
+        elapsed = clock() - t
+        sink.close()
+        results[name] = {'rows': n, 'seconds': elapsed,
+                         'rows_per_second': n / elapsed}
+
+    with open(os.path.join(scratch, 'write.tsv'), 'w') as out:
+        run('csv', CSVSink(out), params['writes'])
+    for name, n, syncevery in (('journal_sync1', params['syncwrites'], 1),
+                               ('journal_sync100', params['writes'], 100)):
+        fn = os.path.join(scratch, name + '.journal')
+        if os.path.exists(fn):
+            os.unlink(fn)
+        run(name, JournalSink(fn, syncevery=syncevery), n)
+    return results
+
+def _next_latencies(engine, n):
+    latencies = []
+    labels = engine.labels
+    for i in range(n):
+        t = clock()
+        if engine.next() is None:
+            break
+        latencies.append(clock() - t)
+        engine.classify(labels[i % len(labels)])
+    engine.finish()
+    return _latencies(latencies)
+
+def bench_next_item(paths, params, scratch):
+    from .engine import ClassificationEngine
+    r = random.Random(1818118181)
+    vocab = _words(r, 2000)
+    texts = [_text(r, vocab, 2000) for _ in range(200)]
+    results = {}
+    n = params['nexts']
+    items = (('http://example.com/%d' % i, texts[i % len(texts)])
+             for i in range(n))
+    with open(os.path.join(scratch, 'next.tsv'), 'w') as out:
+        results['plain'] = _next_latencies(
+            ClassificationEngine(items, labels=['a', 'b'], output=out), n)
+    try:
+        from .active import ActiveQueue
+    except ImportError as e:
+        results['active'] = {'skipped': str(e)}
+        return results
+    n = params['activenexts']
+    items = (('http://example.com/%d' % i, texts[i % len(texts)])
+             for i in range(n))
+    with open(os.path.join(scratch, 'next-active.tsv'), 'w') as out:
+        results['active'] = _next_latencies(
+            ClassificationEngine(ActiveQueue(items, dim=2**16),
+                                 labels=['a', 'b'], output=out), n)
+    return results
+
+BENCHMARKS = [
+    ('warc_sample', bench_warc_sample),
+    ('tsv', bench_tsv),
+    ('pairing', bench_pairing),
+    ('item_loading', bench_item_loading),
+    ('resume', bench_resume),
+    ('write_result', bench_write_result),
+    ('next_item', bench_next_item),
+]
+
+def _commit():
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        out = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=here,
+                                      stderr=subprocess.STDOUT)
+        return out.decode('ascii').strip()
+    except Exception:
+        return None
+
+def run(workdir, scale='small', only=None, debug=sys.stderr):
+    """Run the benchmarks (or those named in only) and return the report
+    as a dict."""
+    params = SCALES[scale]
+    paths = prepare_corpora(os.path.join(workdir, 'corpora-' + scale),
+                            params, debug)
+    scratch = os.path.join(workdir, 'scratch')
+    if not os.path.isdir(scratch):
+        os.makedirs(scratch)
+    report = {'version': 1, 'started': time.time(), 'scale': scale,
+              'params': params, 'commit': _commit(),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'cpus': os.cpu_count() if hasattr(os, 'cpu_count') else None,
+              'results': {}}
+    for name, func in BENCHMARKS:
+        if only and name not in only:
+            continue
+        print("Running", name, file=debug)
+        try:
+            report['results'][name] = func(paths, params, scratch)
+        except ImportError as e:
+            report['results'][name] = {'skipped': str(e)}
+        print(json.dumps(report['results'][name], sort_keys=True),
+              file=debug)
+    return report
+
+def _flatten(d, prefix=''):
+    flat = {}
+    for k, v in d.items():
+        if isinstance(v, dict):
+            flat.update(_flatten(v, prefix + k + '.'))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            flat[prefix + k] = v
+    return flat
+
+def compare(old, new, out=sys.stdout):
+    """Print each measurement in two reports and the ratio new/old."""
+    if old.get('scale') != new.get('scale'):
+        print("Warning: comparing scale", old.get('scale'), "with",
+              new.get('scale'), file=out)
+    a = _flatten(old['results'])
+    b = _flatten(new['results'])
+    print("%-45s %12s %12s %8s" % ('measurement', 'old', 'new', 'new/old'),
+          file=out)
+    for key in sorted(set(a) & set(b)):
+        ratio = '%.2f' % (b[key] / a[key]) if a[key] else '-'
+        print("%-45s %12.4g %12.4g %8s" % (key, a[key], b[key], ratio),
+              file=out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark handclassifier's sampling, loading, resume "
+                    "and output paths.")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small',
+                        help="size of the synthetic corpora")
+    parser.add_argument('--workdir', default='bench-data',
+                        help="where to keep corpora and scratch files")
+    parser.add_argument('--only', nargs='+',
+                        choices=[name for name, _ in BENCHMARKS],
+                        help="run just these benchmarks")
+    parser.add_argument('--output', help="write the JSON report here")
+    parser.add_argument('--compare', metavar='OLD',
+                        help="compare with an earlier JSON report")
+    args = parser.parse_args(argv)
+    report = run(args.workdir, args.scale, args.only)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as fh:
+            compare(json.load(fh), report,
+                    out=sys.stderr if not args.output else sys.stdout)
+
+if __name__ == '__main__':
+    main()
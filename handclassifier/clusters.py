@@ -0,0 +1,147 @@
+"""Inferring pair judgments from earlier ones.
+
+When classifying whether pairs of items belong to the same story (or any
+other equivalence), judgments imply one another: if A~B and B~C then A~C,
+and if A~B but B!~C then A!~C. PairClusters keeps the items judged related
+in union-find clusters, records which clusters have been judged unrelated to
+one another, and answers whether a new pair is already decided. With it,
+ManualTextClassifier(pair=True) writes decided pairs straight to the output,
+marked as inferred, instead of asking about them.
+
+A cluster can also be closed, for a judgment such as "Unrelated to all",
+after which it is taken to be unrelated to every item outside it.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+# Values of the flag column written when inference is in use
+JUDGED = 'judged'
+INFERRED = 'inferred'
+
+class PairClusters(object):
+    """Union-find clusters of related items, with unrelated-cluster links.
+
+    related -- labels meaning the pair is related; the first is used for
+        inferred rows (default: ("Related",))
+    unrelated -- labels meaning the pair is unrelated; the first is used for
+        inferred rows (default: ("Unrelated",))
+    unrelatedtoall -- labels meaning the first item of the pair is unrelated
+        to everything outside its cluster (default: ("Unrelated to all",))
+    """
+    def __init__(self, related=('Related',), unrelated=('Unrelated',),
+                 unrelatedtoall=('Unrelated to all',)):
+        self.related = tuple(related)
+        self.unrelated = tuple(unrelated)
+        self.unrelatedtoall = tuple(unrelatedtoall)
+        self._parent = {}
+        self._size = {}
+        # root -> set of roots of clusters judged unrelated to it
+        self._apart = {}
+        self._closed = set()
+
+    def find(self, x):
+        """Return the representative of x's cluster."""
+        parent = self._parent
+        if x not in parent:
+            return x
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        # Path compression
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def _add(self, x):
+        if x not in self._parent:
+            self._parent[x] = x
+            self._size[x] = 1
+
+    def union(self, a, b):
+        """Record that a and b are related."""
+        self._add(a)
+        self._add(b)
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return
+        if self._size[ra] < self._size[rb]:
+            ra, rb = rb, ra
+        self._parent[rb] = ra
+        self._size[ra] += self._size.pop(rb)
+        # Move rb's unrelated links over to ra
+        for other in self._apart.pop(rb, ()):
+            peers = self._apart[other]
+            peers.discard(rb)
+            if other != ra:
+                peers.add(ra)
+                self._apart.setdefault(ra, set()).add(other)
+        if rb in self._closed:
+            self._closed.discard(rb)
+            self._closed.add(ra)
+
+    def separate(self, a, b):
+        """Record that a and b are unrelated."""
+        self._add(a)
+        self._add(b)
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return
+        self._apart.setdefault(ra, set()).add(rb)
+        self._apart.setdefault(rb, set()).add(ra)
+
+    def close(self, a):
+        """Record that a's cluster is unrelated to everything outside it."""
+        self._add(a)
+        self._closed.add(self.find(a))
+
+    def same(self, a, b):
+        return self.find(a) == self.find(b)
+
+    def decided(self, a, b):
+        """Return the label implied for the pair (a, b) by earlier
+        judgments, or None if it is still open."""
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return self.related[0]
+        if (ra in self._closed or rb in self._closed or
+                rb in self._apart.get(ra, ())):
+            return self.unrelated[0]
+        return None
+
+    def record(self, a, b, label):
+        """Record the judgment label for the pair (a, b). Labels which are
+        neither related nor unrelated (such as "? - Unable to determine")
+        are ignored."""
+        if label in self.related:
+            self.union(a, b)
+        elif label in self.unrelated:
+            self.separate(a, b)
+        elif label in self.unrelatedtoall:
+            self.separate(a, b)
+            self.close(a)
+
+    def load_labels(self, labels):
+        """Record earlier judgments from a mapping of (a, b) -> label, such
+        as resume.ResumeIndex(pair=True).labels."""
+        for (a, b), label in labels.items():
+            self.record(a, b, label)
+
+    def clusters(self):
+        """Return a dict of representative -> list of members for every
+        item seen."""
+        result = {}
+        for x in self._parent:
+            result.setdefault(self.find(x), []).append(x)
+        return result
@@ -0,0 +1,313 @@
+"""Sharing one sample between several annotators.
+
+A Coordinator keeps the items to be classified, who is working on what, and
+the results in a single SQLite database. Each annotator's session leases a few
+items at a time; leases run out if a session stops without finishing them, so
+those items go back into the pool. A chosen fraction of the items can be
+assigned to more than one annotator, to measure agreement.
+
+A typical set-up, run once:
+
+    coord = Coordinator('sample.db')
+    coord.add_items(content, overlap=0.1)
+
+and then in each annotator's session:
+
+    coord = Coordinator('sample.db')
+    classifier = ManualTextClassifier(items=coord.items_for('alice'),
+                                      sink=CoordinatorSink(coord, 'alice'),
+                                      ...)
+
+Closing the CoordinatorSink at the end of a session hands back the items it
+had leased but not classified; otherwise they return to the pool when their
+leases expire. A session's leases are renewed each time it fetches a batch and
+each time it submits a result, so they only run out once the annotator has
+been idle for the lease duration. Choose a duration longer than anyone will
+spend over one item, or an item still on screen may be leased to a second
+annotator as well; but the longer it is, the longer items held by an
+abandoned session are kept from everyone else.
+
+SQLite's locking is reliable between processes on one machine, but not on
+most network filesystems; run the sessions on the machine holding the
+database.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+from .sinks import CSVSink
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    key TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    item TEXT NOT NULL,
+    copies INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_seq ON items (seq);
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT NOT NULL,
+    annotator TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (key, annotator)
+);
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT NOT NULL,
+    annotator TEXT NOT NULL,
+    label TEXT,
+    row TEXT NOT NULL,
+    time REAL NOT NULL,
+    PRIMARY KEY (key, annotator)
+);
+"""
+
+def _jsonable(obj):
+    if isinstance(obj, bytes):
+        return obj.decode('utf-8', 'replace')
+    raise TypeError(repr(obj)+" cannot be stored")
+
+def _dumps(obj):
+    return json.dumps(obj, default=_jsonable, separators=(',', ':'))
+
+def _text(s):
+    if isinstance(s, bytes) and not isinstance(s, str):
+        return s.decode('utf-8')
+    return s
+
+class Coordinator(object):
+    """A shared pool of items, leases and results in an SQLite database.
+
+    fn -- the database file, created if it does not exist
+    pair -- items are pairs, identified by their first and third fields
+        (default: False)
+    timeout -- seconds to wait for another session's lock (default: 30)
+    """
+    def __init__(self, fn, pair=False, timeout=30):
+        self.fn = fn
+        self.pair = pair
+        self._db = sqlite3.connect(fn, timeout=timeout,
+                                   isolation_level=None)
+        self._db.executescript(_SCHEMA)
+        # For each annotator, the seq of the first item which might still
+        # be leased to them: every item before it has all the results it
+        # needs, or one from them. Results are never taken away, so this
+        # only moves on, and lease() need not look behind it again.
+        self._next = {}
+
+    def close(self):
+        self._db.close()
+
+    def key(self, item):
+        """The identifier of an item (or pair) as stored."""
+        if self.pair:
+            return _dumps([_text(item[0]), _text(item[2])])
+        return _text(item[0])
+
+    def row_key(self, row):
+        """The identifier of the item an output row is for."""
+        if self.pair:
+            return _dumps([_text(row[0]), _text(row[1])])
+        return _text(row[0])
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock at once, so two sessions
+        # can't lease the same item
+        self._db.execute('BEGIN IMMEDIATE')
+
+    def add_items(self, items, overlap=0.0, copies=2, seed=1818118181):
+        """Add items to the pool, in order. Items already present are left
+        alone.
+
+        items -- an iterable of item tuples
+        overlap -- the fraction of items to give to several annotators
+            (default: 0.0)
+        copies -- how many annotators overlapping items go to (default: 2)
+        seed -- seed for the (deterministic) choice of overlapping items
+
+        Returns the number of items added."""
+        self._transaction()
+        try:
+            seq = self._db.execute(
+                'SELECT COALESCE(MAX(seq), -1) FROM items').fetchone()[0]
+            added = 0
+            for item in items:
+                key = self.key(item)
+                h = hashlib.md5((str(seed)+':'+key).encode('utf-8'))
+                chosen = int(h.hexdigest(), 16) < overlap * (1 << 128)
+                seq += 1
+                cur = self._db.execute(
+                    'INSERT OR IGNORE INTO items (key, seq, item, copies) '
+                    'VALUES (?, ?, ?, ?)',
+                    (key, seq, _dumps(list(item)), copies if chosen else 1))
+                added += cur.rowcount
+            self._db.execute('COMMIT')
+        except:
+            self._db.execute('ROLLBACK')
+            raise
+        return added
+
+    def lease(self, annotator, n=1, duration=1800):
+        """Lease up to n items to annotator for duration seconds, returning
+        them as a list of tuples.
+
+        Items are offered in the order they were added, skipping those the
+        annotator has already done or already holds a lease on, and those
+        which already have as many results and live leases as they need
+        copies."""
+        now = time.time()
+        self._transaction()
+        try:
+            self._db.execute('DELETE FROM leases WHERE expires < ?', (now,))
+            row = self._db.execute(
+                'SELECT i.seq FROM items i WHERE i.seq >= ? '
+                'AND i.copies > '
+                '  (SELECT COUNT(*) FROM results r WHERE r.key = i.key) '
+                'AND NOT EXISTS (SELECT 1 FROM results r '
+                '  WHERE r.key = i.key AND r.annotator = ?) '
+                'ORDER BY i.seq LIMIT 1',
+                (self._next.get(annotator, 0), annotator)).fetchone()
+            if row is not None:
+                start = row[0]
+            else:
+                # Nothing left for annotator now, but there may be more
+                # once items are added
+                start = self._db.execute(
+                    'SELECT COALESCE(MAX(seq), -1) + 1 FROM items'
+                    ).fetchone()[0]
+            self._next[annotator] = start
+            rows = self._db.execute(
+                'SELECT i.key, i.item FROM items i '
+                'WHERE i.seq >= ? AND i.copies > '
+                '  (SELECT COUNT(*) FROM results r WHERE r.key = i.key) + '
+                '  (SELECT COUNT(*) FROM leases l WHERE l.key = i.key) '
+                'AND NOT EXISTS (SELECT 1 FROM results r '
+                '  WHERE r.key = i.key AND r.annotator = ?) '
+                'AND NOT EXISTS (SELECT 1 FROM leases l '
+                '  WHERE l.key = i.key AND l.annotator = ?) '
+                'ORDER BY i.seq LIMIT ?',
+                (start, annotator, annotator, n)).fetchall()
+            self._db.executemany(
+                'INSERT OR REPLACE INTO leases (key, annotator, expires) '
+                'VALUES (?, ?, ?)',
+                [(key, annotator, now+duration) for key, _ in rows])
+            self._db.execute('COMMIT')
+        except:
+            self._db.execute('ROLLBACK')
+            raise
+        return [tuple(json.loads(item)) for _, item in rows]
+
+    def renew(self, annotator, duration=1800):
+        """Extend all of annotator's leases to duration seconds from now."""
+        self._db.execute('UPDATE leases SET expires = ? WHERE annotator = ?',
+                         (time.time()+duration, annotator))
+
+    def release(self, annotator):
+        """Give up all of annotator's leases, for example at the end of a
+        session."""
+        self._db.execute('DELETE FROM leases WHERE annotator = ?',
+                         (annotator,))
+
+    def submit(self, annotator, row, label=None):
+        """Store an output row (as written by ManualTextClassifier) from
+        annotator, and drop the lease on its item."""
+        key = self.row_key(row)
+        if label is None:
+            label = row[2] if self.pair else row[1]
+        self._transaction()
+        try:
+            self._db.execute(
+                'INSERT OR REPLACE INTO results '
+                '(key, annotator, label, row, time) VALUES (?, ?, ?, ?, ?)',
+                (key, annotator, _text(label), _dumps(list(row)),
+                 time.time()))
+            self._db.execute(
+                'DELETE FROM leases WHERE key = ? AND annotator = ?',
+                (key, annotator))
+            self._db.execute('COMMIT')
+        except:
+            self._db.execute('ROLLBACK')
+            raise
+
+    def items_for(self, annotator, batch=5, duration=1800):
+        """Generate items for annotator's session, leasing batch at a time
+        until there are none left. Leases are renewed each time a batch is
+        requested."""
+        while True:
+            self.renew(annotator, duration)
+            items = self.lease(annotator, batch, duration)
+            if not items:
+                return
+            for item in items:
+                yield item
+
+    def results(self):
+        """Generate (annotator, row) for every result, in item order."""
+        for annotator, row in self._db.execute(
+                'SELECT r.annotator, r.row FROM results r '
+                'JOIN items i ON i.key = r.key ORDER BY i.seq, r.annotator'):
+            yield annotator, json.loads(row)
+
+    def export_csv(self, output, csvdialect='excel-tab'):
+        """Write every result row, with the annotator appended, to the text
+        stream output as csv. Returns the number of rows."""
+        sink = CSVSink(output, csvdialect, flush=False)
+        n = 0
+        for annotator, row in self.results():
+            sink.write(row+[annotator])
+            n += 1
+        sink.flush()
+        return n
+
+    def progress(self):
+        """Return a dict with the number of items, of results needed, of
+        results received and of live leases."""
+        now = time.time()
+        q = self._db.execute
+        return {
+            'items': q('SELECT COUNT(*) FROM items').fetchone()[0],
+            'needed': q('SELECT COALESCE(SUM(copies), 0) FROM items'
+                        ).fetchone()[0],
+            'results': q('SELECT COUNT(*) FROM results').fetchone()[0],
+            'leased': q('SELECT COUNT(*) FROM leases WHERE expires >= ?',
+                        (now,)).fetchone()[0]}
+
+class CoordinatorSink(object):
+    """A result sink (see sinks) which submits rows to a Coordinator.
+
+    coordinator -- the Coordinator
+    annotator -- the name of this session's annotator
+    duration -- seconds to renew the session's other leases for with each
+        result, as for Coordinator.items_for (default: 1800)
+    """
+    def __init__(self, coordinator, annotator, duration=1800):
+        self.coordinator = coordinator
+        self.annotator = annotator
+        self.duration = duration
+
+    def write(self, row):
+        self.coordinator.submit(self.annotator, row)
+        # The annotator is still at work, so keep the items waiting for
+        # them
+        self.coordinator.renew(self.annotator, self.duration)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """Release any items leased but not classified."""
+        self.coordinator.release(self.annotator)
@@ -0,0 +1,264 @@
+"""The classification engine, independent of any user interface.
+
+ClassificationEngine does the bookkeeping of a classification session: it
+draws items from the queue (applying any resume index), prepares their
+content (in the background if prefetching), writes results to the sink,
+infers pair judgments, records metrics and calls the callback. A user
+interface only has to show engine.item and pass the annotator's choice to
+classify():
+
+    engine = ClassificationEngine(items, labels=['Yes', 'No'])
+    item = engine.next()
+    while item is not None:
+        ...show item, ask for a label...
+        engine.classify(label)
+        item = engine.next()
+
+The tkinter classifiers in handclassifier.handclassifier and the web
+frontend in handclassifier.webserve are both built on it.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+from __future__ import print_function
+import os
+import sys
+import time
+from .itemqueue import ItemQueue
+from .sinks import CSVSink
+from .clusters import JUDGED, INFERRED
+from .payloads import PROPAGATED
+
+class ClassificationEngine(object):
+    """Run a hand classification session without a user interface.
+
+    items, labels, output, nprevclass, callback, csvdialect, debug, pair,
+    resume, lookahead, prefetch, sink, clusters, metrics, duplicates -- as
+        for handclassifier.ManualTextClassifier
+    prepare -- a function taking an item and returning a dict of whatever
+        is needed to display it, which becomes 'prepared' while the item is
+        current. When prefetching it runs in background threads (default:
+        prepare nothing)
+    upcoming -- a function called with no arguments each time next() moves
+        on, to start work on the queued items (default: None)
+    """
+    def __init__(self, items, labels=[0,1], output=sys.stdout, nprevclass=0,
+                 callback=None, csvdialect='excel-tab', debug=None,
+                 pair=False, resume=None, lookahead=16, prefetch=0,
+                 sink=None, clusters=None, metrics=None, prepare=None,
+                 upcoming=None, duplicates=None):
+        if isinstance(items, ItemQueue):
+            self.queue = items
+            self.queue.lookahead = max(self.queue.lookahead, prefetch)
+            if self.queue.resume is None:
+                self.queue.resume = resume
+        else:
+            self.queue = ItemQueue(items, lookahead=max(lookahead, prefetch),
+                                   resume=resume)
+        self.item = None
+        self.prepared = None
+        self.finished = False
+        self.prefetch = prefetch
+        self._prepare = prepare if prepare is not None else self._no_prepare
+        self._on_upcoming = upcoming
+        if prefetch > 0:
+            # Imported here as multiprocessing is slow to import
+            from .prefetch import Prefetcher
+            self._prefetcher = Prefetcher(self._prepare,
+                                          nthreads=min(prefetch, 8))
+        else:
+            self._prefetcher = None
+        self.idx = -1
+        self.numclassified = {}
+        self.resume = resume
+        if resume is not None and not nprevclass:
+            nprevclass = len(resume)
+        self.nprevclass = nprevclass
+        self._callback = callback
+        self.labels = labels
+        if len(labels) < 2:
+            raise Exception("Classifier needs at least 2 labels")
+        for label in self.labels:
+            self.numclassified[label] = 0
+
+        if debug:
+            self._debug = debug
+        else:
+            self._debug = open(os.devnull, 'w')
+
+        self.pair = pair
+        self.clusters = clusters if pair else None
+        self.numinferred = 0
+        self.duplicates = duplicates if not pair else None
+        if self.duplicates is not None and resume is not None:
+            self.duplicates.retrylabels = resume.retrylabels
+        self.numpropagated = 0
+        self._metrics = metrics
+        self._times = {}
+
+        if sink is None:
+            sink = CSVSink(output, csvdialect)
+        self._sink = sink
+
+    @staticmethod
+    def _no_prepare(item):
+        return {}
+
+    def _advance(self):
+        """Move the queue on to the next item which needs a human judgment,
+        writing out any pairs which can be inferred, and any items whose
+        payload group is labelled, on the way."""
+        while True:
+            if self.duplicates is not None:
+                item = self.duplicates.promoted()
+                if item is not None:
+                    return item
+            item = self.queue.advance()
+            if self.duplicates is not None:
+                label = self.duplicates.label(item)
+                if label is None:
+                    if self.duplicates.hold(item):
+                        # Written when its group's representative is
+                        if self._prefetcher is not None:
+                            self._prefetcher.discard(item)
+                        continue
+                    return item
+                if self._prefetcher is not None:
+                    self._prefetcher.discard(item)
+                self._propagate(item, label)
+                continue
+            if self.clusters is None:
+                return item
+            label = self.clusters.decided(item[0], item[2])
+            if label is None:
+                return item
+            if self._prefetcher is not None:
+                self._prefetcher.discard(item)
+            self.write_result(item, label, inferred=True)
+            if self._metrics is not None:
+                self._metrics.record_inferred(item, label)
+            if self._callback:
+                self._callback(item, label)
+
+    def _propagate(self, item, label):
+        self.write_result(item, label, propagated=True)
+        if self._metrics is not None:
+            self._metrics.record_inferred(item, label, pair=False)
+        if self._callback:
+            self._callback(item, label)
+
+    def next(self):
+        """Move on to the next item to be classified, prepare its content
+        and return it. Returns None, and finishes the session, when there
+        are no more items."""
+        start = time.time()
+        try:
+            self.item = self._advance()
+        except IndexError:
+            self.item = None
+            self.prepared = None
+            self.finish()
+            return None
+        self.idx = self.queue.position
+        if self._prefetcher is not None:
+            self._prefetcher.prefetch(self.queue.peek(self.prefetch))
+        if self._on_upcoming is not None:
+            self._on_upcoming()
+        if self._prefetcher is not None:
+            self.prepared = self._prefetcher.get(self.item)
+        else:
+            self.prepared = self._prepare(self.item)
+        self._times = {'start': start, 'ready': time.time()}
+        return self.item
+
+    def shown(self):
+        """Note that the current item is now in front of the annotator."""
+        self._times.setdefault('shown', time.time())
+
+    def classify(self, label):
+        """Record label as the hand classification of the current item. Call
+        next() to move on."""
+        if self.item is None:
+            raise IndexError("No current item to classify")
+        item = self.item
+        self._times['decided'] = time.time()
+        self.write_result(item, label)
+        if self._metrics is not None:
+            self._times['written'] = time.time()
+            self._metrics.record(item, label, self._times, pair=self.pair)
+        self.queue.learn(item, label)
+        if self._callback:
+            self._callback(item, label)
+
+    def write_result(self, item, result, inferred=False, propagated=False):
+        """Write a hand classification to the output sink (by default as a
+        CSV line in the output file).
+
+        The written line is of the form:
+            item[0],result,[item[2][item[3][...]]] (though in the CSV format
+                specified in the class constructor).
+
+        item -- one element of the items passed to the class constructor.
+            This will be a 2+-tuple containing an identifier (such as a
+            URL) for the output, the content itself, and any number of optional
+            additional fields to be stored in the output csv. This could
+            usefully include, for example, Content-Type if it is wanted to
+            preserve this in the output to help train a classifier.
+        result -- a textual category
+        inferred -- the result was inferred from earlier pair judgments
+            rather than made by hand (default: False)
+        propagated -- the result was given to another item with the same
+            payload (default: False)
+
+        With duplicates, a hand classification is also written for the
+        members of the item's payload group which were held back for it,
+        marked as propagated.
+        """
+        if self.pair:
+            output = [item[0], item[2], result]+list(item[4:])
+        else:
+            output = [item[0], result]+list(item[2:])
+
+        if self.clusters is not None:
+            output.append(INFERRED if inferred else JUDGED)
+            if not inferred:
+                self.clusters.record(item[0], item[2], result)
+        if self.duplicates is not None:
+            output.append(PROPAGATED if propagated else JUDGED)
+        if inferred:
+            self.numinferred += 1
+        elif propagated:
+            self.numpropagated += 1
+        else:
+            self.numclassified[result] = self.numclassified.get(result, 0) + 1
+        if self.resume is not None:
+            self.resume.record(item, result)
+        self._sink.write(output)
+
+        if self.duplicates is not None and not propagated:
+            for member in self.duplicates.record(item, result):
+                self._propagate(member, result)
+
+    def finish(self):
+        """Flush the results and stop any background work."""
+        if self.finished:
+            return
+        self.finished = True
+        nclassified = sum(self.numclassified.values())
+        print("Finished! Classified %d this session, %d in all" %
+              (nclassified, self.nprevclass + nclassified), file=self._debug)
+        self._sink.flush()
+        if self._prefetcher is not None:
+            self._prefetcher.shutdown()
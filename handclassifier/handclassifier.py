@@ -7,6 +7,8 @@ window:
 
 * ManualTextClassifier presents text in a tkinter window
 * ManualBrowserClassifierSingle uses the system web browser to render content
+* ManualWarcClassifierSingle reads each item's record from its WARC file and
+  renders it with the system web browser
 * ManualWaybackClassifierSingle looks up the wanted document by URL in an
   OpenWayback installation (http://www.netpreserve.org/openwayback) using the
   system web browser
@@ -17,6 +19,9 @@ window:
   classifier, but adds a fallback "Load from MongoDB" button to pull the text
   from a MongoDB instance
 
+The classifiers are user interfaces onto engine.ClassificationEngine, which
+can also be driven without tkinter (see webserve for a web frontend).
+
 This code is largely by Tom Nicholls, based upon earlier work by Jonathan
 Bright.
 
@@ -43,32 +48,30 @@ except ImportError:
     import Tkinter as tkinter
 import sys
 import os
-import csv
-import string
-# These needed for the browser version
-import webbrowser
-import tempfile
-import string
-import atexit
-import os
-import re
 try:
-    from urllib.parse import unquote
+    from html import escape as _escape
 except ImportError:
-    from urllib import unquote
-# This for the MongoDB version
-import pymongo
+    from cgi import escape as _escape
+from .engine import ClassificationEngine
+# Content backends, including the MongoDB one, import what they need (such
+# as pymongo) only when they are used
+from .backends import (get_backend, backend_factory, REPLAYABLE,
+                       FALLBACK, MISSING)
 
 class ManualTextClassifier(object):
     """Hand classify a set of text items using tkinter.
 
-    items -- a list of 2+-tuples containing an identifier (such as a
-        URL) for the output, the content itself, and any number of optional
-        additional fields to be stored in the output csv. This could 
-        usefully include, for example, Content-Type if it is wanted to
-        preserve this in the output to help train a classifier. 
+    items -- a list, generator or other iterable of 2+-tuples containing an
+        identifier (such as a URL) for the output, the content itself, and
+        any number of optional additional fields to be stored in the output
+        csv. This could usefully include, for example, Content-Type if it is
+        wanted to preserve this in the output to help train a classifier.
+        Items are drawn from the iterable only as they are needed. An
+        itemqueue.ItemQueue (such as an active.ActiveQueue) is used as it is,
+        and is told each label through its learn() method.
     labels -- a list of classification options to select from (default: [0,1])
-    output -- a binary output stream (default: stdout)
+    output -- a binary output stream (default: stdout). Ignored if a sink is
+        given.
     winx -- the desired width of the classification window in pixels (default:
         1280). Currently not used. 
     winy -- the desired height of the classification window in pixels (default:
@@ -78,37 +81,69 @@ class ManualTextClassifier(object):
     callback -- a function to be called (with parameters identifier,
         classification) once a determination is made (default: None).
     csvdialect -- a csv.writer dialect to use when writing results (default:
-        excel-tab).
+        excel-tab). Ignored if a sink is given.
     debug -- a text output stream for printing debug messages (default: None)
     pair -- classify the relationship between a pair of items; the second title
         and text should be passed as the third and fourth elements of
         the 'items' tuple (default: False)
+    resume -- a resume.ResumeIndex of earlier classifications. Items it
+        records as done are skipped; items it records with a retry label
+        are presented again after all other items (default: None)
+    lookahead -- the maximum number of upcoming items to hold in memory
+        (default: 16)
+    prefetch -- the number of upcoming items whose content is prepared in
+        background threads while the current item is being classified. 0
+        prepares each item's content only when it is shown (default: 0)
+    sink -- where to write results, such as a sinks.JournalSink (default:
+        a sinks.CSVSink writing to output in csvdialect)
+    clusters -- with pair=True, a clusters.PairClusters used to infer pair
+        judgments from earlier ones. Pairs it has already decided are not
+        shown, but written with the implied label. Every output row then
+        has a final field, 'judged' or 'inferred' (default: None)
+    chunksize -- the number of characters of text inserted into the content
+        window at once. The first chunk is shown immediately and the rest
+        are added from the Tk event loop, so long documents don't freeze
+        the window (default: 10000)
+    maxchars -- if set, show at most this many characters of each text,
+        with a "Load the rest" button for the remainder (default: None)
+    metrics -- a metrics.MetricsRecorder to record when each item was
+        started, ready, shown, decided and written (default: None)
+    duplicates -- a payloads.PayloadGroups grouping items with the same
+        payload. Only the first item of each group is shown; its label is
+        written for the rest too, and every output row then has a final
+        field, 'judged' or 'propagated' (default: None)
+
+    The session itself (queue, results, resume, metrics...) is run by an
+    engine.ClassificationEngine, available as 'engine'; this class displays
+    its items and passes on the annotator's choices.
 
     This class is also used as the base class for other classifiers in this
     module."""
     def __init__(self, items, labels=[0,1], output=sys.stdout,
                  winx=1280, winy=880, nprevclass=0, callback=None,
-                 csvdialect='excel-tab', debug=None, pair=False):
-        self.items = items
-        self.idx = -1
-        self.numclassified = {}
-        self.nprevclass = nprevclass
-        self._callback = callback
+                 csvdialect='excel-tab', debug=None, pair=False,
+                 resume=None, lookahead=16, prefetch=0, sink=None,
+                 clusters=None, chunksize=10000, maxchars=None,
+                 metrics=None, duplicates=None):
         self.labels = labels
-        if len(labels) < 2:
-            raise Exception("Classifier needs at least 2 labels")
-        for label in self.labels:
-            self.numclassified[label] = 0
-
-        if debug:
-            self._debug = debug
-        else:
-            self._debug = open(os.devnull, 'w')
-
         self.pair = pair
-
-        self._output = output
-        self._csvwriter = csv.writer(self._output, dialect=csvdialect)
+        self.prefetch = prefetch
+        self.textbackend = get_backend('text')
+        self.engine = ClassificationEngine(
+            items, labels=labels, output=output, nprevclass=nprevclass,
+            callback=callback, csvdialect=csvdialect, debug=debug, pair=pair,
+            resume=resume, lookahead=lookahead, prefetch=prefetch, sink=sink,
+            clusters=clusters, metrics=metrics, duplicates=duplicates,
+            prepare=self._prepare_content, upcoming=self._upcoming)
+        self._debug = self.engine._debug
+
+        self.chunksize = max(1, chunksize)
+        self.maxchars = maxchars
+        # widget -> pending 'after' job, and widget -> text cut off at
+        # maxchars
+        self._render_jobs = {}
+        self._truncated = {}
+        self._more_button = None
 
         self.root = tkinter.Tk()
         self.buttons = []
@@ -200,6 +235,7 @@ class ManualTextClassifier(object):
 
     def clear_content(self):
         """Clear the content window."""
+        self._cancel_rendering()
         self.content.delete(1.0, tkinter.END)
         if self.pair:
             self.content_2.delete(1.0, tkinter.END)
@@ -210,58 +246,124 @@ class ManualTextClassifier(object):
 
     def _set_text_content(self):
         self.clear_content()
-        self.content.insert(tkinter.INSERT, self.items[self.idx][1])
+        self._render_text(self.content, self.textbackend.get(self.item))
         if self.pair:
-            self.content_2.insert(tkinter.INSERT, self.items[self.idx][3])
+            self._render_text(self.content_2,
+                              self.textbackend.get(self.item, second=True))
+
+    def _render_text(self, widget, text):
+        """Fill a Text widget with text, a chunk at a time, stopping at
+        maxchars if set."""
+        end = len(text)
+        if self.maxchars is not None and end > self.maxchars:
+            end = self.maxchars
+            self._truncated[widget] = text
+        self._insert_chunk(widget, text, 0, end)
+
+    def _insert_chunk(self, widget, text, start, end):
+        stop = min(start+self.chunksize, end)
+        widget.insert(tkinter.END, text[start:stop])
+        if stop < end:
+            self._render_jobs[widget] = self.root.after(
+                1, self._insert_chunk, widget, text, stop, end)
+        else:
+            self._render_jobs.pop(widget, None)
+            # Only offer the rest once every pane has stopped, so loading
+            # it can't start a second chain on a widget still being filled
+            if self._truncated and not self._render_jobs:
+                self._show_more_button()
+
+    def _cancel_rendering(self):
+        for job in self._render_jobs.values():
+            self.root.after_cancel(job)
+        self._render_jobs = {}
+        self._truncated = {}
+        if self._more_button is not None:
+            self._more_button.grid_remove()
+
+    def _show_more_button(self):
+        if self._more_button is None:
+            self._more_button = tkinter.Button(self.root,
+                                               text="Load the rest",
+                                               command=self._load_rest)
+        self._more_button.grid(column=1+int(self.pair),
+                               row=1+len(self.labels), sticky="SW", padx=10)
+
+    def _load_rest(self):
+        """Render the remainder of texts cut off at maxchars."""
+        self._more_button.grid_remove()
+        truncated, self._truncated = self._truncated, {}
+        for widget, text in truncated.items():
+            self._insert_chunk(widget, text, self.maxchars, len(text))
+
+    # The state of the session is kept by the engine
+    @property
+    def queue(self):
+        return self.engine.queue
+
+    @property
+    def item(self):
+        return self.engine.item
+
+    @property
+    def prepared(self):
+        return self.engine.prepared
+
+    @property
+    def idx(self):
+        return self.engine.idx
+
+    @property
+    def numclassified(self):
+        return self.engine.numclassified
+
+    @property
+    def numinferred(self):
+        return self.engine.numinferred
+
+    @property
+    def nprevclass(self):
+        return self.engine.nprevclass
+
+    @property
+    def resume(self):
+        return self.engine.resume
+
+    @property
+    def clusters(self):
+        return self.engine.clusters
+
+    def _prepare_content(self, item):
+        """Fetch or compute whatever is needed to display item, returning
+        a dict which becomes self.prepared while item is shown.
+
+        When prefetching this runs in a background thread, so it must not
+        touch tkinter. Nothing needs preparing for plain text."""
+        return {}
+
+    def _upcoming(self):
+        """Called each time a new item is shown, after prefetching of the
+        items queued after it has started, to start any other work on
+        them."""
+        pass
 
     def update_content(self):
         """Update the content window with the next item to be classified."""
-        self.idx += 1
-        try:
-            if self.pair:
-                self.set_title(self.items[self.idx][0], self.items[self.idx][2])
-            else:
-                self.set_title(self.items[self.idx][0])
-            self.set_content()
-        except IndexError:
-            print("Finished!", file=self._debug)
+        if self.engine.next() is None:
             self.root.destroy()
             self.root.quit()
-
-    def write_result(self, item, result):
-        """Write a hand classification to the output file as a CSV line.
-
-        The written line is of the form:
-            item[0],result,[item[2][item[3][...]]] (though in the CSV format
-                specified in the class constructor).
-
-        item -- one element of the items list passed to the class constructor.
-            This will be a 2+-tuple containing an identifier (such as a
-            URL) for the output, the content itself, and any number of optional
-            additional fields to be stored in the output csv. This could 
-            usefully include, for example, Content-Type if it is wanted to
-            preserve this in the output to help train a classifier. 
-        result -- a textual category
-        """
+            return
         if self.pair:
-            output = [item[0], item[2], result]+list(item[4:])
-        else:
-            output = [item[0], result]+list(item[2:])
-
-        if self.nprevclass > 0:
-            print(self.idx+1, '/', self.idx+self.nprevclass+1,
-                    output, file=self._debug)
+            self.set_title(self.item[0], self.item[2])
         else:
-            print(self.idx+1,
-                    output, file=self._debug)
+            self.set_title(self.item[0])
+        self.set_content()
+        self.engine.shown()
 
-        # Unfortunately, Python 2 and Python 3 have quite incompatible csv
-        # modules: 3 expects unicode, 2 can't really handle unicode at all :-/
-        if not sys.version_info > (3,):
-            output = [s.encode('utf-8') for s in output]
-        self._csvwriter.writerow(output)
-        # Paranoia
-        self._output.flush()
+    def write_result(self, item, result, inferred=False):
+        """Write a hand classification to the output sink; see
+        engine.ClassificationEngine.write_result()."""
+        self.engine.write_result(item, result, inferred=inferred)
 
     def _on_button_click(self, result):
         """Handle a click on one of the result buttons.
@@ -272,10 +374,7 @@ class ManualTextClassifier(object):
 
         result -- the category to apply to the current item
         """ 
-        itemlabel = self.items[self.idx]
-        self.write_result(itemlabel, result)
-        if self._callback:
-            self._callback(itemlabel, result)
+        self.engine.classify(result)
         self.update_content()
 
 class ManualTextClassifierSingle(ManualTextClassifier):
@@ -293,10 +392,19 @@ class ManualBrowserClassifierSingle(ManualTextClassifier):
     python's webbrowser interface, and has a null implementation of
     set_title() for similar reasons.
 
-    It does not (yet) handle the case where pair=True."""
+    It does not (yet) handle the case where pair=True.
+
+    serve -- keyword only; if True, serve pages to the browser from memory
+        through a loopback httpserve.ContentServer instead of writing them
+        to temporary files (default: False)
+    servecache -- keyword only; the maximum number of bytes of pages the
+        server holds (default: 64*1024*1024)
+    """
     def __init__(self, *args, **kw):
-        self._tempfns = []
-        atexit.register(self._close_tempfiles)
+        self.pages = get_backend('browser', serve=kw.pop('serve', False),
+                                 cachesize=kw.pop('servecache',
+                                                  64*1024*1024),
+                                 debug=kw.get('debug'))
         super(ManualBrowserClassifierSingle, self).__init__(*args, **kw)
         if self.pair:
             print("Pair classification not yet implemented in-browser")
@@ -313,6 +421,7 @@ class ManualBrowserClassifierSingle(ManualTextClassifier):
         self.root.attributes("-topmost", True)
 
     def _setup_content(self):
+        import webbrowser
         self.content = webbrowser.get()
 
     def set_title(self, t):
@@ -328,33 +437,64 @@ class ManualBrowserClassifierSingle(ManualTextClassifier):
         """(Indirectly) load the web browser with the next item."""
         self._set_browser_content()
 
+    def _prepare_content(self, item):
+        return {'browserurl': self._store_page(item[0],
+                                               self.textbackend.get(item))}
+
     def _set_browser_content(self, origurl = None, page_content=None):
-        if not origurl:
-            origurl=self.items[self.idx][0]
-        if not page_content:
-            page_content= self.items[self.idx][1]
-        # Mangle URL into filename, so it shows up in the titlebar.
-        # Take the first 100 characters, to avoid hitting OS limits.
-        # Try Py3, fall back to Py2
-        f = b'/#* '
-        t = b'____'
-        if sys.version_info >= (3,):
-            trantab = bytes.maketrans(f,t)
+        if not origurl and not page_content:
+            url = self.prepared['browserurl']
         else:
-            trantab = string.maketrans(f,t)
-        suf= '__'+unquote(origurl).translate(trantab)[:100]+'.html'
-        with tempfile.NamedTemporaryFile(suffix=suf, delete=False) as fh:
-            self._tempfns.append(fh.name)
-            fh.write(page_content.encode('utf-8'))
-            url = 'file://'+fh.name
-            self.content.open(url, new=0, autoraise=False)
-
-    def _close_tempfiles(self):
-        for fn in self._tempfns:
-            try:
-                os.unlink(fn)
-            except OSError:
-                print("File", fn, "already deleted.", file=self._debug)
+            if not origurl:
+                origurl=self.item[0]
+            if not page_content:
+                page_content= self.textbackend.get(self.item)
+            url = self._store_page(origurl, page_content)
+        self.content.open(url, new=0, autoraise=False)
+
+    def _store_page(self, origurl, page_content, ctype=None):
+        """Make page_content available to the browser, returning the URL to
+        open. Bytes page_content is sent as it is, as MIME type ctype."""
+        return self.pages.store(origurl, page_content, ctype)
+
+class ManualWarcClassifierSingle(ManualBrowserClassifierSingle):
+    """Hand classify a set of web items read straight from WARC files, using
+    tkinter and the system web browser.
+
+    This is a subclass of ManualBrowserClassifierSingle. The content part
+    of each item is a warcbackend.WarcLocation, as given by a WarcSampler
+    made with locations=True, and each record is read from its WARC file
+    only when it is about to be shown (or prefetched). The body is shown
+    as it was archived, with its own MIME type, so no Wayback installation
+    is needed; pages' links and embedded resources are not rewritten.
+
+    warcdir -- keyword only; the directory holding the WARC files, if they
+        have moved since sampling (default: None, to use the paths in the
+        locations)
+    """
+    def __init__(self, *args, **kw):
+        self.warc = get_backend('warc', kw.pop('warcdir', None))
+        super(ManualWarcClassifierSingle, self).__init__(*args, **kw)
+
+    def _prepare_content(self, item):
+        try:
+            code, mime, body = self.warc.get(item[1])
+        except Exception as e:
+            print("Unable to read", item[0], "from", item[1], e,
+                  file=self._debug)
+            return {'browserurl': self._store_page(
+                item[0], self._unreadable_page(item, e))}
+        return {'browserurl': self._store_page(item[0], body,
+                                               mime or 'text/html')}
+
+    def _unreadable_page(self, item, e):
+        url = item[0]
+        if isinstance(url, bytes) and not isinstance(url, str):
+            url = url.decode('utf-8', 'replace')
+        return (u'<html><head><meta http-equiv="Content-Type" '
+                u'content="text/html;charset=UTF-8"></head><body>'
+                u'<p>Unable to read '+_escape(url)+u' from its WARC file: '+
+                _escape(str(e))+u'</p></body></html>')
 
 class LinkClassifierMixin(object):
     """Mixin to hand classify a set of web links. Provides an additional window
@@ -363,7 +503,7 @@ class LinkClassifierMixin(object):
     The destination of the link to be classified is passed as the third
     element of each tuple in 'items'.
 
-    items -- a list of 3+-tuples containing an identifier (such as a
+    items -- an iterable of 3+-tuples containing an identifier (such as a
         URL) for the output, the content itself, the target of the link to be
         classified and any number of optional additional fields to be stored 
         in the output csv. This could usefully include, for example,
@@ -371,13 +511,11 @@ class LinkClassifierMixin(object):
         train a classifier. 
     """
     def __init__(self, items, *args, **kw):
-        try:
-            _ = items[0][2]
-        except IndexError:
-            raise IndexError("When using LinkClassifierMixin the items tuples "
-                             "must be of length 3+")
         # Set up the root environment and other stuff first
         super(LinkClassifierMixin, self).__init__(*args, items=items, **kw)
+        if self.item is not None and len(self.item) < 3:
+            raise IndexError("When using LinkClassifierMixin the items tuples "
+                             "must be of length 3+")
         # And then add a little link window
         self.linkwindow = tkinter.Toplevel(self.root)
         self._setup_link_window()
@@ -407,8 +545,8 @@ class LinkClassifierMixin(object):
         self.clear_content()
         try:
             self.link_content.insert(tkinter.INSERT,
-                                     (self.items[self.idx][0]+'\n'+
-                                      self.items[self.idx][2]))
+                                     (self.item[0]+'\n'+
+                                      self.item[2]))
         except AttributeError:
             # Not set up yet
             pass
@@ -425,27 +563,82 @@ class ManualWaybackClassifierSingle(ManualBrowserClassifierSingle):
 
     This is a subclass of ManualBrowserClassifierSingle. It overrides
     set_content() to retrieve the HTMl content from OpenWayback rather than
-    the items list passed to the constructor. As a result, the content
+    the items passed to the constructor. As a result, the content
     part of the items tuple is irrelevant and can be None to save
     memory if desired.
 
     wburl -- the URL of the OpenWayback installation to be used (default:
         http://localhost:8080/wayback/
+    availability -- keyword only; an availability.AvailabilityChecker, or a
+        dict of the tags it gives, used to send items without a capture to
+        a "not available" page rather than the replay (default: None)
+
+    When prefetching, upcoming pages are requested from OpenWayback in the
+    background so that the browser finds the replay server's caches warm.
+    A checker is given the upcoming URLs to check in the background.
     """
     def __init__(self, wburl='http://localhost:8080/wayback/', *args, **kw):
         self.wburl = wburl
+        self.wayback = get_backend('wayback', wburl, debug=kw.get('debug'))
+        self.availability = kw.pop('availability', None)
         super(ManualWaybackClassifierSingle, self).__init__(*args, **kw)
 
     def set_content(self):
         """(Indirectly) load the web browser with the next item."""
         self._set_wayback_content()
 
+    def _availability_status(self, url):
+        """The availability tag of url, or None if unknown."""
+        if self.availability is None:
+            return None
+        if isinstance(self.availability, dict):
+            return self.availability.get(url)
+        try:
+            return self.availability.status(url)
+        except Exception as e:
+            print("Unable to check availability of", url, e,
+                  file=self._debug)
+            return None
+
+    def _upcoming(self):
+        super(ManualWaybackClassifierSingle, self)._upcoming()
+        if hasattr(self.availability, 'submit'):
+            self.availability.submit(item[0] for item in self.queue.peek())
+
+    def _prepare_content(self, item):
+        status = self._availability_status(item[0])
+        prepared = {'status': status}
+        if status == MISSING:
+            prepared['missingurl'] = self._store_page(
+                item[0], self._missing_page(item[0]))
+        url = self.wayback.url(item[0])
+        if self.prefetch and status in (None, REPLAYABLE):
+            self.wayback.warm(url)
+        prepared['waybackurl'] = url
+        return prepared
+
+    def _missing_page(self, url):
+        return (u'<html><head><meta http-equiv="Content-Type" '
+                u'content="text/html;charset=UTF-8"></head><body>'
+                u'<p>No capture of '+_escape(url)+u' is available.</p>'
+                u'</body></html>')
+
     def _set_wayback_content(self):
-        # XXX: Make this configurable (via __init__?)
-        url = self.items[self.idx][0]
-#        url = re.sub(r'^https?://', '', url)
-        url = self.wburl+url
-        self.content.open(url, new=0, autoraise=False)
+        status = self.prepared.get('status')
+        if status == FALLBACK:
+            self._set_fallback_content()
+        elif status == MISSING:
+            self.content.open(self.prepared['missingurl'], new=0,
+                              autoraise=False)
+        else:
+            self.content.open(self.prepared['waybackurl'], new=0,
+                              autoraise=False)
+
+    def _set_fallback_content(self):
+        """Show an item with no capture but fallback content. Without a
+        fallback, the replay is shown as usual."""
+        self.content.open(self.prepared['waybackurl'], new=0,
+                          autoraise=False)
 
 class ManualWaybackPlusMongoDBClassifierSingle(ManualWaybackClassifierSingle):
     """Hand classify a set of web items using an OpenWayback installation,
@@ -462,17 +655,39 @@ class ManualWaybackPlusMongoDBClassifierSingle(ManualWaybackClassifierSingle):
 
     mongodb -- the name of the MongoDB database
     collection -- the name of the MongoDB collection
-    client -- a pymongo client (default: pymongo.mongo_client.MongoClient()
-        which by default tries to connect to the local machine)
+    client -- a pymongo client (default: a new
+        pymongo.mongo_client.MongoClient(), which by default tries to
+        connect to the local machine)
+    batchsize -- keyword only; the number of upcoming URLs to look up in
+        each MongoDB query (default: 50)
+    cachesize -- keyword only; the maximum number of characters of fallback
+        text to cache (default: 32*1024*1024)
+
+    Lookups go through a backends.MongoDBBackend, which warns if urlfield
+    is not indexed. When prefetching, the fallback text is also fetched
+    from MongoDB in the background.
+
+    Given an availability checker with no fallback of its own, the checker
+    also looks for each URL in MongoDB, and items with no capture but with
+    MongoDB text are shown from MongoDB straight away.
     """
     def __init__(self, mongodb, collection, urlfield='url',
         contentfield='content',
-        client=pymongo.mongo_client.MongoClient(), *args, **kw):
-        self.mongoclient = client
-        self.db = pymongo.database.Database(self.mongoclient, mongodb)
-        self.collection = pymongo.collection.Collection(self.db, collection)
+        client=None, *args, **kw):
         self.urlfield = urlfield
         self.contentfield = contentfield
+        self.mongobackend = backend_factory('mongodb').connect(
+            mongodb, collection, client, urlfield=urlfield,
+            contentfield=contentfield, batchsize=kw.pop('batchsize', 50),
+            cachesize=kw.pop('cachesize', 32*1024*1024))
+        self.collection = self.mongobackend.collection
+        self.db = self.collection.database
+        self.mongoclient = self.db.client
+        kw['lookahead'] = max(kw.get('lookahead', 16),
+                              self.mongobackend.batchsize)
+        checker = kw.get('availability')
+        if getattr(checker, 'fallback', False) is None:
+            checker.fallback = self.mongobackend.available
 
         super(ManualWaybackPlusMongoDBClassifierSingle, self).__init__(*args,
                                                                        **kw)
@@ -482,21 +697,50 @@ class ManualWaybackPlusMongoDBClassifierSingle(ManualWaybackClassifierSingle):
         self.fallbackbutton.grid(column=1, row=len(self.buttons)+1,
                                  sticky="SW", padx=10)
     
+    def _prepare_content(self, item):
+        prepared = (super(ManualWaybackPlusMongoDBClassifierSingle, self).
+                    _prepare_content(item))
+        if self.prefetch:
+            try:
+                prepared['mongotext'] = self._fetch_mongo_text(item[0])
+            except Exception as e:
+                # Reported if and when the fallback button is pressed
+                prepared['mongotext'] = e
+        return prepared
+
+    def _upcoming(self):
+        (super(ManualWaybackPlusMongoDBClassifierSingle, self).
+            _upcoming())
+        self.mongobackend.want(item[0] for item in
+                               self.queue.peek(self.mongobackend.batchsize))
+
+    def _set_fallback_content(self):
+        self._set_mongo_content()
+
+    def _fetch_mongo_text(self, url):
+        return self.mongobackend.get(url)
+
     def _set_mongo_content(self):
         """Get fallback content from MongoDB and load it into the web browser.
 
         Runs on callback from the 'Load from MongoDB' button. Uses the
         configured pymongo client, database and collection to get text with
-        a key matching the object we're currently classifying. 
+        a key matching the object we're currently classifying, looking up
+        the following items' text at the same time.
         """
-        url = self.items[self.idx][0]
+        url = self.item[0]
         try:
+            if 'mongotext' in self.prepared:
+                text = self.prepared['mongotext']
+            else:
+                text = self._fetch_mongo_text(url)
+            if isinstance(text, Exception):
+                raise text
             # This is a bit horrid.
             page_content = ((u'<html><head><meta http-equiv="Content-Type" '
                              u'content="text/html;charset=UTF-8"><head>'
                              u'<body><pre>')+
-                             self.collection.find_one(
-                                 {self.urlfield: url})[self.contentfield]+
+                             text+
                              u'</pre></body></html>')
         except Exception as e:
             page_content = ("Unable to fetch text from MongoDB for "+url+
@@ -0,0 +1,90 @@
+"""Order-independent sampling by hashing item identifiers.
+
+Drawing from a random number generator for each record makes the selection
+depend on the order in which the records are read: split a crawl's files
+differently, or sample some of them on another machine, and a different
+sample comes out. A HashSelector instead selects an identifier (such as a
+URL) if a seeded hash of it falls below proptoclassify, so whether an item
+is selected depends only on the seed, the proportion and the identifier
+itself. Shards of a crawl sampled on different machines therefore select
+exactly the items a single run over the whole crawl would, and
+merge_samples() puts the shards' samples together in the same order as it
+would put the single run's:
+
+    samples = [WarcSampler(shard, 0.002, selection='hash').sample()
+               for shard in ('node1-warcs', 'node2-warcs')]
+    items = merge_samples(samples)
+
+WarcSampler and TSVSampler both take selection='hash'.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+import struct
+import hashlib
+
+_VALUE = struct.Struct('>Q')
+
+def _bytes(identifier):
+    if isinstance(identifier, bytes):
+        return identifier
+    return identifier.encode('utf-8')
+
+class HashSelector(object):
+    """Select identifiers by a seeded hash, each with probability
+    proptoclassify.
+
+    Text identifiers are hashed as UTF-8, so a URL is selected (or not)
+    whether it is read as bytes from a WARC file or as text from a TSV.
+
+    proptoclassify -- the proportion of identifiers to select
+    seed -- the seed (default: 1818118181)
+    """
+    def __init__(self, proptoclassify, seed=1818118181):
+        self.proptoclassify = proptoclassify
+        self.seed = seed
+        self._base = hashlib.md5(str(seed).encode('utf-8') + b':')
+        # Select if the hash, as a 64 bit integer, is below this
+        self._threshold = int(max(0.0, min(1.0, proptoclassify)) * 2**64)
+
+    def value(self, identifier):
+        """The seeded hash of identifier, as an integer in [0, 2**64)."""
+        h = self._base.copy()
+        h.update(_bytes(identifier))
+        return _VALUE.unpack(h.digest()[:8])[0]
+
+    def __call__(self, identifier):
+        """True if identifier is selected."""
+        return self.value(identifier) < self._threshold
+
+def merge_samples(samples, seed=1818118181):
+    """Return the items of several samples (lists of item tuples) as one
+    list in an order which depends only on the items and the seed.
+
+    Merging the samples of the shards of a crawl gives the same list as
+    merging the sample of a single run over the whole crawl, however the
+    crawl was split. The order is by the seeded hash of each identifier, so
+    it is also a random order for classification.
+
+    samples -- an iterable of iterables of items
+    seed -- the seed for the ordering (default: 1818118181)
+    """
+    selector = HashSelector(1.0, seed)
+    def key(item):
+        # Break ties (the same URL captured more than once) on the other
+        # fields, but not the content, which may be a location particular
+        # to one machine
+        return (selector.value(item[0]), _bytes(item[0]), repr(item[2:]))
+    return sorted((item for sample in samples for item in sample), key=key)
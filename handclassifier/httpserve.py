@@ -0,0 +1,106 @@
+"""A loopback HTTP server which serves page content held in memory.
+
+ManualBrowserClassifierSingle normally writes each page to a temporary file
+for the web browser to open. With a ContentServer it instead keeps the page in
+a bounded in-memory LRU cache and points the browser at a URL on 127.0.0.1.
+Nothing is written to disk, so nothing is left behind however the process
+ends.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+import threading
+import itertools
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import quote
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import quote
+from .backends import LRUCache
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class _PageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        page = self.server.content.lookup(self.path)
+        if page is None:
+            self.send_error(404, "Page no longer held")
+            return
+        body, ctype = page
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class ContentServer(object):
+    """Serve pages from memory on a loopback address.
+
+    The server runs in a daemon thread, so it never keeps the process alive.
+
+    host -- the address to listen on (default: 127.0.0.1)
+    port -- the port to listen on; 0 picks a free port (default: 0)
+    cachesize -- the maximum number of bytes of page content to hold; the
+        least recently used pages are dropped beyond this (default:
+        64*1024*1024)
+    """
+    def __init__(self, host='127.0.0.1', port=0, cachesize=64*1024*1024):
+        self._pages = LRUCache(cachesize, sizeof=lambda p: len(p[0]))
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._httpd = _ThreadingHTTPServer((host, port), _PageHandler)
+        self._httpd.content = self
+        self.host, self.port = self._httpd.server_address[:2]
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add(self, name, content, ctype='text/html; charset=utf-8'):
+        """Hold content and return the URL at which it is served.
+
+        name -- a file name to appear at the end of the URL
+        content -- the page body, as bytes
+        ctype -- the Content-Type to serve it with
+        """
+        # A unique prefix, so that pages with the same name don't collide
+        path = '/%d/%s' % (next(self._counter), quote(name))
+        with self._lock:
+            self._pages[path] = (content, ctype)
+        return 'http://%s:%d%s' % (self.host, self.port, path)
+
+    def lookup(self, path):
+        """Return (content, ctype) for path, or None if it is not held."""
+        with self._lock:
+            if path in self._pages:
+                return self._pages[path]
+        return None
+
+    def __len__(self):
+        return len(self._pages)
+
+    def shutdown(self):
+        """Stop serving and drop all pages."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        with self._lock:
+            self._pages = LRUCache(self._pages.maxsize, self._pages._sizeof)
@@ -0,0 +1,107 @@
+"""A bounded-memory queue of items for the classifiers.
+
+ItemQueue draws items from any iterable (a list, a generator, a sampler...)
+only as they are needed. At most 'lookahead' upcoming items are held, plus
+the current one, so memory does not grow with the size of the corpus and the
+first item can be shown as soon as it has been produced.
+
+The queue also applies a resume.ResumeIndex, if given: items already
+classified are skipped and items with a retry label are held back until the
+source is exhausted.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+import itertools
+from collections import deque
+
+class ItemQueue(object):
+    """Iterate lazily over classifier items with a bounded lookahead window.
+
+    items -- any iterable of item tuples
+    lookahead -- the maximum number of upcoming items to hold (default: 16)
+    resume -- a resume.ResumeIndex to apply (default: None)
+    """
+    def __init__(self, items, lookahead=16, resume=None):
+        self._source = iter(items)
+        self._window = deque()
+        self.lookahead = max(1, lookahead)
+        self.resume = resume
+        self.retries = []
+        self._retrying = False
+        self.current = None
+        self.position = -1
+
+    def _pull(self):
+        """Return the next item which should be presented, or raise
+        StopIteration if there are none left."""
+        while True:
+            try:
+                item = next(self._source)
+            except StopIteration:
+                if self._retrying or not self.retries:
+                    raise
+                # Now go back over the held-back items
+                self._source = iter(self.retries)
+                self.retries = []
+                self._retrying = True
+                continue
+            if self.resume is not None and not self._retrying:
+                if self.resume.is_retry(item):
+                    self.retries.append(item)
+                    continue
+                if self.resume.is_done(item):
+                    continue
+            return item
+
+    def _fill(self, n):
+        while len(self._window) < n:
+            try:
+                self._window.append(self._pull())
+            except StopIteration:
+                break
+
+    def peek(self, n=None):
+        """Return a list of up to n upcoming items (default and maximum:
+        lookahead) without consuming them."""
+        if n is None or n > self.lookahead:
+            n = self.lookahead
+        self._fill(n)
+        return list(itertools.islice(self._window, n))
+
+    def advance(self):
+        """Move on to, and return, the next item.
+
+        Raises IndexError if there are no more items."""
+        self._fill(1)
+        if not self._window:
+            self.current = None
+            raise IndexError("No more items")
+        self.current = self._window.popleft()
+        self.position += 1
+        return self.current
+
+    def learn(self, item, label):
+        """Called with each hand classification. Queues which reorder
+        themselves as labels arrive (such as active.ActiveQueue) override
+        this."""
+        pass
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.advance()
+            except IndexError:
+                return
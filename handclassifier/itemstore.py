@@ -0,0 +1,293 @@
+"""A compact, memory-mapped store of classifier items.
+
+A list of millions of (url, None, code, mime) tuples costs several hundred
+bytes per item in Python objects, and as long again to unpickle. An item
+store keeps the same items in a file laid out by column:
+
+* the identifiers (URLs) packed end to end in one buffer, with an array of
+  their offsets
+* each further field as an array of small integers indexing a dictionary of
+  its distinct values (there are only a handful of status codes and MIME
+  types)
+
+The file is memory-mapped, so opening it is immediate, and the operating
+system pages in only what is used. Items are made into tuples one at a time
+as they are asked for; an ItemStore can be passed straight to a classifier
+as its items, or indexed like a list.
+
+    write_items('sample.items', sampler)
+    items = ItemStore('sample.items')
+
+The content field (the second) must be None for every item, or a
+warcbackend.WarcLocation for every item (as from a WarcSampler made with
+locations=True); locations are stored as a file name dictionary and an array
+of offsets.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+import os
+import sys
+import json
+import mmap
+import array
+import random
+import struct
+
+from .warcbackend import WarcLocation
+
+_MAGIC = b'HCITEM01'
+# magic, number of items, length of the JSON metadata
+_HEADER = struct.Struct('<8sQQ')
+_OFFSET = struct.Struct('<Q')
+# The offsets of the start and end of an identifier
+_SPAN = struct.Struct('<QQ')
+_CODES = {'H': struct.Struct('<H'), 'I': struct.Struct('<I')}
+
+def _pad(n):
+    """Bytes needed to bring n to a multiple of 8."""
+    return -n % 8
+
+def _tobytes(a):
+    if sys.byteorder != 'little':
+        a = array.array(a.typecode, a)
+        a.byteswap()
+    return a.tostring() if sys.version_info < (3,) else a.tobytes()
+
+def _encode_value(v):
+    # JSON can't tell bytes from text, so tag each dictionary value
+    if v is None:
+        return None
+    if isinstance(v, bool):
+        return ['?', v]
+    if isinstance(v, int) or (sys.version_info < (3,) and
+                              isinstance(v, long)):
+        return ['i', v]
+    if isinstance(v, float):
+        return ['f', v]
+    if isinstance(v, bytes):
+        return ['b', v.decode('latin-1')]
+    return ['s', v]
+
+def _decode_value(v):
+    if v is None:
+        return None
+    tag, value = v
+    if tag == 'b':
+        return value.encode('latin-1')
+    if tag == 's' and sys.version_info < (3,):
+        # Keep plain ASCII text as str, as it was written on Python 2
+        try:
+            return value.encode('ascii')
+        except UnicodeEncodeError:
+            return value
+    return value
+
+def write_items(fn, items):
+    """Write items to a new item store file fn, returning the number of
+    items.
+
+    items -- an iterable of tuples, all of the same length, with an
+        identifier (bytes or text) first and None or a WarcLocation second
+    """
+    offsets = array.array('Q', [0])
+    buf = bytearray()
+    columns = None
+    dictionaries = None
+    nfields = None
+    text = None
+    locations = False
+    filenames = {}
+    filecodes = array.array('I')
+    recordoffsets = array.array('Q')
+    for item in items:
+        if nfields is None:
+            nfields = len(item)
+            if nfields < 2:
+                raise ValueError("Items must have at least 2 fields")
+            text = not isinstance(item[0], bytes)
+            columns = [array.array('I') for _ in range(nfields-2)]
+            dictionaries = [{} for _ in range(nfields-2)]
+            locations = isinstance(item[1], WarcLocation)
+        elif len(item) != nfields:
+            raise ValueError("Items must all have the same number of fields")
+        if locations:
+            if not isinstance(item[1], WarcLocation):
+                raise ValueError("Items must all have a WarcLocation, or "
+                                 "none")
+            code = filenames.get(item[1].filename)
+            if code is None:
+                code = filenames[item[1].filename] = len(filenames)
+            filecodes.append(code)
+            recordoffsets.append(item[1].offset)
+        elif item[1] is not None:
+            raise ValueError("An item store does not hold item content")
+        ident = item[0]
+        buf.extend(ident.encode('utf-8') if text else ident)
+        offsets.append(len(buf))
+        for value, column, dictionary in zip(item[2:], columns,
+                                             dictionaries):
+            code = dictionary.get(value)
+            if code is None:
+                code = dictionary[value] = len(dictionary)
+            column.append(code)
+    n = len(offsets) - 1
+    meta = {'nfields': nfields or 2, 'text': bool(text), 'columns': []}
+    if locations:
+        meta['locations'] = [_encode_value(f) for f in
+                             sorted(filenames, key=filenames.get)]
+        filecodes = array.array('H' if len(filenames) <= 65536 else 'I',
+                                filecodes)
+        meta['filecode'] = filecodes.typecode
+    typecodes = []
+    for dictionary in dictionaries or []:
+        values = sorted(dictionary, key=dictionary.get)
+        typecode = 'H' if len(values) <= 65536 else 'I'
+        typecodes.append(typecode)
+        meta['columns'].append({'typecode': typecode,
+                                'values': [_encode_value(v)
+                                           for v in values]})
+    meta = json.dumps(meta, sort_keys=True).encode('utf-8')
+
+    tmpfn = fn+'.tmp'
+    with open(tmpfn, 'wb') as out:
+        out.write(_HEADER.pack(_MAGIC, n, len(meta)))
+        out.write(meta + b'\0'*_pad(_HEADER.size+len(meta)))
+        out.write(_tobytes(offsets))
+        out.write(bytes(buf) + b'\0'*_pad(len(buf)))
+        for column, typecode in zip(columns or [], typecodes):
+            if typecode != 'I':
+                column = array.array(typecode, column)
+            data = _tobytes(column)
+            out.write(data + b'\0'*_pad(len(data)))
+        if locations:
+            data = _tobytes(filecodes)
+            out.write(data + b'\0'*_pad(len(data)))
+            out.write(_tobytes(recordoffsets))
+    getattr(os, 'replace', os.rename)(tmpfn, fn)
+    return n
+
+class ItemStore(object):
+    """A read-only, memory-mapped sequence of items written by
+    write_items().
+
+    fn -- the item store file
+    """
+    def __init__(self, fn):
+        self.fn = fn
+        self._fh = open(fn, 'rb')
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n, metalen = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(fn+" is not an item store")
+        pos = _HEADER.size
+        meta = json.loads(self._mm[pos:pos+metalen].decode('utf-8'))
+        pos += metalen + _pad(pos+metalen)
+        self.nfields = meta['nfields']
+        self._text = meta['text']
+        self._offsets = pos
+        pos += (self.n+1) * _OFFSET.size
+        self._buf = pos
+        buflen = _OFFSET.unpack_from(self._mm,
+                                     self._offsets+self.n*_OFFSET.size)[0]
+        pos += buflen + _pad(buflen)
+        # (position, struct, values) of each column
+        self._columns = []
+        for info in meta['columns']:
+            codes = _CODES[info['typecode']]
+            self._columns.append((pos, codes,
+                                  [_decode_value(v) for v in info['values']]))
+            size = self.n * codes.size
+            pos += size + _pad(size)
+        # (position of file codes, struct, file names, position of offsets)
+        self._locations = None
+        if 'locations' in meta:
+            codes = _CODES[meta['filecode']]
+            size = self.n * codes.size
+            self._locations = (pos, codes,
+                               [_decode_value(f) for f in meta['locations']],
+                               pos + size + _pad(size))
+
+    def close(self):
+        self._mm.close()
+        self._fh.close()
+
+    def __len__(self):
+        return self.n
+
+    def _index(self, i):
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError("item store index out of range")
+        return i
+
+    def identifier(self, i):
+        """Return the identifier (first field) of item i."""
+        i = self._index(i)
+        start, end = _SPAN.unpack_from(self._mm,
+                                       self._offsets+i*_OFFSET.size)
+        ident = self._mm[self._buf+start:self._buf+end]
+        return ident.decode('utf-8') if self._text else ident
+
+    def location(self, i):
+        """Return the WarcLocation of item i, or None if the store has no
+        locations."""
+        i = self._index(i)
+        if self._locations is None:
+            return None
+        pos, codes, filenames, offsets = self._locations
+        return WarcLocation(
+            filenames[codes.unpack_from(self._mm, pos+i*codes.size)[0]],
+            _OFFSET.unpack_from(self._mm, offsets+i*_OFFSET.size)[0])
+
+    def field(self, i, f):
+        """Return field f of item i."""
+        if f == 0:
+            return self.identifier(i)
+        if f == 1:
+            return self.location(i)
+        pos, codes, values = self._columns[f-2]
+        return values[codes.unpack_from(self._mm,
+                                        pos+self._index(i)*codes.size)[0]]
+
+    def __getitem__(self, i):
+        i = self._index(i)
+        mm = self._mm
+        start, end = _SPAN.unpack_from(mm, self._offsets+i*_OFFSET.size)
+        ident = mm[self._buf+start:self._buf+end]
+        if self._text:
+            ident = ident.decode('utf-8')
+        location = None if self._locations is None else self.location(i)
+        return (ident, location) + tuple(
+            values[codes.unpack_from(mm, pos+i*codes.size)[0]]
+            for pos, codes, values in self._columns)
+
+    def __iter__(self):
+        for i in range(self.n):
+            yield self[i]
+
+    def values(self, f):
+        """Return the distinct values of field f (2 or more)."""
+        return list(self._columns[f-2][2])
+
+    def shuffled(self, seed=1818118181):
+        """Generate the items in a random order, reproducible for a given
+        seed. Only the order (4 bytes per item) is held in memory."""
+        order = array.array('I', range(self.n))
+        random.Random(seed).shuffle(order)
+        for i in order:
+            yield self[i]
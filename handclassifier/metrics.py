@@ -0,0 +1,189 @@
+"""Timing of annotation sessions.
+
+Given a MetricsRecorder, ManualTextClassifier records for each item the
+times (in seconds since the epoch) at which:
+
+* start -- the classifier moved on to the item
+* ready -- its content had been fetched or prepared
+* shown -- it had been put in front of the annotator
+* decided -- a label button was pressed
+* written -- the result had been written to the output
+
+Records are appended to a file as one JSON object per line, alongside the
+normal output. Pairs whose label was inferred rather than asked for are
+recorded with only a 'written' time.
+
+summarise() (or 'python -m handclassifier.metrics metrics.jsonl') reports
+throughput, latency percentiles and how the annotators' time divides
+between waiting for content and deciding.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+from __future__ import print_function, division
+import sys
+import json
+import time
+import argparse
+
+def _text(s):
+    if isinstance(s, bytes) and not isinstance(s, str):
+        return s.decode('utf-8', 'replace')
+    return s
+
+class MetricsRecorder(object):
+    """Append per-item timing records to a file.
+
+    fn -- the metrics file, appended to if it exists
+    session -- a label for this session, stored in each record
+        (default: the start time)
+    """
+    def __init__(self, fn, session=None):
+        self.fn = fn
+        self.session = session if session is not None else time.time()
+        self._fh = open(fn, 'a')
+
+    def _write(self, record):
+        record['session'] = self.session
+        self._fh.write(json.dumps(record, sort_keys=True)+'\n')
+        self._fh.flush()
+
+    def record(self, item, label, times, pair=False):
+        """Record the timings of a hand classification.
+
+        item -- the item classified
+        label -- the label given
+        times -- a dict with some or all of the keys start, ready, shown,
+            decided and written
+        pair -- item is a pair (default: False)
+        """
+        record = dict(times)
+        record['item'] = _text(item[0])
+        if pair:
+            record['item2'] = _text(item[2])
+        record['label'] = _text(label)
+        self._write(record)
+
+    def record_inferred(self, item, label, pair=True):
+        """Record a result which was inferred rather than asked for."""
+        self.record(item, label, {'written': time.time(), 'inferred': True},
+                    pair=pair)
+
+    def close(self):
+        self._fh.close()
+
+def read_metrics(fn):
+    """Return the list of records in metrics file fn."""
+    records = []
+    with open(fn) as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+def percentile(values, p):
+    """The p'th percentile (0-100) of values by the nearest-rank method, or
+    None for no values."""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(1, int(-(-p * len(values) // 100)))
+    return values[min(rank, len(values)) - 1]
+
+def _intervals(records, first, last):
+    return [r[last] - r[first] for r in records
+            if first in r and last in r]
+
+def summarise(records):
+    """Summarise timing records as a dict.
+
+    Includes the number of judged and inferred items, judged items per hour
+    of active time (the sum of each item's start-to-written time) and of
+    wall-clock time, 50/90/99th percentiles of each stage, and the total
+    time spent waiting for content (start to shown) and deciding (shown to
+    decided)."""
+    judged = [r for r in records if 'decided' in r]
+    summary = {'judged': len(judged),
+               'inferred': len(records) - len(judged),
+               'sessions': len(set(r.get('session') for r in records))}
+    stages = (('fetch', 'start', 'ready'),
+              ('display', 'ready', 'shown'),
+              ('decide', 'shown', 'decided'),
+              ('write', 'decided', 'written'),
+              ('total', 'start', 'written'))
+    for name, first, last in stages:
+        values = _intervals(judged, first, last)
+        summary[name] = {'p50': percentile(values, 50),
+                         'p90': percentile(values, 90),
+                         'p99': percentile(values, 99),
+                         'sum': sum(values)}
+    active = summary['total']['sum']
+    summary['items_per_active_hour'] = (
+        len(judged) * 3600.0 / active if active else None)
+    # Wall clock time, summed per session so gaps between sessions don't
+    # count
+    wall = 0.0
+    bysession = {}
+    for r in judged:
+        bysession.setdefault(r.get('session'), []).append(r)
+    for rs in bysession.values():
+        wall += (max(r['written'] for r in rs) -
+                 min(r.get('start', r['written']) for r in rs))
+    summary['items_per_hour'] = len(judged) * 3600.0 / wall if wall else None
+    summary['waiting'] = (summary['fetch']['sum'] +
+                          summary['display']['sum'])
+    summary['deciding'] = summary['decide']['sum']
+    return summary
+
+def _fmt(v):
+    return '-' if v is None else '%.3f' % v
+
+def print_summary(summary, out=sys.stdout):
+    print("Items judged:", summary['judged'], " inferred:",
+          summary['inferred'], " sessions:", summary['sessions'], file=out)
+    print("Items/hour:", _fmt(summary['items_per_hour']),
+          " (active time:", _fmt(summary['items_per_active_hour'])+")",
+          file=out)
+    print("%-9s %10s %10s %10s %12s" % ('stage (s)', 'p50', 'p90', 'p99',
+                                         'total'), file=out)
+    for name in ('fetch', 'display', 'decide', 'write', 'total'):
+        s = summary[name]
+        print("%-9s %10s %10s %10s %12s" % (name, _fmt(s['p50']),
+              _fmt(s['p90']), _fmt(s['p99']), _fmt(s['sum'])), file=out)
+    total = summary['waiting'] + summary['deciding']
+    if total:
+        print("Waiting for content: %.1f%%, deciding: %.1f%%" %
+              (100.0 * summary['waiting'] / total,
+               100.0 * summary['deciding'] / total), file=out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Summarise handclassifier session timings.")
+    parser.add_argument('metrics', nargs='+', help="metrics files")
+    parser.add_argument('--json', action='store_true',
+                        help="print the summary as JSON")
+    args = parser.parse_args(argv)
+    records = []
+    for fn in args.metrics:
+        records.extend(read_metrics(fn))
+    summary = summarise(records)
+    if args.json:
+        print(json.dumps(summary, indent=2, sort_keys=True))
+    else:
+        print_summary(summary)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""Suppressing near-duplicate items before they reach the annotator.
+
+Sampled crawls are full of near-identical templated pages (search results,
+data views, calendars...), each of which would otherwise cost a human
+judgement. NearDuplicateFilter sits between the sample and the classifier:
+
+    items = NearDuplicateFilter(sample)
+    classifier = ManualTextClassifier(items=items, ...)
+    ...
+    with open('duplicates.csv', 'w') as fh:
+        items.export_csv(fh)
+
+Each item's text is reduced to a 64 bit SimHash of its word shingles, in a
+pool of worker processes. Items whose fingerprints differ in at most
+'distance' bits are near-duplicates. The first item of each cluster is its
+representative, and is passed on to be classified; the rest are recorded as
+members of its cluster, for export, and are not shown.
+
+Fingerprints are looked up through 'distance'+1 block indexes (two
+fingerprints within that distance must agree exactly on at least one
+block), which hold only the representatives. Texts are dropped as soon as
+they are fingerprinted, so memory goes with the number of clusters and the
+member identifiers, not the size of the documents, and a few hundred
+thousand items are no trouble.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+from __future__ import print_function
+import os
+import re
+import csv
+import array
+import hashlib
+import multiprocessing
+from collections import deque, defaultdict
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+# Bits per counter when adding up shingle hashes, bit by bit, in one
+# integer; documents are cut off at this many shingles so none overflows
+_WIDTH = 20
+_MAXSHINGLES = (1 << _WIDTH) - 1
+
+def _spread_tables():
+    """For each byte of an 8 byte hash, a table of each of its values with
+    bit j moved up to the start of counter j."""
+    tables = []
+    for byte in range(8):
+        shift = (7-byte) * 8 * _WIDTH
+        tables.append([sum(((b >> j) & 1) << (j*_WIDTH)
+                           for j in range(8)) << shift
+                       for b in range(256)])
+    return tables
+
+_TABLES = _spread_tables()
+
+def _text(s):
+    if s is None:
+        return u''
+    if isinstance(s, bytes) and not isinstance(s, str):
+        return s.decode('utf-8', 'replace')
+    if not isinstance(s, (bytes, type(u''))):
+        raise TypeError("Can't fingerprint a %s; give NearDuplicateFilter a "
+                        "'text' function returning the item's text" %
+                        type(s).__name__)
+    return s
+
+def simhash(text, shingle=3):
+    """Return the 64 bit SimHash of the word shingles of text, or None if
+    it has no words.
+
+    text -- the document, as text or UTF-8 bytes (or None)
+    shingle -- the number of words in each shingle (default: 3)
+    """
+    words = _WORD.findall(_text(text).lower())
+    if len(words) < shingle:
+        shingles = [u' '.join(words)] if words else []
+    else:
+        shingles = [u' '.join(words[i:i+shingle])
+                    for i in range(min(len(words)-shingle+1, _MAXSHINGLES))]
+    if not shingles:
+        # Every empty text would otherwise be a duplicate of every other
+        return None
+    t0, t1, t2, t3, t4, t5, t6, t7 = _TABLES
+    md5 = hashlib.md5
+    # Count the set bits at each position of all the shingle hashes at once
+    counts = 0
+    for s in shingles:
+        d = bytearray(md5(s.encode('utf-8')).digest())
+        counts += (t0[d[0]] + t1[d[1]] + t2[d[2]] + t3[d[3]] +
+                   t4[d[4]] + t5[d[5]] + t6[d[6]] + t7[d[7]])
+    mask = (1 << _WIDTH) - 1
+    half = len(shingles)
+    fingerprint = 0
+    for bit in range(64):
+        if 2 * ((counts >> (bit*_WIDTH)) & mask) > half:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+def hamming(a, b):
+    """The number of bits in which a and b differ."""
+    return bin(a ^ b).count('1')
+
+def _fingerprint_chunk(task):
+    """Fingerprint a list of texts. Runs in a worker process."""
+    texts, shingle = task
+    return [simhash(text, shingle) for text in texts]
+
+class NearDuplicateFilter(object):
+    """Pass on one representative item of each cluster of near-duplicates.
+
+    items -- an iterable of 2+-tuples of identifier and text (or whatever
+        'text' takes), as for ManualTextClassifier
+    distance -- the largest number of differing fingerprint bits for two
+        items to be near-duplicates (default: 3)
+    shingle -- the number of words in each shingle (default: 3)
+    text -- a function returning the text to fingerprint from an item
+        (default: the item's second field). It runs in this process, so it
+        may read content from elsewhere (such as a warcbackend.WarcBackend).
+        It is needed for items which don't carry their content, such as
+        those from WarcSampler; anything but text, bytes or None raises a
+        TypeError
+    processes -- number of worker processes to fingerprint in; None uses all
+        available cores and 1 works in this process (default: None)
+    chunksize -- the number of items sent to a worker at once (default: 200)
+    debug -- a text output stream for printing progress (default: None)
+
+    Items whose text has no words (None, empty, or nothing but markup
+    symbols) are passed on without being clustered; 'nempty' counts them.
+
+    'members' maps the identifier of each representative with duplicates to
+    a list of (identifier, distance) of the items suppressed in its favour,
+    as found by the latest pass over the filter.
+    """
+    def __init__(self, items, distance=3, shingle=3, text=None,
+                 processes=None, chunksize=200, debug=None):
+        if not 0 <= distance < 64:
+            raise ValueError("distance must be between 0 and 63")
+        self.items = items
+        self.distance = distance
+        self.shingle = shingle
+        self.text = text if text is not None else (lambda item: item[1])
+        self.processes = processes
+        self.chunksize = max(1, chunksize)
+        if debug:
+            self._debug = debug
+        else:
+            self._debug = open(os.devnull, 'w')
+        nblocks = distance + 1
+        self._blocks = [(64*i // nblocks, 64*(i+1) // nblocks)
+                        for i in range(nblocks)]
+        self.reset()
+
+    def reset(self):
+        """Forget the clusters found so far. Each pass over the filter
+        starts afresh."""
+        self.members = defaultdict(list)
+        self.nitems = 0
+        self.nempty = 0
+        # Fingerprints and identifiers of the representatives, and the
+        # block indexes: block value -> positions in those arrays
+        self._fingerprints = array.array('Q')
+        self._representatives = []
+        self._index = [{} for _ in self._blocks]
+
+    def _block_values(self, fingerprint):
+        return [(fingerprint >> start) & ((1 << (end-start)) - 1)
+                for start, end in self._blocks]
+
+    def representative(self, fingerprint):
+        """Return (position, distance) of the nearest representative within
+        'distance' of fingerprint, or None."""
+        best = None
+        seen = set()
+        for index, value in zip(self._index,
+                                self._block_values(fingerprint)):
+            for pos in index.get(value, ()):
+                if pos in seen:
+                    continue
+                seen.add(pos)
+                d = hamming(fingerprint, self._fingerprints[pos])
+                if d <= self.distance and (best is None or d < best[1]):
+                    best = (pos, d)
+        return best
+
+    def add(self, item, fingerprint):
+        """Cluster item by its fingerprint (None for a text with no words);
+        return True if it is to be passed on, as a new representative or
+        unclustered."""
+        self.nitems += 1
+        if fingerprint is None:
+            self.nempty += 1
+            return True
+        found = self.representative(fingerprint)
+        if found is not None:
+            pos, d = found
+            self.members[self._representatives[pos]].append((item[0], d))
+            return False
+        pos = len(self._representatives)
+        self._fingerprints.append(fingerprint)
+        self._representatives.append(item[0])
+        for index, value in zip(self._index,
+                                self._block_values(fingerprint)):
+            index.setdefault(value, []).append(pos)
+        return True
+
+    def _item_text(self, item):
+        # Checked here, rather than in a worker, so a missing 'text'
+        # function is reported straight away
+        return _text(self.text(item))
+
+    def _chunks(self):
+        chunk = []
+        for item in self.items:
+            chunk.append(item)
+            if len(chunk) >= self.chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _fingerprinted(self):
+        """Generate (items, fingerprints) for each chunk of items, in
+        order, with only a few chunks in the pool at once."""
+        if self.processes == 1:
+            for chunk in self._chunks():
+                yield chunk, _fingerprint_chunk(
+                    ([self._item_text(item) for item in chunk], self.shingle))
+            return
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            # Pool.imap would read all the items ahead, texts and all
+            pending = deque()
+            window = 2 * (self.processes or multiprocessing.cpu_count())
+            for chunk in self._chunks():
+                texts = [self._item_text(item) for item in chunk]
+                pending.append((chunk, pool.apply_async(
+                    _fingerprint_chunk, ((texts, self.shingle),))))
+                while len(pending) >= window:
+                    chunk, result = pending.popleft()
+                    yield chunk, result.get()
+            while pending:
+                chunk, result = pending.popleft()
+                yield chunk, result.get()
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def __iter__(self):
+        self.reset()
+        for chunk, fingerprints in self._fingerprinted():
+            for item, fingerprint in zip(chunk, fingerprints):
+                if self.add(item, fingerprint):
+                    yield item
+        print(self.nitems, "items,", len(self._representatives),
+              "clusters,", self.nsuppressed(), "near-duplicates suppressed,",
+              self.nempty, "without text", file=self._debug)
+
+    def nsuppressed(self):
+        """The number of items suppressed as near-duplicates."""
+        return self.nitems - self.nempty - len(self._representatives)
+
+    def clusters(self):
+        """Generate (representative, [(member, distance), ...]) for each
+        cluster with near-duplicates."""
+        for rep in self._representatives:
+            if rep in self.members:
+                yield rep, self.members[rep]
+
+    def export_csv(self, output, csvdialect='excel-tab'):
+        """Write a (representative, member, distance) row for each
+        suppressed item to the text stream output."""
+        writer = csv.writer(output, dialect=csvdialect)
+        for rep, members in self.clusters():
+            for member, d in members:
+                writer.writerow([rep, member, d])
@@ -0,0 +1,234 @@
+"""Choosing which pairs of articles are worth classifying as a pair.
+
+Presenting every pair of n articles needs (n*n - n)/2 judgments, nearly all
+of them between obviously unrelated articles. candidate_pairs() instead
+computes a MinHash signature of the word shingles of each text and uses
+locality-sensitive hashing (LSH) over bands of the signatures to find the
+pairs whose estimated Jaccard similarity is at least a threshold, without
+comparing every pair. A small random sample of the remaining, low-similarity
+pairs can be added to check how much the threshold misses.
+
+pair_items() produces the result directly in the items format of
+ManualTextClassifier(pair=True).
+
+This needs NumPy.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+from __future__ import print_function, division
+import os
+import re
+import zlib
+import random
+import numpy as np
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+_MERSENNE = np.uint64((1 << 61) - 1)
+_MAXHASH = np.uint64(0xffffffff)
+_SHINGLEMULT = np.uint64(1000003)
+
+CANDIDATE = 'candidate'
+CALIBRATION = 'calibration'
+
+class MinHasher(object):
+    """Compute MinHash signatures of the word shingles of texts.
+
+    numperm -- the number of hash functions (signature length) (default: 128)
+    shingle -- the number of words in each shingle (default: 3)
+    seed -- the random seed for the hash functions (default: 1818118181)
+    """
+    def __init__(self, numperm=128, shingle=3, seed=1818118181):
+        self.numperm = numperm
+        self.shingle = shingle
+        gen = np.random.RandomState(seed % (1 << 32))
+        # a*h + b stays below 2**64 for 32-bit a, b and h
+        self.a = gen.randint(1, 1 << 32, size=numperm,
+                             dtype=np.int64).astype(np.uint64)
+        self.b = gen.randint(0, 1 << 32, size=numperm,
+                             dtype=np.int64).astype(np.uint64)
+
+    def shingles(self, text):
+        """Return the sorted unique 32-bit hashes of the shingles of text."""
+        words = _WORD.findall(text.lower())
+        if not words:
+            return np.zeros(0, dtype=np.uint64)
+        h = np.fromiter((zlib.crc32(w.encode('utf-8')) & 0xffffffff
+                         for w in words), dtype=np.uint64, count=len(words))
+        k = min(self.shingle, len(h))
+        n = len(h) - k + 1
+        sh = h[:n].copy()
+        for i in range(1, k):
+            sh = (sh * _SHINGLEMULT) ^ h[i:n+i]
+        return np.unique(sh & _MAXHASH)
+
+    def signature(self, text, chunk=4096):
+        """Return the MinHash signature of text as a uint32 array. Texts with
+        no words get a signature of all 0xffffffff."""
+        sh = self.shingles(text)
+        sig = np.full(self.numperm, _MAXHASH, dtype=np.uint64)
+        for start in range(0, len(sh), chunk):
+            c = sh[start:start+chunk]
+            ph = ((np.outer(self.a, c) + self.b[:, None]) % _MERSENNE
+                  & _MAXHASH)
+            np.minimum(sig, ph.min(axis=1), out=sig)
+        return sig.astype(np.uint32)
+
+    def signatures(self, texts):
+        """Return an (n, numperm) array of the signatures of texts."""
+        texts = list(texts)
+        sigs = np.empty((len(texts), self.numperm), dtype=np.uint32)
+        for i, text in enumerate(texts):
+            sigs[i] = self.signature(text)
+        return sigs
+
+def choose_bands(threshold, numperm):
+    """Choose the number of LSH bands b and rows per band r (b*r <= numperm)
+    so that the similarity at which pairs become likely to be found,
+    (1/b)**(1/r), is as close as possible to, without exceeding, threshold.
+    Returns (b, r)."""
+    best = (1, numperm)
+    bestgap = None
+    for r in range(1, numperm+1):
+        b = numperm // r
+        knee = (1.0 / b) ** (1.0 / r)
+        if knee > threshold:
+            continue
+        gap = threshold - knee
+        if bestgap is None or gap < bestgap:
+            best, bestgap = (b, r), gap
+    return best
+
+def similarity(sigs, i, j):
+    """Estimated Jaccard similarity of rows i and j (arrays allowed) of a
+    signature matrix."""
+    return (sigs[i] == sigs[j]).mean(axis=-1)
+
+def lsh_pairs(sigs, bands, rows, maxbucket=None, debug=None):
+    """Return an (m, 2) array of the distinct index pairs (i < j) whose
+    signatures agree completely in at least one band.
+
+    sigs -- an (n, numperm) signature matrix
+    bands, rows -- the LSH banding (bands*rows <= numperm)
+    maxbucket -- skip buckets with more than this many members, which
+        usually hold boilerplate (default: None, for no limit)
+    debug -- a text output stream for printing progress (default: None)
+    """
+    if debug is None:
+        debug = open(os.devnull, 'w')
+    n = sigs.shape[0]
+    # Texts with no words would all collide with each other
+    usable = np.nonzero((sigs != np.uint32(0xffffffff)).any(axis=1))[0]
+    found = []
+    for band in range(bands):
+        block = np.ascontiguousarray(
+            sigs[usable, band*rows:(band+1)*rows])
+        keys = block.view(np.dtype((np.void, block.dtype.itemsize*rows)))
+        _, bucket = np.unique(keys.ravel(), return_inverse=True)
+        order = np.argsort(bucket, kind='mergesort')
+        sortedb = bucket[order]
+        bounds = np.nonzero(np.diff(sortedb))[0] + 1
+        for members in np.split(usable[order], bounds):
+            m = len(members)
+            if m < 2:
+                continue
+            if maxbucket is not None and m > maxbucket:
+                print("Skipping bucket of", m, "in band", band, file=debug)
+                continue
+            ii, jj = np.triu_indices(m, 1)
+            a, b = members[ii], members[jj]
+            found.append(np.stack([np.minimum(a, b), np.maximum(a, b)],
+                                  axis=1))
+    if not found:
+        return np.zeros((0, 2), dtype=np.int64)
+    pairs = np.concatenate(found).astype(np.int64)
+    # Deduplicate pairs found in several bands
+    flat = np.unique(pairs[:, 0] * n + pairs[:, 1])
+    return np.stack([flat // n, flat % n], axis=1)
+
+def candidate_pairs(texts, threshold=0.5, numperm=128, shingle=3,
+                    ncalibration=0, seed=1818118181, shuffle=True,
+                    maxbucket=None, debug=None):
+    """Find the pairs of texts worth classifying.
+
+    Returns a list of (i, j, similarity, kind) tuples, where i < j index
+    texts, similarity is the estimated Jaccard similarity of their shingles
+    and kind is CANDIDATE for pairs at or above threshold or CALIBRATION
+    for the randomly chosen low-similarity pairs.
+
+    texts -- a sequence of strings
+    threshold -- the minimum estimated similarity of candidates
+        (default: 0.5)
+    numperm -- MinHash signature length (default: 128)
+    shingle -- words per shingle (default: 3)
+    ncalibration -- the number of random pairs below threshold to add
+        (default: 0)
+    seed -- the random seed, for hashing and calibration (default:
+        1818118181)
+    shuffle -- shuffle the pairs (with seed), so that calibration pairs are
+        not recognisable by position (default: True)
+    maxbucket -- passed to lsh_pairs (default: None)
+    debug -- a text output stream for printing progress (default: None)
+    """
+    if debug is None:
+        debug = open(os.devnull, 'w')
+    texts = list(texts)
+    n = len(texts)
+    sigs = MinHasher(numperm, shingle, seed).signatures(texts)
+    bands, rows = choose_bands(threshold, numperm)
+    print("Using", bands, "bands of", rows, "rows", file=debug)
+    pairs = lsh_pairs(sigs, bands, rows, maxbucket, debug)
+    sims = similarity(sigs, pairs[:, 0], pairs[:, 1])
+    keep = sims >= threshold
+    print(len(pairs), "pairs share a bucket,", int(keep.sum()),
+          "at or above threshold, of", n*(n-1)//2, file=debug)
+    result = [(int(i), int(j), float(s), CANDIDATE)
+              for (i, j), s in zip(pairs[keep], sims[keep])]
+
+    r = random.Random(seed)
+    if ncalibration and n > 1:
+        taken = set((i, j) for i, j, _, _ in result)
+        attempts = 0
+        calibration = []
+        while len(calibration) < ncalibration and attempts < 20*ncalibration:
+            attempts += 1
+            i, j = sorted(r.sample(range(n), 2))
+            if (i, j) in taken:
+                continue
+            s = float(similarity(sigs, i, j))
+            if s >= threshold:
+                continue
+            taken.add((i, j))
+            calibration.append((i, j, s, CALIBRATION))
+        result.extend(calibration)
+    if shuffle:
+        r.shuffle(result)
+    return result
+
+def pair_items(articles, **kw):
+    """Generate items for ManualTextClassifier(pair=True) from the candidate
+    pairs of articles.
+
+    Each item is (id1, text1, id2, text2, similarity, kind), so the output
+    rows record the estimated similarity and whether the pair was a
+    candidate or a calibration pair.
+
+    articles -- a sequence of (identifier, text) tuples
+    Other keyword arguments are passed to candidate_pairs().
+    """
+    articles = list(articles)
+    for i, j, s, kind in candidate_pairs([a[1] for a in articles], **kw):
+        yield (articles[i][0], articles[i][1], articles[j][0],
+               articles[j][1], '%.3f' % s, kind)
@@ -0,0 +1,178 @@
+"""Propagating labels between items with the same payload.
+
+The same document is often archived under many URLs (query string variants,
+mirrors, aliases), and each would otherwise be classified separately.
+PayloadGroups groups items by a payload digest -- by default the fifth
+field, as given by WarcSampler(..., digests=True) -- so that only the first
+item of each group is shown. When it is labelled, the engine writes a row for
+every other member of the group with the same label, marked as propagated:
+
+    sampler = WarcSampler(dirname, 0.002, digests=True)
+    classifier = ManualWaybackClassifierSingle(items=sampler,
+                                               duplicates=PayloadGroups())
+
+Members which turn up after their group has been labelled are written
+straight away, without being shown. Every output row then has a final
+field, 'judged' or 'propagated'.
+
+Items skipped on resuming never reach the groups, so a resumed session
+(or one adding new WARCs to an earlier sample) should load the group labels
+from the existing output, as a ResumeIndex does:
+
+    duplicates = PayloadGroups(fn=outfn)
+
+A retry label ("? - Unable to determine") is not given to the group:
+whether an item can be shown depends on its URL, not its payload, so the
+next member of the group is shown instead.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+import sys
+import csv
+import base64
+import hashlib
+from collections import defaultdict, deque
+from .resume import UNABLE
+
+# Value of the flag column for rows given their group's label
+PROPAGATED = 'propagated'
+
+def body_digest(body):
+    """The digest of body (bytes) in the form of a WARC-Payload-Digest
+    header, for records which lack one."""
+    return b'sha1:' + base64.b32encode(hashlib.sha1(body).digest())
+
+class PayloadGroups(object):
+    """Groups of items with the same payload digest, and their labels.
+
+    field -- the item field holding the digest. Items without one (too
+        short, or None) are never grouped (default: 4)
+    key -- a function returning the digest of an item, instead of field
+        (default: None)
+    retrylabels -- labels which are not given to the group, as for
+        resume.ResumeIndex. A session with a resume index uses its retry
+        labels instead (default: ("? - Unable to determine",))
+    fn -- an output file to load group labels from, which need not exist
+        yet (default: None)
+    csvdialect -- the csv dialect of the output file (default: excel-tab)
+    """
+    def __init__(self, field=4, key=None, retrylabels=(UNABLE,), fn=None,
+                 csvdialect='excel-tab'):
+        self.field = field
+        self._key = key
+        self.retrylabels = frozenset(retrylabels)
+        self.csvdialect = csvdialect
+        # digest -> label given to the group
+        self.labels = {}
+        # digest -> members waiting for the label of the group's
+        # representative
+        self._waiting = defaultdict(list)
+        self._represented = set()
+        # Members made their group's representative after a retry label,
+        # to be shown next
+        self._promoted = deque()
+        if fn:
+            self.load(fn)
+
+    def load(self, fn):
+        """Add the group labels in output file fn. A missing file is
+        treated as empty."""
+        try:
+            if sys.version_info >= (3,):
+                fh = open(fn, 'r', newline='')
+            else:
+                fh = open(fn, 'rb')
+        except IOError:
+            return
+        with fh:
+            self.load_rows(csv.reader(fh, dialect=self.csvdialect))
+
+    def load_rows(self, rows):
+        """Add the group labels in an iterable of output rows (lists of
+        fields, such as sinks.JournalSink.recovered). An output row holds
+        the item's fields after its label, so the digest is in column
+        'field'. Where a digest appears more than once the last label wins;
+        retry labels and empty digests are ignored."""
+        if self._key is not None:
+            raise ValueError("Can't read digests from output rows with a "
+                             "key function")
+        for row in rows:
+            if len(row) <= self.field:
+                continue
+            digest = row[self.field]
+            if digest and row[1] not in self.retrylabels:
+                self.labels[digest] = row[1]
+
+    def key(self, item):
+        """Return the digest of item, or None."""
+        if self._key is not None:
+            digest = self._key(item)
+        else:
+            digest = item[self.field] if len(item) > self.field else None
+        # Digests are read back from the output as text
+        if isinstance(digest, bytes) and not isinstance(digest, str):
+            digest = digest.decode('ascii')
+        return digest
+
+    def label(self, item):
+        """Return the label already given to item's group, or None."""
+        digest = self.key(item)
+        return None if digest is None else self.labels.get(digest)
+
+    def hold(self, item):
+        """Hold item back if another member of its group is waiting for a
+        label, returning True; otherwise make it its group's representative
+        and return False."""
+        digest = self.key(item)
+        if digest is None:
+            return False
+        if digest in self._represented:
+            self._waiting[digest].append(item)
+            return True
+        self._represented.add(digest)
+        return False
+
+    def record(self, item, label):
+        """Record label as the label of item's group, and return the members
+        which were waiting for it.
+
+        If label is a retry label, the group is left unlabelled and the
+        first member waiting, if any, becomes its representative (see
+        promoted()); no members are returned."""
+        digest = self.key(item)
+        if digest is None:
+            return []
+        if label in self.retrylabels:
+            waiting = self._waiting.get(digest)
+            if waiting:
+                self._promoted.append(waiting.pop(0))
+                if not waiting:
+                    del self._waiting[digest]
+            else:
+                self._represented.discard(digest)
+            return []
+        self.labels[digest] = label
+        self._represented.discard(digest)
+        return self._waiting.pop(digest, [])
+
+    def promoted(self):
+        """Return the next member made its group's representative in place
+        of one given a retry label, or None."""
+        return self._promoted.popleft() if self._promoted else None
+
+    def waiting(self):
+        """The number of items held back for their group's label."""
+        return sum(len(members) for members in self._waiting.values())
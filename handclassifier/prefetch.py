@@ -0,0 +1,92 @@
+"""Background preparation of content for upcoming items.
+
+While the annotator is judging one item, a Prefetcher runs the classifier's
+content preparation (fetching pages, database lookups, writing temporary
+files...) for the next few items in a pool of threads, so that moving on to
+the next item does not wait on the network or the disk.
+
+Preparation functions run outside the tkinter main loop and so must not
+touch any tkinter objects.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+# multiprocessing's thread pool, unlike concurrent.futures, is in the
+# standard library of Python 2 as well as 3
+from multiprocessing.pool import ThreadPool
+
+class _Job(object):
+    """A preparation which can be abandoned before it starts."""
+    def __init__(self, prepare, item):
+        self.prepare = prepare
+        self.item = item
+        self.cancelled = False
+
+    def __call__(self):
+        if self.cancelled:
+            return None
+        return self.prepare(self.item)
+
+class Prefetcher(object):
+    """Run a preparation function over upcoming items in background threads.
+
+    Results are held until collected with get(). Items are tracked by
+    identity, so the same item object must be passed to prefetch() and
+    get().
+
+    prepare -- a function taking an item and returning its prepared content
+    nthreads -- the number of worker threads (default: 4)
+    """
+    def __init__(self, prepare, nthreads=4):
+        self._prepare = prepare
+        self._pool = ThreadPool(max(1, nthreads))
+        # id(item) -> (job, result). The job keeps hold of the item, which
+        # stops its id being reused while the result is outstanding.
+        self._pending = {}
+
+    def prefetch(self, items):
+        """Start preparing each of items which is not already in hand."""
+        for item in items:
+            if id(item) not in self._pending:
+                job = _Job(self._prepare, item)
+                self._pending[id(item)] = (job, self._pool.apply_async(job))
+
+    def get(self, item):
+        """Return the prepared content for item, waiting for it if it is
+        still in progress, or preparing it now if it was never prefetched.
+
+        Any exception raised during preparation is re-raised here."""
+        try:
+            _, result = self._pending.pop(id(item))
+        except KeyError:
+            return self._prepare(item)
+        return result.get()
+
+    def discard(self, item):
+        """Abandon the preparation of item, which will not be shown."""
+        pending = self._pending.pop(id(item), None)
+        if pending is not None:
+            pending[0].cancelled = True
+
+    def __len__(self):
+        return len(self._pending)
+
+    def shutdown(self):
+        """Abandon outstanding work and stop the worker threads."""
+        for job, _ in self._pending.values():
+            job.cancelled = True
+        self._pending = {}
+        # The workers finish whatever is under way, skip the rest and exit
+        self._pool.close()
@@ -0,0 +1,112 @@
+"""Resuming an interrupted classification session from its output file.
+
+A ResumeIndex reads the existing output once and keeps a dictionary from
+item identifier to the label it was given. ManualTextClassifier consults it
+to skip items which have already been classified, so resuming does not rely
+on the items being presented in the same order as last time. Items whose
+label is one of the index's retry labels (by default "? - Unable to
+determine") are not skipped but held back and presented again once all other
+items are done.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+from __future__ import print_function
+import sys
+import csv
+
+UNABLE = "? - Unable to determine"
+
+def _text(s):
+    """Identifiers may arrive as bytes (e.g. URLs from warctools) but are
+    read back from the output as text; compare them as text."""
+    if isinstance(s, bytes) and not isinstance(s, str):
+        return s.decode('utf-8')
+    return s
+
+class ResumeIndex(object):
+    """An index of previous classifications keyed by item identifier.
+
+    Where an identifier appears more than once in the output (for example
+    because it was re-queued and classified again) the last label wins.
+
+    fn -- an output file to load, which need not exist yet (default: None)
+    csvdialect -- the csv dialect of the output file (default: excel-tab)
+    pair -- the output is from pair classification, so items are keyed by
+        both identifiers (default: False)
+    retrylabels -- labels which mark an item to be presented again at the
+        end of the session (default: ("? - Unable to determine",))
+    """
+    def __init__(self, fn=None, csvdialect='excel-tab', pair=False,
+                 retrylabels=(UNABLE,)):
+        self.csvdialect = csvdialect
+        self.pair = pair
+        self.retrylabels = frozenset(retrylabels)
+        self.labels = {}
+        if fn:
+            self.load(fn)
+
+    def load(self, fn):
+        """Add the classifications in output file fn to the index. A missing
+        file is treated as empty."""
+        try:
+            if sys.version_info >= (3,):
+                fh = open(fn, 'r', newline='')
+            else:
+                fh = open(fn, 'rb')
+        except IOError:
+            return
+        with fh:
+            self.load_rows(csv.reader(fh, dialect=self.csvdialect))
+
+    def load_rows(self, rows):
+        """Add the classifications in an iterable of output rows (lists of
+        fields, such as sinks.JournalSink.recovered) to the index."""
+        ncols = 3 if self.pair else 2
+        for row in rows:
+            if len(row) < ncols:
+                continue
+            if self.pair:
+                self.labels[(_text(row[0]), _text(row[1]))] = row[2]
+            else:
+                self.labels[_text(row[0])] = row[1]
+
+    def key(self, item):
+        """Return the index key for an element of a classifier's items."""
+        if self.pair:
+            return (_text(item[0]), _text(item[2]))
+        return _text(item[0])
+
+    def record(self, item, label):
+        """Note that item has been given label."""
+        self.labels[self.key(item)] = label
+
+    def label(self, item):
+        """Return the label previously given to item, or None."""
+        return self.labels.get(self.key(item))
+
+    def is_retry(self, item):
+        """Return True if item was previously given a retry label."""
+        return self.labels.get(self.key(item)) in self.retrylabels
+
+    def is_done(self, item):
+        """Return True if item has a classification which should stand."""
+        label = self.labels.get(self.key(item))
+        return label is not None and label not in self.retrylabels
+
+    def __len__(self):
+        """The number of settled (non-retry) classifications."""
+        return sum(1 for l in self.labels.values()
+                   if l not in self.retrylabels)
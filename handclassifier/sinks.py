@@ -0,0 +1,203 @@
+"""Where ManualTextClassifier writes its results.
+
+A sink takes each output row (a list of fields) from write_result():
+
+* CSVSink writes rows to a text stream with a csv dialect, flushing after
+  every row. This is the classifiers' default behaviour.
+* JournalSink appends rows to a checksummed journal file and makes them
+  durable with fsync() according to a group commit policy: after every row,
+  after every n rows and/or once the oldest unsynced row is a given number of
+  seconds old. On opening, the journal is recovered: complete records are
+  read back (see 'recovered') and any torn record at the end left by a crash
+  is cut off. export_csv() turns a journal into the usual csv output.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+import os
+import sys
+import csv
+import json
+import zlib
+import atexit
+import threading
+
+class CSVSink(object):
+    """Write result rows to a text stream as csv.
+
+    output -- a text output stream
+    csvdialect -- a csv.writer dialect (default: excel-tab)
+    flush -- flush the stream after every row (default: True)
+    """
+    def __init__(self, output, csvdialect='excel-tab', flush=True):
+        self._output = output
+        self._csvwriter = csv.writer(output, dialect=csvdialect)
+        self._flush = flush
+
+    def write(self, row):
+        # Unfortunately, Python 2 and Python 3 have quite incompatible csv
+        # modules: 3 expects unicode, 2 can't really handle unicode at all :-/
+        if not sys.version_info > (3,):
+            row = [s.encode('utf-8') if isinstance(s, unicode) else s
+                   for s in row]
+        self._csvwriter.writerow(row)
+        if self._flush:
+            self._output.flush()
+
+    def flush(self):
+        self._output.flush()
+
+    def close(self):
+        """Flush, but leave the stream (which belongs to the caller) open."""
+        self.flush()
+
+def _jsonable(obj):
+    # URLs from warctools are bytes on Python 3
+    if isinstance(obj, bytes):
+        return obj.decode('utf-8', 'replace')
+    raise TypeError(repr(obj)+" cannot be journalled")
+
+def _encode_record(row):
+    payload = json.dumps(list(row), ensure_ascii=True, default=_jsonable,
+                         separators=(',', ':')).encode('ascii')
+    return b'%08x ' % (zlib.crc32(payload) & 0xffffffff) + payload + b'\n'
+
+def _decode_record(line):
+    """Return the row in a journal line, or None if the line is torn or
+    corrupt."""
+    if not line.endswith(b'\n') or len(line) < 10 or line[8:9] != b' ':
+        return None
+    payload = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(payload) & 0xffffffff:
+            return None
+        return json.loads(payload.decode('ascii'))
+    except ValueError:
+        return None
+
+def read_journal(fn):
+    """Generate the rows of complete records in journal fn, stopping at the
+    first torn or corrupt record."""
+    with open(fn, 'rb') as fh:
+        for line in fh:
+            row = _decode_record(line)
+            if row is None:
+                return
+            yield row
+
+def export_csv(fn, output, csvdialect='excel-tab'):
+    """Write the rows of journal fn to the text stream output as csv.
+    Returns the number of rows written."""
+    sink = CSVSink(output, csvdialect, flush=False)
+    n = 0
+    for row in read_journal(fn):
+        sink.write(row)
+        n += 1
+    sink.flush()
+    return n
+
+class JournalSink(object):
+    """Append result rows to a crash-safe journal with group commit.
+
+    Rows are written to the operating system immediately; fsync() is called
+    once syncevery rows are waiting, or once the oldest waiting row is
+    syncinterval seconds old, whichever comes first. syncevery=1 syncs every
+    row. Waiting rows are also synced on flush(), close() and at exit.
+
+    fn -- the journal file, created if it does not exist
+    syncevery -- sync after this many rows; None for no count limit
+        (default: 1)
+    syncinterval -- sync when the oldest unsynced row is this many seconds
+        old; None for no time limit (default: None)
+
+    recovered -- the rows which were already in the journal when it was
+        opened
+    """
+    def __init__(self, fn, syncevery=1, syncinterval=None):
+        self.fn = fn
+        self.syncevery = syncevery
+        self.syncinterval = syncinterval
+        self.recovered = self._recover()
+        self._fh = open(fn, 'ab')
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._timer = None
+        self.nsyncs = 0
+        atexit.register(self.close)
+
+    def _recover(self):
+        rows = []
+        good = 0
+        try:
+            with open(self.fn, 'rb') as fh:
+                for line in fh:
+                    row = _decode_record(line)
+                    if row is None:
+                        break
+                    rows.append(row)
+                    good += len(line)
+                fh.seek(0, os.SEEK_END)
+                size = fh.tell()
+        except IOError:
+            return rows
+        if size > good:
+            # Discard the torn tail so that new records start on a clean
+            # line; anything after a bad record can't be trusted.
+            with open(self.fn, 'r+b') as fh:
+                fh.truncate(good)
+                fh.flush()
+                os.fsync(fh.fileno())
+        return rows
+
+    def write(self, row):
+        record = _encode_record(row)
+        with self._lock:
+            self._fh.write(record)
+            self._fh.flush()
+            self._unsynced += 1
+            if self.syncevery and self._unsynced >= self.syncevery:
+                self._sync()
+            elif self.syncinterval is not None and self._timer is None:
+                self._timer = threading.Timer(self.syncinterval,
+                                              self._on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            if self._unsynced:
+                self._sync()
+
+    def _sync(self):
+        # Called with the lock held
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        os.fsync(self._fh.fileno())
+        self._unsynced = 0
+        self.nsyncs += 1
+
+    def flush(self):
+        """Make every row written so far durable."""
+        with self._lock:
+            if self._unsynced and not self._fh.closed:
+                self._sync()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if not self._fh.closed:
+                self._fh.close()
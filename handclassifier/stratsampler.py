@@ -0,0 +1,269 @@
+"""Stratified sampling of records from a directory of WARC files.
+
+A uniform sample of a crawl is nearly all HTML pages: PDFs, data files and
+pages from small hosts turn up too rarely to classify. StratifiedWarcSampler
+instead puts each candidate record in a stratum -- its MIME type, its host or
+its status code band -- and keeps a bounded reservoir of records for each
+stratum, so that up to a quota of each kind is sampled, in one pass over the
+crawl.
+
+Each record is given a key, the seeded hash of its URL (see hashsample), and
+each stratum's reservoir keeps the records with the smallest keys: a uniform
+random sample of the stratum. Reservoirs kept this way for separate WARC
+files (in separate worker processes, or from the sample cache) merge into
+exactly the reservoir of the whole crawl, and memory is bounded by the
+quotas, not the size of the crawl.
+
+Items are produced in the classifier's (url, None, code, mime) form, in
+random order, so the sampler can be passed as the items of a classifier:
+
+    sampler = StratifiedWarcSampler(dirname, 'mime',
+                                    quotas={'text/html': 200,
+                                            'application/pdf': 200},
+                                    default=50)
+
+The 'population' attribute counts the candidate records in each stratum,
+from which the sample can be reweighted to the crawl.
+
+This requires warctools ('pip install warctools').
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+from __future__ import print_function
+import re
+import heapq
+from collections import defaultdict
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+from hanzo.warctools import WarcRecord
+from .warcsampler import WarcSampler, SUCCESSCODES, payload_digest
+from .warcbackend import WarcLocation, open_warc
+from .hashsample import HashSelector
+
+_STATUS_LINE = re.compile(br'^HTTP/\S+\s+(\d{3})')
+
+def parse_http_head(payload):
+    """Return the status code and content type of the HTTP response
+    payload, reading only its header. Either is None if it can't be found.
+
+    Much cheaper than parse_http_response() for telling records apart when
+    every record needs looking at."""
+    end = payload.find(b'\r\n\r\n')
+    if end < 0:
+        end = payload.find(b'\n\n')
+    lines = (payload if end < 0 else payload[:end]).splitlines()
+    if not lines:
+        return None, None
+    match = _STATUS_LINE.match(lines[0])
+    code = int(match.group(1)) if match else None
+    mime = None
+    for line in lines[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-type':
+            mime = value.split(b';')[0].strip()
+            break
+    return code, mime
+
+def _text(s):
+    if isinstance(s, bytes) and not isinstance(s, str):
+        return s.decode('latin-1')
+    return s
+
+def stratum_of(strata, url, code, mime):
+    """The stratum of a record by strata, one of 'mime', 'host' or
+    'status' (or a function of url, code and mime), as text or None."""
+    if strata == 'mime':
+        return _text(mime).lower() if mime else None
+    if strata == 'host':
+        return urlsplit(_text(url)).hostname
+    if strata == 'status':
+        return '%dxx' % (code // 100) if code is not None else None
+    return strata(url, code, mime)
+
+def _stratify_file(task):
+    """Stratify a single WARC file. Runs in a worker process.
+
+    task -- a tuple (path, strata, quotas, default, seed, discardurls,
+        successcodes, locations, digests)
+
+    Returns a tuple (path, (reservoirs, population), rejects, error), where
+    reservoirs maps each stratum to a list of (key, item) and population
+    counts the candidates in each stratum."""
+    (path, strata, quotas, default, seed, discardurls, successcodes,
+     locations, digests) = task
+    keyof = HashSelector(1.0, seed).value
+    # Max-heaps (by negated key) of the records with the smallest keys
+    heaps = defaultdict(list)
+    population = defaultdict(int)
+    rejects = defaultdict(int)
+    error = None
+    n = 0
+    wf = open_warc(path) if locations else WarcRecord.open_archive(path,
+                                                                   mode='rb')
+    try:
+        for offset, record, errors in wf.read_records(limit=None):
+            if not record:
+                if errors:
+                    raise Exception("Errors while decoding %s" %
+                                    ",".join(str(e) for e in errors))
+                break
+            if not record.type in [WarcRecord.RESPONSE,
+                                   WarcRecord.RESOURCE,
+                                   WarcRecord.CONVERSION]:
+                continue
+            if record.url.startswith(discardurls):
+                rejects['discardurls'] += 1
+                continue
+            if (record.type == WarcRecord.RESPONSE
+                    and record.url.startswith(b'http')):
+                ccode, cmime = parse_http_head(record.content[1])
+                if successcodes is not None and ccode not in successcodes:
+                    rejects['status'] += 1
+                    continue
+            else:
+                ccode = None
+                cmime = record.content[0]
+            stratum = stratum_of(strata, record.url, ccode, cmime)
+            population[stratum] += 1
+            quota = quotas.get(stratum, default)
+            if not quota:
+                continue
+            key = keyof(record.url)
+            heap = heaps[stratum]
+            if len(heap) >= quota and key >= -heap[0][0]:
+                continue
+            content = WarcLocation(path, offset) if locations else None
+            item = (record.url, content, ccode, cmime)
+            if digests:
+                item += (payload_digest(record),)
+            n += 1
+            entry = (-key, -n, item)
+            if len(heap) < quota:
+                heapq.heappush(heap, entry)
+            else:
+                heapq.heapreplace(heap, entry)
+    except IOError as e:
+        error = str(e)
+    finally:
+        wf.close()
+    reservoirs = dict((stratum, [(-negkey, item) for negkey, _, item in heap])
+                      for stratum, heap in heaps.items())
+    return path, (reservoirs, dict(population)), dict(rejects), error
+
+def _order(entry):
+    key, item = entry
+    # Ties are the same URL captured more than once
+    return (key, item[0], repr(item[2:]))
+
+class StratifiedWarcSampler(WarcSampler):
+    """Sample up to a quota of response, resource and conversion records of
+    each stratum from a directory of WARC files, using a pool of worker
+    processes.
+
+    Iterating over the sampler yields (url, None, code, mime) tuples in
+    random order, once every file has been read. A given seed always gives
+    the same sample, however the files are split between processes or
+    directories.
+
+    dirname -- the directory containing .warc.gz files
+    strata -- how records are stratified: 'mime' (by lower case MIME type),
+        'host' (by URL host name), 'status' (by status code band, such as
+        '2xx'), or a function taking url, code and mime and returning a
+        stratum, which must be defined at module level so it can be sent
+        to the worker processes. Records with no MIME type or status code
+        are in stratum None.
+    quotas -- a dict of the maximum number of records to sample from each
+        stratum (default: {})
+    default -- the quota for strata not in quotas (default: 100)
+    seed -- the random seed (default: 1818118181)
+    discardurls -- a tuple of URL prefixes to reject (default: ())
+    successcodes -- HTTP status codes which may be selected, or None for
+        any (default: SUCCESSCODES)
+    processes -- number of worker processes; None uses all available cores
+        and 1 samples in this process (default: None)
+    locations -- give each item's location in its WARC file as its content
+        (default: False)
+    digests -- add each item's payload digest as a fifth field (default:
+        False)
+    cache -- a directory in which to cache the reservoirs of each file, so
+        only new or changed files are read on later runs (default: None)
+    debug -- a text output stream for printing progress (default: None)
+
+    Each worker holds at most the quota of records for each stratum it has
+    seen, as does the merged sample, so with quotas for a few strata and
+    default=0 memory is bounded by the total quota. (With default set,
+    stratifying by host holds up to default records per host.)
+
+    'population' counts the candidate records of each stratum, and
+    'rejects' the records not sampled, by reason.
+    """
+    def __init__(self, dirname, strata='mime', quotas=None, default=100,
+                 seed=1818118181, discardurls=(), successcodes=SUCCESSCODES,
+                 processes=None, locations=False, digests=False, cache=None,
+                 debug=None):
+        super(StratifiedWarcSampler, self).__init__(
+            dirname, None, seed=seed, discardurls=discardurls,
+            successcodes=() if successcodes is None else successcodes,
+            processes=processes, locations=locations, digests=digests,
+            cache=cache, debug=debug)
+        if successcodes is None:
+            self.successcodes = None
+        self.strata = strata
+        self.quotas = dict(quotas or {})
+        self.default = default
+        self.population = defaultdict(int)
+
+    _worker = staticmethod(_stratify_file)
+
+    def _tasks(self):
+        # warctools gives URLs as bytes
+        discardurls = tuple(u.encode('utf-8') if not isinstance(u, bytes)
+                            else u for u in self.discardurls)
+        return [(fn, self.strata, self.quotas, self.default, self.seed,
+                 discardurls, self.successcodes, self.locations,
+                 self.digests) for fn in self.files()]
+
+    def __iter__(self):
+        self.nscanned = self.ncached = 0
+        self.rejects = defaultdict(int)
+        self.population = defaultdict(int)
+        reservoirs = defaultdict(list)
+        for fn, (fileres, population), rejects, error in self._results():
+            print(fn, sum(population.values()), "candidates",
+                  file=self._debug)
+            if error:
+                print(fn, error, file=self._debug)
+                self.rejects['ioerror'] += 1
+            for k, v in rejects.items():
+                self.rejects[k] += v
+            for stratum, n in population.items():
+                self.population[stratum] += n
+            for stratum, entries in fileres.items():
+                quota = self.quotas.get(stratum, self.default)
+                # Keep the reservoir to the quota as files come in
+                reservoirs[stratum] = heapq.nsmallest(
+                    quota, reservoirs[stratum] + entries, key=_order)
+        entries = []
+        for stratum, reservoir in reservoirs.items():
+            print(stratum, len(reservoir), "of", self.population[stratum],
+                  "selected", file=self._debug)
+            entries.extend(reservoir)
+        self.rejects['not sampled'] += (sum(self.population.values()) -
+                                        len(entries))
+        for _, item in sorted(entries, key=_order):
+            yield item
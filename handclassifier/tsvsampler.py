@@ -0,0 +1,300 @@
+"""Skip-ahead random sampling of rows from very large delimited text files.
+
+Taking a tiny proportion of rows from a file with millions of lines by
+drawing a random number for, and csv-parsing, every row spends nearly all of
+its time on rows which are thrown away. TSVSampler instead draws geometric
+skip distances between the selected rows, so the cost of choosing a sample is
+proportional to the size of the sample. The file is memory-mapped and only
+the selected lines are read and parsed.
+
+Finding the start of line n needs an index of line offsets. This is built by
+a single scan the first time a file is sampled and saved alongside it, so
+later runs (with any proportion or seed) only touch the index entries and
+lines which are actually selected. The index is rebuilt automatically if the
+data file's size or modification time change.
+
+With selection='hash', rows are instead selected by a seeded hash of their
+key field (see hashsample). Every line must then be read, but whether a row
+is selected no longer depends on its line number, so a file split into
+shards (on different machines, say) gives the same sample as the whole.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+from __future__ import print_function
+import os
+import sys
+import csv
+import math
+import mmap
+import array
+import random
+import struct
+
+from .hashsample import HashSelector
+
+# Index file layout: magic, data file size, data file mtime (ns), number of
+# lines, followed by one little-endian uint64 start offset per line.
+_INDEX_MAGIC = b'HCLIDX01'
+_INDEX_HEADER = struct.Struct('<8sQQQ')
+_OFFSET = struct.Struct('<Q')
+
+def geometric_skips(proptoclassify, seed):
+    """Generate the (0-based) positions selected by independently keeping
+    each position with probability proptoclassify.
+
+    Rather than drawing for every position, draws the number of positions to
+    skip before the next selection from the geometric distribution. The
+    generator is infinite; the caller stops when it passes the end of the
+    data.
+
+    proptoclassify -- the selection probability
+    seed -- the random seed
+    """
+    if proptoclassify <= 0:
+        return
+    r = random.Random(seed)
+    pos = -1
+    if proptoclassify >= 1:
+        while True:
+            pos += 1
+            yield pos
+    logq = math.log(1.0 - proptoclassify)
+    while True:
+        # 1.0 - random() is in (0, 1], so log() is always defined
+        pos += 1 + int(math.log(1.0 - r.random()) / logq)
+        yield pos
+
+class LineIndex(object):
+    """A persistent index of the byte offset at which each line of a file
+    starts.
+
+    fn -- the data file
+    indexfn -- where to keep the index (default: fn + '.idx')
+    debug -- a text output stream for printing progress (default: None)
+    """
+    def __init__(self, fn, indexfn=None, debug=None):
+        self.fn = fn
+        self.indexfn = indexfn if indexfn else fn+'.idx'
+        if debug:
+            self._debug = debug
+        else:
+            self._debug = open(os.devnull, 'w')
+        self._fh = None
+        self._mm = None
+        self.nlines = 0
+        self.open()
+
+    def _stamp(self):
+        st = os.stat(self.fn)
+        mtime = getattr(st, 'st_mtime_ns', int(st.st_mtime * 1e9))
+        return st.st_size, mtime
+
+    def _valid(self, size, mtime):
+        try:
+            with open(self.indexfn, 'rb') as fh:
+                header = fh.read(_INDEX_HEADER.size)
+            magic, isize, imtime, nlines = _INDEX_HEADER.unpack(header)
+        except (IOError, OSError, struct.error):
+            return False
+        if (magic, isize, imtime) != (_INDEX_MAGIC, size, mtime):
+            return False
+        expected = _INDEX_HEADER.size + nlines * _OFFSET.size
+        return os.path.getsize(self.indexfn) == expected
+
+    def build(self):
+        """Scan the data file and (re)write the index."""
+        size, mtime = self._stamp()
+        print("Building line index for", self.fn, file=self._debug)
+        tmpfn = self.indexfn+'.tmp'
+        nlines = 0
+        with open(tmpfn, 'wb') as out:
+            out.write(_INDEX_HEADER.pack(_INDEX_MAGIC, size, mtime, 0))
+            if size:
+                with open(self.fn, 'rb') as fh:
+                    mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+                    try:
+                        offsets = array.array('Q')
+                        pos = 0
+                        while pos < size:
+                            offsets.append(pos)
+                            nl = mm.find(b'\n', pos)
+                            pos = size if nl < 0 else nl+1
+                            if len(offsets) >= 65536:
+                                nlines += len(offsets)
+                                self._write_offsets(out, offsets)
+                                offsets = array.array('Q')
+                        nlines += len(offsets)
+                        self._write_offsets(out, offsets)
+                    finally:
+                        mm.close()
+            out.seek(0)
+            out.write(_INDEX_HEADER.pack(_INDEX_MAGIC, size, mtime, nlines))
+        getattr(os, 'replace', os.rename)(tmpfn, self.indexfn)
+        print(nlines, "lines indexed", file=self._debug)
+
+    @staticmethod
+    def _write_offsets(out, offsets):
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        out.write(offsets.tostring() if sys.version_info < (3,)
+                  else offsets.tobytes())
+
+    def open(self):
+        """Open the index, building it first if it is missing or stale."""
+        self.close()
+        if not self._valid(*self._stamp()):
+            self.build()
+        self._fh = open(self.indexfn, 'rb')
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self.nlines = _INDEX_HEADER.unpack_from(self._mm, 0)[3]
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._fh.close()
+            self._mm = self._fh = None
+
+    def __len__(self):
+        return self.nlines
+
+    def offset(self, n):
+        """Return the byte offset of the start of line n (0-based)."""
+        if not 0 <= n < self.nlines:
+            raise IndexError("line index out of range")
+        return _OFFSET.unpack_from(self._mm,
+                                   _INDEX_HEADER.size+n*_OFFSET.size)[0]
+
+class TSVSampler(object):
+    """Randomly sample rows from a large delimited file without reading the
+    rest of it.
+
+    Each row is selected independently with probability proptoclassify, as
+    if r.random() had been drawn for every row, but only the selected rows
+    are touched. The sample is reproducible for a given seed and proportion.
+    positions() and sample() also take selection='hash', to select rows by
+    a seeded hash of their key field instead.
+
+    fn -- the data file
+    indexfn -- where to keep the line index (default: fn + '.idx')
+    dialect -- the csv dialect of the file (default: excel-tab)
+    encoding -- text encoding of the file (Python 3 only) (default: utf-8)
+    debug -- a text output stream for printing progress (default: None)
+    """
+    def __init__(self, fn, indexfn=None, dialect='excel-tab',
+                 encoding='utf-8', debug=None):
+        self.fn = fn
+        self.dialect = dialect
+        self.encoding = encoding
+        self.index = LineIndex(fn, indexfn, debug=debug)
+        self._fh = open(fn, 'rb')
+        if len(self.index):
+            self._mm = mmap.mmap(self._fh.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        else:
+            # Can't mmap an empty file
+            self._mm = b''
+
+    def close(self):
+        if not isinstance(self._mm, bytes):
+            self._mm.close()
+        self._fh.close()
+        self.index.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def line(self, n):
+        """Return the raw text of line n (0-based), without its line
+        ending."""
+        start = self.index.offset(n)
+        if n+1 < len(self.index):
+            end = self.index.offset(n+1)
+        else:
+            end = len(self._mm)
+        line = self._mm[start:end].rstrip(b'\r\n')
+        if sys.version_info >= (3,):
+            line = line.decode(self.encoding)
+        return line
+
+    def row(self, n):
+        """Return line n (0-based) parsed as a list of fields."""
+        return next(csv.reader([self.line(n)], dialect=self.dialect))
+
+    def _key(self, line, field, delimiter, quotechar):
+        """The raw bytes of field of line, parsing it as csv only if it has
+        quoting."""
+        if quotechar in line:
+            if sys.version_info >= (3,):
+                line = line.decode(self.encoding)
+            row = next(csv.reader([line], dialect=self.dialect))
+            value = row[field] if field < len(row) else ''
+            if sys.version_info >= (3,):
+                value = value.encode(self.encoding)
+            return value
+        fields = line.split(delimiter, field+1)
+        return fields[field] if field < len(fields) else b''
+
+    def hash_positions(self, proptoclassify, seed=1818118181, field=0):
+        """Return the sorted list of line numbers whose key field is
+        selected by a seeded hash. Reads every line."""
+        selected = HashSelector(proptoclassify, seed)
+        dialect = csv.get_dialect(self.dialect) if isinstance(
+            self.dialect, str) else self.dialect
+        delimiter = dialect.delimiter.encode('ascii')
+        quotechar = (dialect.quotechar or '"').encode('ascii')
+        positions = []
+        mm = self._mm
+        size = len(mm)
+        pos = 0
+        n = 0
+        while pos < size:
+            nl = mm.find(b'\n', pos)
+            end = size if nl < 0 else nl+1
+            key = self._key(mm[pos:end].rstrip(b'\r\n'), field, delimiter,
+                            quotechar)
+            if selected(key):
+                positions.append(n)
+            pos = end
+            n += 1
+        return positions
+
+    def positions(self, proptoclassify, seed=1818118181, selection='skip',
+                  field=0):
+        """Return the sorted list of selected line numbers.
+
+        selection -- 'skip' to select by line number, touching only the
+            selected lines, or 'hash' to select by a seeded hash of each
+            line's key field (default: 'skip')
+        field -- the key field for selection='hash' (default: 0)
+        """
+        if selection == 'hash':
+            return self.hash_positions(proptoclassify, seed, field)
+        if selection != 'skip':
+            raise ValueError("Unknown selection: %r" % (selection,))
+        nlines = len(self.index)
+        selected = []
+        for pos in geometric_skips(proptoclassify, seed):
+            if pos >= nlines:
+                break
+            selected.append(pos)
+        return selected
+
+    def sample(self, proptoclassify, seed=1818118181, selection='skip',
+               field=0):
+        """Return the selected rows, in file order, as lists of fields.
+        selection and field are as for positions()."""
+        return [self.row(n) for n in self.positions(proptoclassify, seed,
+                                                     selection, field)]
@@ -0,0 +1,185 @@
+"""Reading the content of sampled records straight from WARC files.
+
+A WarcSampler made with locations=True puts a WarcLocation -- the WARC file
+and the offset of the record's gzip member within it -- in place of each
+item's content. WarcBackend seeks to that member, reads the one record and
+decodes its HTTP response, so content is read only when an item is about
+to be shown and nothing but the locations is held in memory.
+ManualWarcClassifierSingle shows it in the system web browser, with no
+Wayback installation needed.
+
+This needs warctools ('pip install warctools'), which is imported when the
+backend is made.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+import os
+import zlib
+from collections import namedtuple
+
+# Where a record is: the WARC file, and the offset of its gzip member
+WarcLocation = namedtuple('WarcLocation', ['filename', 'offset'])
+
+_GZIP_MAGIC = b'\x1f\x8b'
+
+class _GzipMembers(object):
+    """A readable file object over the decompressed contents of a file of
+    concatenated gzip members, whose tell() is the offset in the raw file
+    of the member holding the next byte to be read.
+
+    warctools finds member offsets through a hook into gzip internals which
+    Python 3's gzip module no longer has, so its offsets are all None there.
+    Given one of these, as an uncompressed stream, it records tell() before
+    each record, which is then the offset of the record's member."""
+    def __init__(self, fh, chunksize=65536):
+        self.fh = fh
+        self.chunksize = chunksize
+        self._raw = fh.tell()
+        self._input = b''
+        self._z = None
+        self._member = self._raw
+        self._buf = b''
+        self._pos = 0
+
+    def _fill(self):
+        """Refill the buffer from the current (or the next) member; False
+        at the end of the file."""
+        self._buf = b''
+        self._pos = 0
+        while not self._buf:
+            if not self._input:
+                self._input = self.fh.read(self.chunksize)
+                self._raw += len(self._input)
+                if not self._input:
+                    return False
+            if self._z is None:
+                self._member = self._raw - len(self._input)
+                self._z = zlib.decompressobj(16+zlib.MAX_WBITS)
+            self._buf = self._z.decompress(self._input)
+            if self._z.eof:
+                self._input = self._z.unused_data
+                self._z = None
+            else:
+                self._input = b''
+        return True
+
+    def tell(self):
+        if self._pos >= len(self._buf) and not self._fill():
+            return self._raw
+        return self._member
+
+    def read(self, size=-1):
+        parts = []
+        while size is None or size < 0 or size > 0:
+            if self._pos >= len(self._buf) and not self._fill():
+                break
+            end = (len(self._buf) if size is None or size < 0
+                   else min(len(self._buf), self._pos+size))
+            parts.append(self._buf[self._pos:end])
+            if size is not None and size >= 0:
+                size -= end - self._pos
+            self._pos = end
+        return b''.join(parts)
+
+    def readline(self, size=-1):
+        parts = []
+        while size is None or size < 0 or size > 0:
+            if self._pos >= len(self._buf) and not self._fill():
+                break
+            end = self._buf.find(b'\n', self._pos)
+            end = len(self._buf) if end < 0 else end+1
+            if size is not None and size >= 0:
+                end = min(end, self._pos+size)
+                size -= end - self._pos
+            parts.append(self._buf[self._pos:end])
+            newline = self._buf[end-1:end] == b'\n'
+            self._pos = end
+            if newline:
+                break
+        return b''.join(parts)
+
+    def close(self):
+        self.fh.close()
+
+def open_warc(path):
+    """Open the WARC file path for reading with warctools, so that the
+    offsets given by read_records() are those of each record (its gzip
+    member, for compressed files), as WarcBackend needs."""
+    from hanzo.warctools import WarcRecord
+    fh = open(path, 'rb')
+    try:
+        gzipped = fh.read(2) == _GZIP_MAGIC
+        fh.seek(0)
+        if gzipped:
+            fh = _GzipMembers(fh)
+        return WarcRecord.open_archive(file_handle=fh, gzip=None,
+                                       mode='rb')
+    except Exception:
+        fh.close()
+        raise
+
+def _text(s):
+    if isinstance(s, bytes) and not isinstance(s, str):
+        return s.decode('latin-1')
+    return s
+
+class WarcBackend(object):
+    """Read records by location from WARC files.
+
+    dirname -- if given, look for the WARC files in this directory rather
+        than where they were when sampled (default: None)
+    """
+    def __init__(self, dirname=None):
+        from hanzo.warctools import WarcRecord
+        self._WarcRecord = WarcRecord
+        self.dirname = dirname
+
+    def path(self, location):
+        if self.dirname is None:
+            return location.filename
+        return os.path.join(self.dirname, os.path.basename(location.filename))
+
+    def record(self, location):
+        """Return the WarcRecord at location."""
+        wf = self._WarcRecord.open_archive(self.path(location),
+                                           offset=location.offset, mode='rb')
+        try:
+            for _, record, errors in wf.read_records(limit=1):
+                if record is None:
+                    raise IOError("Unable to read record at %s:%d: %s" %
+                                  (location.filename, location.offset,
+                                   ', '.join(str(e) for e in errors)))
+                # Read the content before the file is closed
+                record.content
+                return record
+        finally:
+            wf.close()
+
+    def get(self, location):
+        """Return (code, mime, body) of the record at location. code is None
+        for records other than HTTP responses; body is bytes."""
+        from .warcsampler import parse_http_response
+        record = self.record(location)
+        if (record.type == self._WarcRecord.RESPONSE
+                and record.url.startswith(b'http')):
+            with open(os.devnull, 'w') as devnull:
+                code, mime, body = parse_http_response(record, debug=devnull)
+        else:
+            code = None
+            mime, body = record.content
+        if mime is not None:
+            mime = _text(mime).split(';')[0].strip()
+        return code, mime, body
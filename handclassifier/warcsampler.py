@@ -0,0 +1,360 @@
+"""Parallel sampling of records from a directory of WARC files.
+
+Reading a large crawl serially through WarcRecord.open_archive and parsing
+the HTTP payload of every response record is slow. WarcSampler hands each
+WARC file to a worker in a process pool, applies the cheap tests (record type,
+discarded URL prefixes and the sampling decision) before touching the HTTP
+payload, and streams the selected items back to the caller as each file is
+finished.
+
+Items are produced in the (url, None, code, mime) form expected by the
+Wayback classifiers, so the sampler can be passed more or less directly to
+ManualWaybackClassifierSingle. With locations=True, each item's content is
+instead a warcbackend.WarcLocation from which ManualWarcClassifierSingle
+reads the record when it is shown. With digests=True, each item has a fifth
+field, its payload digest, by which payloads.PayloadGroups groups items with
+the same content.
+
+With selection='hash', each record is selected by a seeded hash of its URL
+(see hashsample) rather than by a random draw, so directories of WARC files
+sampled separately, perhaps on different machines, select exactly what one
+run over all of them would.
+
+Given a cache directory, the selection from each WARC file is stored there,
+keyed by the file's path, size and modification time and the sampling
+parameters. A rerun then only reads the WARC files which are new or have
+changed since they were last sampled, and the sample is the same as if every
+file had been read again.
+
+This requires warctools ('pip install warctools').
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+from __future__ import print_function
+import os
+import sys
+import random
+import hashlib
+import multiprocessing
+from collections import defaultdict
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+from hanzo.warctools import WarcRecord
+from hanzo.httptools import RequestMessage, ResponseMessage
+from .warcbackend import WarcLocation, open_warc
+from .hashsample import HashSelector
+from .payloads import body_digest
+
+# HTTP status codes which represent a record successfully returned
+SUCCESSCODES = (200, 201, 202, 203, 206)
+
+def parse_http_response(record, debug=sys.stdout):
+    """Parses the payload of an HTTP 'response' record, returning code,
+    content type and body.
+
+    Adapted from github's internetarchive/warctools hanzo/warcfilter.py,
+    commit 1850f328e31e505569126b4739cec62ffa444223. MIT licenced."""
+    message = ResponseMessage(RequestMessage())
+    remainder = message.feed(record.content[1])
+    message.close()
+    if remainder or not message.complete():
+        if remainder:
+            print('trailing data in http response for', record.url,
+                  file=debug)
+        if not message.complete():
+            print('truncated http response for', record.url, file=debug)
+    header = message.header
+
+    mime_type = [v for k,v in header.headers if k.lower() == b'content-type']
+    if mime_type:
+        mime_type = mime_type[0].split(b';')[0]
+    else:
+        mime_type = None
+
+    return header.code, mime_type, message.get_body()
+
+def payload_digest(record, body=None):
+    """The record's WARC-Payload-Digest or, if it has none, the digest of
+    its payload (body, if it has already been parsed out), as a native
+    string so it is written to the output as it is."""
+    digest = record.get_header(WarcRecord.PAYLOAD_DIGEST)
+    if not digest:
+        if body is None:
+            if (record.type == WarcRecord.RESPONSE
+                    and record.url.startswith(b'http')):
+                with open(os.devnull, 'w') as devnull:
+                    body = parse_http_response(record, debug=devnull)[2]
+            else:
+                body = record.content[1]
+        digest = body_digest(body)
+    if not isinstance(digest, str):
+        digest = digest.decode('ascii')
+    return digest
+
+def file_seed(seed, fn):
+    """Derive a per-file random seed from the sampler seed and the file's
+    base name, so that the selection from each file does not depend on the
+    order in which files are processed."""
+    key = (str(seed)+':'+os.path.basename(fn)).encode('utf-8')
+    return int(hashlib.md5(key).hexdigest(), 16)
+
+class SampleCache(object):
+    """A directory of per-file sampling results.
+
+    Each source file has one cache file, named from its path, holding the
+    key it was sampled under and the result. A result is only returned for
+    the same key, so changing the file or the sampling parameters makes its
+    entry stale; it is then replaced when the file is sampled again.
+
+    dirname -- the cache directory, created if need be
+    """
+    # Bump when the format of cached results changes
+    VERSION = 1
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+    def key(self, path, *params):
+        """The key for sampling path with params: changes if the file is
+        replaced or modified, or the parameters change."""
+        st = os.stat(path)
+        return ((self.VERSION, os.path.abspath(path), st.st_size,
+                 st.st_mtime) + tuple(params))
+
+    def path(self, path):
+        """The cache file for source file path."""
+        h = hashlib.md5(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(self.dirname,
+                            os.path.basename(path)+'.'+h[:16]+'.sample')
+
+    def get(self, key):
+        """Return the result cached under key, or None."""
+        try:
+            with open(self.path(key[1]), 'rb') as fh:
+                cachedkey, result = pickle.load(fh)
+        except (IOError, OSError, EOFError, ValueError, TypeError,
+                pickle.UnpicklingError):
+            return None
+        return result if cachedkey == key else None
+
+    def put(self, key, result):
+        """Cache result under key, replacing any earlier entry."""
+        fn = self.path(key[1])
+        tmpfn = fn+'.tmp'
+        with open(tmpfn, 'wb') as out:
+            pickle.dump((key, result), out, 2)
+        getattr(os, 'replace', os.rename)(tmpfn, fn)
+
+def _sample_file(task):
+    """Sample a single WARC file. Runs in a worker process.
+
+    task -- a tuple (path, proptoclassify, seed, discardurls, successcodes,
+        locations, selection, digests)
+
+    Returns a tuple (path, items, rejects, error) where error is None or
+    the text of an IOError raised while reading the file."""
+    (path, proptoclassify, seed, discardurls, successcodes, locations,
+     selection, digests) = task
+    if selection == 'hash':
+        selected = HashSelector(proptoclassify, seed)
+    else:
+        r = random.Random(file_seed(seed, path))
+        selected = lambda url: r.random() <= proptoclassify
+    items = []
+    rejects = defaultdict(int)
+    error = None
+    if locations:
+        wf = open_warc(path)
+    else:
+        wf = WarcRecord.open_archive(path, mode='rb')
+    try:
+        for offset, record, errors in wf.read_records(limit=None):
+            if not record:
+                if errors:
+                    raise Exception("Errors while decoding %s" %
+                                    ",".join(str(e) for e in errors))
+                break
+            if not record.type in [WarcRecord.RESPONSE,
+                                   WarcRecord.RESOURCE,
+                                   WarcRecord.CONVERSION]:
+                continue
+            if record.url.startswith(discardurls):
+                rejects['discardurls'] += 1
+                continue
+            # Draw for every candidate record, so the selection is
+            # unaffected by the status codes of other records.
+            if not selected(record.url):
+                rejects['not sampled'] += 1
+                continue
+            if (record.type == WarcRecord.RESPONSE
+                    and record.url.startswith(b'http')):
+                ccode, cmime, body = parse_http_response(record,
+                                                         debug=sys.stderr)
+                if ccode not in successcodes:
+                    rejects['status'] += 1
+                    continue
+            else:
+                ccode = None
+                cmime, body = record.content
+            content = WarcLocation(path, offset) if locations else None
+            if digests:
+                items.append((record.url, content, ccode, cmime,
+                              payload_digest(record, body)))
+            else:
+                items.append((record.url, content, ccode, cmime))
+    except IOError as e:
+        error = str(e)
+    finally:
+        wf.close()
+    return path, items, dict(rejects), error
+
+class WarcSampler(object):
+    """Randomly sample response, resource and conversion records from a
+    directory of WARC files using a pool of worker processes.
+
+    Iterating over the sampler yields (url, None, code, mime) tuples. The
+    'rejects' attribute counts the records which were not selected, by
+    reason, in the latest pass, and is updated as each file's results
+    arrive.
+
+    Files are processed in sorted order and each file has its own random
+    stream derived from the seed, so a given seed always produces the same
+    sample regardless of the number of processes. With selection='hash',
+    the selection of each record depends only on its URL and the seed.
+
+    dirname -- the directory containing .warc.gz files
+    proptoclassify -- the proportion of candidate records to select
+    seed -- the random seed (default: 1818118181)
+    discardurls -- a tuple of URL prefixes to reject (default: ())
+    successcodes -- HTTP status codes which may be selected (default:
+        SUCCESSCODES)
+    processes -- number of worker processes; None uses all available cores
+        and 1 samples in this process (default: None)
+    locations -- give each item's location in its WARC file as its content
+        (default: False)
+    digests -- add each item's payload digest as a fifth field (default:
+        False)
+    selection -- 'random' to draw from each file's random stream, or 'hash'
+        to select by a seeded hash of each URL, independent of which file
+        the record is in or the order of the records (default: 'random')
+    cache -- a directory in which to cache the selection from each file,
+        so only new or changed files are read on later runs (default: None)
+    debug -- a text output stream for printing progress (default: None)
+
+    'nscanned' and 'ncached' count the files read and taken from the cache.
+    """
+    def __init__(self, dirname, proptoclassify, seed=1818118181,
+                 discardurls=(), successcodes=SUCCESSCODES, processes=None,
+                 locations=False, selection='random', digests=False,
+                 cache=None, debug=None):
+        if selection not in ('random', 'hash'):
+            raise ValueError("Unknown selection: %r" % (selection,))
+        self.dirname = dirname
+        self.proptoclassify = proptoclassify
+        self.seed = seed
+        self.discardurls = tuple(discardurls)
+        self.successcodes = tuple(successcodes)
+        self.processes = processes
+        self.locations = locations
+        self.selection = selection
+        self.digests = digests
+        self.cache = SampleCache(cache) if cache else None
+        self.rejects = defaultdict(int)
+        self.nscanned = 0
+        self.ncached = 0
+
+        if debug:
+            self._debug = debug
+        else:
+            self._debug = open(os.devnull, 'w')
+
+    def files(self):
+        """Return the sorted list of WARC file paths to be sampled."""
+        return [os.path.join(self.dirname, fn)
+                for fn in sorted(os.listdir(self.dirname))
+                if fn.endswith('.warc.gz')]
+
+    def _tasks(self):
+        # warctools gives URLs as bytes
+        discardurls = tuple(u.encode('utf-8') if not isinstance(u, bytes)
+                            else u for u in self.discardurls)
+        return [(fn, self.proptoclassify, self.seed, discardurls,
+                 self.successcodes, self.locations, self.selection,
+                 self.digests) for fn in self.files()]
+
+    # Samples one file, in a worker process
+    _worker = staticmethod(_sample_file)
+
+    def _scan(self, tasks):
+        if self.processes == 1:
+            for task in tasks:
+                yield self._worker(task)
+            return
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            # imap keeps the file order, but still returns each file as soon
+            # as it and its predecessors are done
+            for result in pool.imap(self._worker, tasks):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _results(self):
+        tasks = self._tasks()
+        if self.cache is None:
+            for result in self._scan(tasks):
+                self.nscanned += 1
+                yield result
+            return
+        keys = [self.cache.key(task[0], *task[1:]) for task in tasks]
+        cached = [self.cache.get(key) for key in keys]
+        scanned = self._scan([task for task, result in zip(tasks, cached)
+                              if result is None])
+        # Merge in file order, whichever files were read this time
+        for key, result in zip(keys, cached):
+            if result is not None:
+                self.ncached += 1
+                yield result
+                continue
+            result = next(scanned)
+            self.nscanned += 1
+            if result[3] is None:
+                # Don't keep failures, which may be transient
+                self.cache.put(key, result)
+            yield result
+
+    def __iter__(self):
+        self.nscanned = self.ncached = 0
+        self.rejects = defaultdict(int)
+        for fn, items, rejects, error in self._results():
+            print(fn, len(items), "selected", file=self._debug)
+            if error:
+                print(fn, error, file=self._debug)
+                self.rejects['ioerror'] += 1
+            for k, v in rejects.items():
+                self.rejects[k] += v
+            for item in items:
+                yield item
+
+    def sample(self):
+        """Run the sampler to completion and return a list of items."""
+        return list(self)
@@ -0,0 +1,345 @@
+"""A web frontend for hand classification, for headless machines.
+
+WebFrontend serves classification pages over HTTP from a single asyncio
+event loop, so annotators can work in their own browsers while one process
+on a server (with no display) runs the sessions. Each annotator, identified
+by the first part of the URL path (http://host:port/alice/), gets their own
+engine.ClassificationEngine, made on their first visit by a factory function.
+With a coordinator.Coordinator behind it, annotators share out one sample:
+
+    coord = Coordinator('sample.db')
+    def session(annotator):
+        return ClassificationEngine(coord.items_for(annotator),
+                                    labels=['Yes', 'No'],
+                                    sink=CoordinatorSink(coord, annotator))
+    WebFrontend(session, host='0.0.0.0', port=8000).run()
+
+Each annotator's engine is made and called in a thread of its own, so a
+slow item for one annotator does not hold up the others, and engines may
+hold objects (such as SQLite connections) tied to one thread.
+
+Pages are rendered from each item's identifier and text; subclass WebFrontend
+and override render_item() to show something else. GET /alice/item.json
+returns the current item as JSON for other clients, which classify by
+POSTing the label's index (and optionally the item's position, to guard
+against submitting twice) to /alice/classify as a form.
+
+There is no authentication: bind to the loopback interface or put the
+server behind something which provides it.
+
+This needs Python 3.
+
+Copyright 2013-2017, Tom Nicholls and Jonathan Bright
+contact: tom.nicholls@oii.ox.ac.uk
+
+This work is available under the terms of the GNU General Purpose Licence
+This program is free software: you can redistribute it and/or modify
+it under the terms of version 2 of the GNU General Public License as published
+by the Free Software Foundation.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+import re
+import json
+import html
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs, quote
+
+_ANNOTATOR = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+_REASONS = {200: 'OK', 303: 'See Other', 400: 'Bad Request',
+            404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>%(title)s</title>
+<style>
+body { font-family: sans-serif; margin: 1em; }
+.items { display: flex; gap: 1em; }
+.item { flex: 1; min-width: 0; }
+.text { white-space: pre-wrap; border: 1px solid #ccc; padding: 0.5em;
+        max-height: 75vh; overflow: auto; }
+form button { margin: 0.2em; font-size: 1.1em; }
+</style></head>
+<body>%(body)s</body></html>
+"""
+
+def _text(s):
+    if isinstance(s, bytes):
+        return s.decode('utf-8', 'replace')
+    return '' if s is None else str(s)
+
+def _jsonable(obj):
+    if isinstance(obj, bytes):
+        return obj.decode('utf-8', 'replace')
+    return str(obj)
+
+class HTTPError(Exception):
+    def __init__(self, status, message=''):
+        super(HTTPError, self).__init__(message)
+        self.status = status
+
+class _Session(object):
+    """An annotator's engine, with the thread which all calls on it use
+    (so it may hold objects, such as SQLite connections, which can only be
+    used from one thread)."""
+    def __init__(self, factory, annotator):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.lock = asyncio.Lock()
+        self.started = False
+        self.engine = None
+        self._created = self.call(factory, annotator)
+
+    def call(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self.executor, partial(func, *args))
+
+    async def ready(self):
+        if self.engine is None:
+            self.engine = await self._created
+        return self
+
+class WebFrontend(object):
+    """Serve hand classification to remote annotators' web browsers.
+
+    factory -- a function taking an annotator's name and returning a
+        ClassificationEngine for their session
+    host -- the address to listen on (default: 127.0.0.1)
+    port -- the port to listen on (default: 8000)
+    maxbody -- the largest request body accepted, in bytes (default: 65536)
+    """
+    def __init__(self, factory, host='127.0.0.1', port=8000, maxbody=65536):
+        self.factory = factory
+        self.host = host
+        self.port = port
+        self.maxbody = maxbody
+        self._sessions = {}
+        self._server = None
+
+    async def start(self):
+        """Start listening; the server then runs with the event loop."""
+        self._server = await asyncio.start_server(self._handle, self.host,
+                                                  self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Stop listening and finish every session."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for session in self._sessions.values():
+            async with session.lock:
+                if session.engine is not None:
+                    await session.call(session.engine.finish)
+            session.executor.shutdown(wait=False)
+
+    def run(self):
+        """Serve until interrupted."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(self.start())
+        print("Serving on http://%s:%d/" % (self.host, self.port))
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.run_until_complete(self.stop())
+            loop.close()
+
+    async def session(self, annotator):
+        """Return annotator's session, starting it if need be."""
+        if annotator not in self._sessions:
+            self._sessions[annotator] = _Session(self.factory, annotator)
+        session = self._sessions[annotator]
+        try:
+            return await session.ready()
+        except Exception:
+            # Let the next request try again
+            if self._sessions.get(annotator) is session:
+                del self._sessions[annotator]
+                session.executor.shutdown(wait=False)
+            raise
+
+    async def _current(self, session):
+        """Return the session's current item (None if finished), moving on
+        to the first one on the first visit. Call with the lock held."""
+        engine = session.engine
+        if not session.started:
+            await session.call(engine.next)
+            session.started = True
+        if engine.item is not None:
+            engine.shown()
+        return engine.item
+
+    async def _handle(self, reader, writer):
+        try:
+            try:
+                method, target, form = await self._read_request(reader)
+                status, ctype, body, headers = await self._route(method,
+                                                                 target, form)
+            except HTTPError as e:
+                status, ctype, body, headers = (
+                    e.status, 'text/plain; charset=utf-8',
+                    (str(e) or _REASONS.get(e.status, '')).encode('utf-8'),
+                    {})
+            except Exception as e:
+                status, ctype, body, headers = (
+                    500, 'text/plain; charset=utf-8',
+                    ("Error: %s" % e).encode('utf-8'), {})
+            head = ['HTTP/1.1 %d %s' % (status, _REASONS.get(status, '')),
+                    'Content-Type: ' + ctype,
+                    'Content-Length: %d' % len(body),
+                    'Cache-Control: no-store',
+                    'Connection: close']
+            head.extend('%s: %s' % kv for kv in headers.items())
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+            writer.write(body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        try:
+            method, target, _ = line.decode('latin-1').split()
+        except ValueError:
+            raise HTTPError(400)
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                try:
+                    length = int(value)
+                except ValueError:
+                    raise HTTPError(400)
+        if length > self.maxbody:
+            raise HTTPError(413)
+        body = await reader.readexactly(length) if length > 0 else b''
+        form = parse_qs(body.decode('utf-8', 'replace'))
+        return method, target, form
+
+    async def _route(self, method, target, form):
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        parts = [p for p in url.path.split('/') if p]
+        if not parts:
+            if 'annotator' in query:
+                annotator = query['annotator'][0].strip()
+                if not _ANNOTATOR.match(annotator):
+                    raise HTTPError(400, "Names may only contain letters, "
+                                    "digits, '.', '_' and '-'")
+                return self._redirect('/%s/' % quote(annotator))
+            return self._html("Classifier", self.render_index())
+        annotator = parts[0]
+        if not _ANNOTATOR.match(annotator) or len(parts) > 2:
+            raise HTTPError(404)
+        action = parts[1] if len(parts) == 2 else ''
+        if action not in ('', 'item.json', 'classify'):
+            raise HTTPError(404)
+        session = await self.session(annotator)
+        async with session.lock:
+            if action == 'classify':
+                if method != 'POST':
+                    raise HTTPError(405)
+                if await self._classify(session, form):
+                    await session.call(session.engine.next)
+                return self._redirect('/%s/' % annotator)
+            item = await self._current(session)
+            if action == 'item.json':
+                return self._json(self.item_state(session.engine))
+            if item is None:
+                return self._html("Finished", self.render_finished(
+                    annotator, session.engine))
+            return self._html(_text(item[0]), self.render_page(
+                annotator, session.engine))
+
+    async def _classify(self, session, form):
+        engine = session.engine
+        stale = 'position' in form and (form['position'][0] != str(engine.idx)
+                                        or engine.item is None)
+        if stale:
+            # Already classified, perhaps by a double click or a resubmitted
+            # form; just show the current item
+            return False
+        if not session.started or engine.item is None:
+            raise HTTPError(400, "No item to classify")
+        try:
+            label = engine.labels[int(form['label'][0])]
+        except (KeyError, ValueError, IndexError):
+            raise HTTPError(400, "Unknown label")
+        await session.call(engine.classify, label)
+        return True
+
+    def _redirect(self, location):
+        return 303, 'text/plain; charset=utf-8', b'', {'Location': location}
+
+    def _html(self, title, body):
+        page = _PAGE % {'title': html.escape(title), 'body': body}
+        return 200, 'text/html; charset=utf-8', page.encode('utf-8'), {}
+
+    def _json(self, obj):
+        return (200, 'application/json',
+                json.dumps(obj, default=_jsonable).encode('utf-8'), {})
+
+    def item_state(self, engine):
+        """The state of a session as a JSON-able dict."""
+        return {'position': engine.idx,
+                'item': None if engine.item is None else list(engine.item),
+                'labels': [_text(label) for label in engine.labels],
+                'classified': sum(engine.numclassified.values()),
+                'inferred': engine.numinferred,
+                'finished': engine.item is None}
+
+    def render_index(self):
+        return ('<form method="get" action="/">Your name: '
+                '<input name="annotator" autofocus> '
+                '<button type="submit">Start</button></form>')
+
+    def render_item(self, engine, item, part=0):
+        """HTML showing one item of the current pair (part 0 or 1), or the
+        current item if not classifying pairs."""
+        ident = _text(item[2*part])
+        text = item[2*part+1]
+        body = '<h2>%s</h2>' % html.escape(ident)
+        if text:
+            body += '<div class="text">%s</div>' % html.escape(_text(text))
+        elif re.match(r'^https?://', ident):
+            body += ('<p><a href="%s" target="_blank" rel="noreferrer">'
+                     'Open in a new window</a></p>' %
+                     html.escape(ident, quote=True))
+        return body
+
+    def render_page(self, annotator, engine):
+        item = engine.item
+        parts = (0, 1) if engine.pair else (0,)
+        items = ''.join('<div class="item">%s</div>' %
+                        self.render_item(engine, item, part)
+                        for part in parts)
+        buttons = ''.join('<button type="submit" name="label" value="%d">'
+                          '%s</button>' % (i, html.escape(_text(label)))
+                          for i, label in enumerate(engine.labels))
+        done = sum(engine.numclassified.values())
+        return ('<form method="post" action="/%s/classify">'
+                '<input type="hidden" name="position" value="%d">%s</form>'
+                '<p>%s: %d classified this session</p>'
+                '<div class="items">%s</div>' %
+                (annotator, engine.idx, buttons, html.escape(annotator),
+                 done, items))
+
+    def render_finished(self, annotator, engine):
+        return ('<p>Finished, %s: nothing left to classify. %d classified '
+                'this session.</p>' % (html.escape(annotator),
+                                       sum(engine.numclassified.values())))
@@ -0,0 +1,106 @@
+"""Tests for availability.AvailabilityChecker, against a stub CDX server.
+
+This needs Python 3.
+"""
+
+import threading
+import unittest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from handclassifier.availability import (AvailabilityChecker, REPLAYABLE,
+                                         FALLBACK, MISSING)
+
+# URL -> (status, body) given by the stub server; anything else is a 404
+CAPTURES = {
+    'http://example.com/': (200, b'com,example)/ 20170101000000 '
+                                 b'http://example.com/ text/html 200 X -\n'),
+    'http://example.com/empty': (200, b''),
+    'http://example.com/broken': (500, b'oops'),
+}
+
+class StubCDXHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = parse_qs(urlsplit(self.path).query)
+        self.server.queries.append(query)
+        status, body = CAPTURES.get(query['url'][0], (404, b''))
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class AvailabilityCheckerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), StubCDXHandler)
+        self.server.queries = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.cdxurl = 'http://127.0.0.1:%d/cdx' % self.server.server_port
+        self.fallbackcalls = []
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def fallback(self, urls):
+        self.fallbackcalls.append(list(urls))
+        return set(url for url in urls if url.endswith('/mongo'))
+
+    def checker(self, **kw):
+        checker = AvailabilityChecker(self.cdxurl, timeout=5, **kw)
+        self.addCleanup(checker.stop)
+        return checker
+
+    def test_check_tags(self):
+        checker = self.checker(fallback=self.fallback)
+        statuses = checker.check(['http://example.com/',
+                                  'http://example.com/mongo',
+                                  'http://example.com/gone',
+                                  'http://example.com/empty'])
+        self.assertEqual(statuses, {
+            'http://example.com/': REPLAYABLE,
+            'http://example.com/mongo': FALLBACK,
+            'http://example.com/gone': MISSING,
+            'http://example.com/empty': MISSING,
+        })
+        # Only the unreplayable URLs are looked up in the fallback
+        self.assertEqual(sorted(self.fallbackcalls[0]),
+                         ['http://example.com/empty',
+                          'http://example.com/gone',
+                          'http://example.com/mongo'])
+        self.assertEqual(checker.counts(), {REPLAYABLE: 1, FALLBACK: 1,
+                                            MISSING: 2})
+
+    def test_no_fallback_is_missing(self):
+        checker = self.checker()
+        self.assertEqual(checker.status('http://example.com/mongo'), MISSING)
+        self.assertEqual(checker.status('http://example.com/'), REPLAYABLE)
+
+    def test_errors_are_untagged(self):
+        checker = self.checker(fallback=self.fallback)
+        statuses = checker.check(['http://example.com/broken',
+                                  'http://example.com/'])
+        self.assertEqual(statuses, {'http://example.com/': REPLAYABLE})
+        self.assertEqual(checker.nerrors, 1)
+        # Failed checks are tried again
+        self.assertIsNone(checker.status('http://example.com/broken'))
+        self.assertEqual(checker.nerrors, 2)
+        self.assertEqual(self.fallbackcalls, [])
+
+    def test_query(self):
+        checker = self.checker(params={'filter': 'statuscode:200'})
+        checker.check(['http://example.com/'])
+        checker.check(['http://example.com/'])
+        # Checked once, with the extra parameters
+        self.assertEqual(self.server.queries, [
+            {'url': ['http://example.com/'], 'limit': ['1'],
+             'filter': ['statuscode:200']}])
+
+if __name__ == '__main__':
+    unittest.main()
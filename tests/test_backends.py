@@ -0,0 +1,157 @@
+"""Tests for the backend registry, and for backends.MongoDBBackend against an
+in-memory fake collection."""
+
+import unittest
+import warnings
+
+from handclassifier.backends import (MongoDBBackend, LRUCache, TextBackend,
+                                     get_backend)
+
+class FakeCollection(object):
+    """The parts of a pymongo Collection MongoDBBackend uses: find() with
+    equality, $in and $ne conditions and an inclusive projection, and
+    index_information()."""
+    def __init__(self, docs, indexes=None):
+        self.docs = list(docs)
+        self.indexes = {'_id_': {'key': [('_id', 1)]}}
+        for field in indexes or ():
+            self.indexes[field+'_1'] = {'key': [(field, 1)]}
+        self.queries = []
+
+    def __str__(self):
+        return 'FakeCollection'
+
+    @staticmethod
+    def _matches(doc, query):
+        for field, cond in query.items():
+            value = doc.get(field)
+            if not isinstance(cond, dict):
+                cond = {'$eq': cond}
+            for op, arg in cond.items():
+                if op == '$eq' and value != arg:
+                    return False
+                if op == '$in' and value not in arg:
+                    return False
+                if op == '$ne' and value == arg:
+                    return False
+        return True
+
+    def find(self, query=None, projection=None):
+        self.queries.append(query)
+        for doc in self.docs:
+            if self._matches(doc, query or {}):
+                if projection:
+                    doc = dict((k, v) for k, v in doc.items()
+                               if projection.get(k))
+                yield doc
+
+    def index_information(self):
+        return self.indexes
+
+DOCS = [{'_id': i, 'url': 'http://example.com/%d' % i,
+         'content': 'text %d' % i} for i in range(10)]
+DOCS.append({'_id': 10, 'url': 'http://example.com/empty', 'content': None})
+
+def url(i):
+    return 'http://example.com/%d' % i
+
+class MongoDBBackendTest(unittest.TestCase):
+    def backend(self, docs=DOCS, indexes=('url',), **kw):
+        self.collection = FakeCollection(docs, indexes)
+        return MongoDBBackend(self.collection, **kw)
+
+    def test_batched_want_get(self):
+        backend = self.backend(batchsize=4)
+        backend.want([url(i) for i in range(6)])
+        self.assertEqual(backend.get(url(0)), 'text 0')
+        # The next three wanted URLs came in the same query
+        self.assertEqual(self.collection.queries,
+                         [{'url': {'$in': [url(0), url(1), url(2),
+                                           url(3)]}}])
+        for i in range(4):
+            self.assertEqual(backend.get(url(i)), 'text %d' % i)
+        self.assertEqual(backend.nqueries, 1)
+        self.assertEqual(backend.get(url(4)), 'text 4')
+        self.assertEqual(self.collection.queries[1],
+                         {'url': {'$in': [url(4), url(5)]}})
+        self.assertEqual(backend.nqueries, 2)
+
+    def test_missing(self):
+        backend = self.backend()
+        backend.want([url(1), 'http://example.com/nothing'])
+        self.assertRaises(KeyError, backend.get, 'http://example.com/empty')
+        self.assertRaises(KeyError, backend.get, 'http://example.com/nothing')
+        self.assertEqual(backend.get(url(1)), 'text 1')
+        # All in one query; misses are cached too
+        self.assertEqual(backend.nqueries, 1)
+        self.assertRaises(KeyError, backend.get, 'http://example.com/nothing')
+        self.assertEqual(backend.nqueries, 1)
+
+    def test_lru_cache(self):
+        # Room for two of the six character texts
+        backend = self.backend(batchsize=1, cachesize=12)
+        for i in range(3):
+            backend.get(url(i))
+        self.assertEqual(backend.nqueries, 3)
+        self.assertNotIn(url(0), backend.cache)
+        self.assertEqual(backend.cache.size, 12)
+        backend.get(url(2))
+        backend.get(url(1))
+        self.assertEqual(backend.nqueries, 3)
+        backend.get(url(0))
+        self.assertEqual(backend.nqueries, 4)
+        # url(2) was least recently used
+        self.assertNotIn(url(2), backend.cache)
+        self.assertIn(url(1), backend.cache)
+
+    def test_wanted_not_refetched(self):
+        backend = self.backend(batchsize=3)
+        backend.get(url(0))
+        backend.want([url(0), url(1)])
+        backend.get(url(1))
+        self.assertEqual(self.collection.queries[1],
+                         {'url': {'$in': [url(1)]}})
+
+    def test_missing_index_warning(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.backend(indexes=())
+            self.backend(indexes=('url',))
+            self.backend(indexes=(), urlfield='_id')
+        self.assertEqual(len(caught), 1)
+        self.assertIn("No index on 'url'", str(caught[0].message))
+
+    def test_available(self):
+        backend = self.backend()
+        urls = [url(2), 'http://example.com/empty',
+                'http://example.com/nothing']
+        self.assertEqual(backend.available(urls), set([url(2)]))
+        self.assertEqual(self.collection.queries[-1],
+                         {'url': {'$in': urls}, 'content': {'$ne': None}})
+        self.assertEqual(backend.available([]), set())
+        # Nothing is fetched or cached
+        self.assertEqual(backend.nqueries, 1)
+        self.assertEqual(len(backend.cache), 0)
+
+class LRUCacheTest(unittest.TestCase):
+    def test_oversized(self):
+        cache = LRUCache(4)
+        cache['a'] = 'xx'
+        cache['b'] = 'xxxxxx'
+        self.assertEqual(list(cache._data), ['b'])
+        self.assertEqual(cache.size, 6)
+
+class RegistryTest(unittest.TestCase):
+    def test_text(self):
+        backend = get_backend('text')
+        self.assertIsInstance(backend, TextBackend)
+        self.assertEqual(backend.get(('u1', 'text 1', 'text/html')),
+                         'text 1')
+        pair = ('u1', 'text 1', 'u2', 'text 2')
+        self.assertEqual(backend.get(pair, second=True), 'text 2')
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, get_backend, 'nonesuch')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""Tests for coordinator.Coordinator."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from handclassifier.coordinator import Coordinator, CoordinatorSink
+
+class CoordinatorTest(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dirname)
+        self.coord = self.open()
+        self.items = [('u%d' % i, 'text %d' % i) for i in range(8)]
+
+    def open(self):
+        coord = Coordinator(os.path.join(self.dirname, 'sample.db'))
+        self.addCleanup(coord.close)
+        return coord
+
+    def test_lease_twice(self):
+        self.coord.add_items(self.items)
+        first = self.coord.lease('alice', 3)
+        second = self.coord.lease('alice', 3)
+        self.assertEqual([item[0] for item in first], ['u0', 'u1', 'u2'])
+        self.assertEqual([item[0] for item in second], ['u3', 'u4', 'u5'])
+        self.assertEqual(self.coord.progress()['leased'], 6)
+
+    def test_items_for_with_overlap(self):
+        self.coord.add_items(self.items, overlap=1.0, copies=2)
+        alice = [item[0] for item in self.coord.items_for('alice', batch=3)]
+        self.assertEqual(alice, ['u%d' % i for i in range(8)])
+        # Each item has a copy left for a second annotator, but no more
+        bob = [item[0] for item in self.open().items_for('bob', batch=3)]
+        self.assertEqual(bob, alice)
+        self.assertEqual(self.coord.lease('carol', 3), [])
+
+    def test_leases_shared_out(self):
+        self.coord.add_items(self.items)
+        alice = self.coord.lease('alice', 5)
+        bob = self.open().lease('bob', 5)
+        self.assertEqual(len(alice), 5)
+        self.assertEqual(len(bob), 3)
+        self.assertFalse(set(alice) & set(bob))
+
+    def test_submit_and_release(self):
+        self.coord.add_items(self.items)
+        sink = CoordinatorSink(self.coord, 'alice')
+        leased = self.coord.lease('alice', 3)
+        sink.write([leased[0][0], 'yes'])
+        sink.close()
+        self.assertEqual(self.coord.progress(),
+                         {'items': 8, 'needed': 8, 'results': 1,
+                          'leased': 0})
+        # The released items go back into the pool; the classified one
+        # doesn't
+        again = self.coord.lease('bob', 3)
+        self.assertEqual([item[0] for item in again], ['u1', 'u2', 'u3'])
+        self.assertEqual(list(self.coord.results()),
+                         [('alice', ['u0', 'yes'])])
+
+    def test_expired_leases(self):
+        self.coord.add_items(self.items[:2])
+        self.coord.lease('alice', 2, duration=-1)
+        self.assertEqual(len(self.coord.lease('bob', 2)), 2)
+
+    def test_lease_after_results(self):
+        self.coord.add_items(self.items[:4], overlap=1.0, copies=2)
+        sink = CoordinatorSink(self.coord, 'alice')
+        for item in self.coord.lease('alice', 2):
+            sink.write([item[0], 'yes'])
+        # An expired lease is offered again, though the annotator has
+        # leased past it
+        self.assertEqual(self.coord.lease('bob', 1, duration=-1),
+                         [self.items[0]])
+        self.assertEqual([item[0] for item in self.coord.lease('bob', 4)],
+                         ['u0', 'u1', 'u2', 'u3'])
+        for item in self.coord.lease('alice', 4):
+            sink.write([item[0], 'yes'])
+        self.assertEqual(self.coord.lease('alice', 4), [])
+        # Items added later are still found
+        self.coord.add_items(self.items[4:6])
+        self.assertEqual([item[0] for item in self.coord.lease('alice', 4)],
+                         ['u4', 'u5'])
+        self.assertEqual(self.coord.lease('alice', 4), [])
+
+    def test_results_renew_leases(self):
+        self.coord.add_items(self.items[:3])
+        sink = CoordinatorSink(self.coord, 'alice', duration=60)
+        leased = self.coord.lease('alice', 3, duration=-1)
+        sink.write([leased[0][0], 'yes'])
+        # Still held for alice, though the leases were given already expired
+        self.assertEqual(self.coord.lease('bob', 3), [])
+        self.assertEqual(self.coord.progress()['leased'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
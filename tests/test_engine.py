@@ -0,0 +1,156 @@
+"""Tests for engine.ClassificationEngine, run without a user interface."""
+
+import io
+import unittest
+
+from handclassifier.engine import ClassificationEngine
+from handclassifier.resume import ResumeIndex, UNABLE
+from handclassifier.clusters import PairClusters, JUDGED, INFERRED
+from handclassifier.payloads import PayloadGroups, PROPAGATED
+
+class ListSink(object):
+    def __init__(self):
+        self.rows = []
+        self.nflushes = 0
+
+    def write(self, row):
+        self.rows.append(row)
+
+    def flush(self):
+        self.nflushes += 1
+
+ITEMS = [('a', 'text a', 'text/html'), ('b', 'text b', 'text/plain'),
+         ('c', 'text c', 'text/html')]
+
+class ClassificationEngineTest(unittest.TestCase):
+    def engine(self, items=ITEMS, labels=('yes', 'no', UNABLE), **kw):
+        self.sink = ListSink()
+        self.called = []
+        return ClassificationEngine(
+            items, labels=list(labels), sink=self.sink,
+            callback=lambda item, label: self.called.append((item[0],
+                                                             label)),
+            **kw)
+
+    def run_session(self, engine, answer):
+        """Classify every item with answer(item); return the identifiers
+        shown."""
+        shown = []
+        while engine.next() is not None:
+            shown.append(engine.item[0])
+            engine.shown()
+            engine.classify(answer(engine.item))
+        return shown
+
+    def test_session(self):
+        engine = self.engine()
+        self.assertEqual(engine.next(), ITEMS[0])
+        self.assertEqual(engine.idx, 0)
+        self.assertEqual(engine.prepared, {})
+        engine.classify('yes')
+        self.assertEqual(engine.next(), ITEMS[1])
+        engine.classify('no')
+        self.assertEqual(engine.next(), ITEMS[2])
+        engine.classify('yes')
+        self.assertFalse(engine.finished)
+        self.assertIsNone(engine.next())
+        self.assertTrue(engine.finished)
+        self.assertIsNone(engine.item)
+        self.assertEqual(self.sink.rows, [['a', 'yes', 'text/html'],
+                                          ['b', 'no', 'text/plain'],
+                                          ['c', 'yes', 'text/html']])
+        self.assertEqual(engine.numclassified, {'yes': 2, 'no': 1,
+                                                UNABLE: 0})
+        self.assertEqual(self.called, [('a', 'yes'), ('b', 'no'),
+                                       ('c', 'yes')])
+        self.assertEqual(self.sink.nflushes, 1)
+        # Finishing again does nothing more
+        engine.finish()
+        self.assertEqual(self.sink.nflushes, 1)
+
+    def test_classify_without_item(self):
+        engine = self.engine()
+        self.assertRaises(IndexError, engine.classify, 'yes')
+        self.run_session(engine, lambda item: 'yes')
+        self.assertRaises(IndexError, engine.classify, 'yes')
+        self.assertEqual(len(self.sink.rows), 3)
+
+    def test_too_few_labels(self):
+        self.assertRaises(Exception, self.engine, labels=['yes'])
+
+    def test_prepare(self):
+        for prefetch in 0, 2:
+            engine = self.engine(prefetch=prefetch,
+                                 prepare=lambda item: {'upper':
+                                                       item[1].upper()})
+            prepared = []
+            while engine.next() is not None:
+                prepared.append(engine.prepared['upper'])
+                engine.classify('yes')
+            self.assertEqual(prepared, ['TEXT A', 'TEXT B', 'TEXT C'])
+
+    def test_resume(self):
+        resume = ResumeIndex()
+        resume.load_rows([['a', 'yes'], ['b', UNABLE]])
+        debug = io.StringIO() if bytes is not str else io.BytesIO()
+        engine = self.engine(resume=resume, debug=debug)
+        self.assertEqual(engine.nprevclass, 1)
+        shown = self.run_session(engine, lambda item: 'no')
+        self.assertIn("Classified 2 this session, 3 in all",
+                      debug.getvalue())
+        # b, unable to be determined last time, comes again at the end
+        self.assertEqual(shown, ['c', 'b'])
+        self.assertEqual(resume.label(ITEMS[1]), 'no')
+        self.assertEqual(len(resume), 3)
+
+    def test_pair_inference(self):
+        pairs = [('x', 'text x', 'y', 'text y'),
+                 ('y', 'text y', 'z', 'text z'),
+                 ('x', 'text x', 'z', 'text z'),
+                 ('x', 'text x', 'w', 'text w'),
+                 ('z', 'text z', 'w', 'text w')]
+        engine = self.engine(pairs, labels=('Related', 'Unrelated'),
+                             pair=True, clusters=PairClusters())
+        answers = {('x', 'y'): 'Related', ('y', 'z'): 'Related',
+                   ('x', 'w'): 'Unrelated'}
+        shown = self.run_session(engine,
+                                 lambda item: answers[item[0], item[2]])
+        self.assertEqual(shown, ['x', 'y', 'x'])
+        self.assertEqual(self.sink.rows, [
+            ['x', 'y', 'Related', JUDGED],
+            ['y', 'z', 'Related', JUDGED],
+            ['x', 'z', 'Related', INFERRED],
+            ['x', 'w', 'Unrelated', JUDGED],
+            ['z', 'w', 'Unrelated', INFERRED]])
+        self.assertEqual(engine.numinferred, 2)
+        self.assertEqual(sum(engine.numclassified.values()), 3)
+        self.assertEqual(len(self.called), 5)
+
+    def test_clusters_need_pairs(self):
+        engine = self.engine(clusters=PairClusters())
+        self.assertIsNone(engine.clusters)
+
+    def test_duplicate_order(self):
+        items = [('a1', None, 'A'), ('a2', None, 'A'), ('b1', None, 'B'),
+                 ('a3', None, 'A'), ('b2', None, 'B')]
+        engine = self.engine(items, duplicates=PayloadGroups(field=2))
+        self.assertEqual(engine.next()[0], 'a1')
+        engine.classify('yes')
+        self.assertEqual([row[0] for row in self.sink.rows], ['a1'])
+        # Moving on writes the members of labelled groups it passes, then
+        # stops at the next item needing a judgment
+        self.assertEqual(engine.next()[0], 'b1')
+        engine.classify('no')
+        self.assertIsNone(engine.next())
+        self.assertEqual(self.sink.rows, [
+            ['a1', 'yes', 'A', JUDGED],
+            ['a2', 'yes', 'A', PROPAGATED],
+            ['b1', 'no', 'B', JUDGED],
+            ['a3', 'yes', 'A', PROPAGATED],
+            ['b2', 'no', 'B', PROPAGATED]])
+        self.assertEqual(engine.numpropagated, 3)
+        self.assertEqual(self.called, [(row[0], row[1])
+                                       for row in self.sink.rows])
+
+if __name__ == '__main__':
+    unittest.main()
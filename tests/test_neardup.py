@@ -0,0 +1,88 @@
+"""Tests for neardup.NearDuplicateFilter."""
+
+import io
+import random
+import unittest
+
+from handclassifier.neardup import NearDuplicateFilter, simhash, hamming
+
+WORDS = [u'council', u'library', u'street', u'spring', u'hours', u'cafe',
+         u'road', u'waste', u'garden', u'school', u'park', u'bus',
+         u'meeting', u'budget', u'housing', u'planning']
+
+def page(seed, n=300):
+    r = random.Random(seed)
+    return u' '.join(r.choice(WORDS) for _ in range(n))
+
+BASE = page(1)
+
+ITEMS = [('a', BASE),
+         ('b', page(2)),
+         ('a-copy', BASE),
+         ('a-edit', BASE + u' with a few more words'),
+         ('c', page(3))]
+
+# Unrelated pages are around 30 bits apart, the edited copy a few
+DISTANCE = 8
+
+class NearDuplicateFilterTest(unittest.TestCase):
+    def setUp(self):
+        fingerprint = simhash(BASE)
+        self.assertLessEqual(hamming(fingerprint, simhash(ITEMS[3][1])),
+                             DISTANCE)
+        for _, text in ITEMS[1], ITEMS[4]:
+            self.assertGreater(hamming(fingerprint, simhash(text)),
+                               DISTANCE)
+
+    def test_filter(self):
+        items = NearDuplicateFilter(ITEMS, DISTANCE, processes=1)
+        self.assertEqual([item[0] for item in items], ['a', 'b', 'c'])
+        self.assertEqual(items.nitems, 5)
+        self.assertEqual(items.nsuppressed(), 2)
+        self.assertEqual([m for m, _ in items.members['a']],
+                         ['a-copy', 'a-edit'])
+
+    def test_iterate_twice(self):
+        items = NearDuplicateFilter(ITEMS, DISTANCE, processes=1, chunksize=2)
+        first = list(items)
+        output = io.StringIO() if str is not bytes else io.BytesIO()
+        items.export_csv(output)
+        second = list(items)
+        self.assertEqual(second, first)
+        self.assertEqual(items.nitems, 5)
+        self.assertEqual(items.nsuppressed(), 2)
+        self.assertEqual(len(list(items.clusters())), 1)
+        again = io.StringIO() if str is not bytes else io.BytesIO()
+        items.export_csv(again)
+        self.assertEqual(again.getvalue(), output.getvalue())
+        self.assertEqual(len(output.getvalue().splitlines()), 2)
+
+    def test_pool(self):
+        items = NearDuplicateFilter(ITEMS, DISTANCE, processes=2, chunksize=2)
+        self.assertEqual([item[0] for item in items], ['a', 'b', 'c'])
+        self.assertEqual([item[0] for item in items], ['a', 'b', 'c'])
+
+    def test_no_text_unclustered(self):
+        items = [('u1', None), ('u2', u''), ('a', BASE), ('u3', u' -- . \n'),
+                 ('a-copy', BASE), ('u5', b'')]
+        for processes in 1, 2:
+            result = NearDuplicateFilter(items, DISTANCE, processes=processes,
+                                         chunksize=2)
+            self.assertEqual([item[0] for item in result],
+                             ['u1', 'u2', 'a', 'u3', 'u5'])
+            self.assertEqual(result.nempty, 4)
+            self.assertEqual(result.nsuppressed(), 1)
+            self.assertEqual(dict(result.members),
+                             {'a': [('a-copy', 0)]})
+        self.assertIsNone(simhash(None))
+        self.assertIsNone(simhash(u' -- . \n'))
+
+    def test_content_not_text(self):
+        items = NearDuplicateFilter([('u1', object())], processes=1)
+        self.assertRaises(TypeError, list, items)
+        items = NearDuplicateFilter([('u1', object(), u'words here')],
+                                    processes=1, text=lambda item: item[2])
+        self.assertEqual(len(list(items)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
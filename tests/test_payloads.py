@@ -0,0 +1,143 @@
+"""Tests for payloads.PayloadGroups in a classification session."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from handclassifier.engine import ClassificationEngine
+from handclassifier.payloads import PayloadGroups, PROPAGATED
+from handclassifier.clusters import JUDGED
+from handclassifier.resume import UNABLE, ResumeIndex
+from handclassifier.sinks import CSVSink
+
+class ListSink(object):
+    def __init__(self):
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+    def flush(self):
+        pass
+
+def item(url, digest):
+    return (url, None, 200, 'text/html', digest)
+
+ITEMS = [item('a1', 'A'), item('b1', 'B'), item('a2', 'A'), item('a3', 'A'),
+         item('c1', None)]
+
+class PayloadGroupsTest(unittest.TestCase):
+    def test_hold_and_record(self):
+        groups = PayloadGroups()
+        a1, b1, a2, a3 = ITEMS[:4]
+        self.assertFalse(groups.hold(a1))
+        self.assertFalse(groups.hold(b1))
+        self.assertTrue(groups.hold(a2))
+        self.assertTrue(groups.hold(a3))
+        self.assertFalse(groups.hold(ITEMS[4]))
+        self.assertEqual(groups.waiting(), 2)
+        # A retry label makes the next member the representative
+        self.assertEqual(groups.record(a1, UNABLE), [])
+        self.assertIsNone(groups.label(a1))
+        self.assertEqual(groups.promoted(), a2)
+        self.assertIsNone(groups.promoted())
+        self.assertEqual(groups.record(a2, 'yes'), [a3])
+        self.assertEqual(groups.label(a1), 'yes')
+        self.assertEqual(groups.record(b1, UNABLE), [])
+        # With no members waiting, the next to turn up represents the group
+        self.assertIsNone(groups.promoted())
+        self.assertFalse(groups.hold(item('b2', 'B')))
+        self.assertEqual(groups.waiting(), 0)
+
+    def session(self, items, answers, **kw):
+        """Run a session giving each shown item the label answers maps its
+        identifier to; return the identifiers shown and the rows written."""
+        sink = ListSink()
+        engine = ClassificationEngine(items, labels=['yes', 'no', UNABLE],
+                                      sink=sink, **kw)
+        shown = []
+        while engine.next() is not None:
+            shown.append(engine.item[0])
+            engine.classify(answers[engine.item[0]])
+        return shown, sink.rows
+
+    def test_propagation(self):
+        shown, rows = self.session(ITEMS, {'a1': 'yes', 'b1': 'no',
+                                           'c1': 'no'},
+                                   duplicates=PayloadGroups())
+        self.assertEqual(shown, ['a1', 'b1', 'c1'])
+        self.assertEqual(sorted((row[0], row[1], row[-1]) for row in rows),
+                         [('a1', 'yes', JUDGED), ('a2', 'yes', PROPAGATED),
+                          ('a3', 'yes', PROPAGATED), ('b1', 'no', JUDGED),
+                          ('c1', 'no', JUDGED)])
+
+    def test_retry_not_propagated(self):
+        groups = PayloadGroups()
+        shown, rows = self.session(ITEMS, {'a1': UNABLE, 'a2': 'yes',
+                                           'b1': 'no', 'c1': 'no'},
+                                   lookahead=1, duplicates=groups)
+        # a2 is shown in place of a1, which couldn't be judged
+        self.assertEqual(shown, ['a1', 'b1', 'a2', 'c1'])
+        self.assertEqual(sorted((row[0], row[1], row[-1]) for row in rows),
+                         [('a1', UNABLE, JUDGED), ('a2', 'yes', JUDGED),
+                          ('a3', 'yes', PROPAGATED), ('b1', 'no', JUDGED),
+                          ('c1', 'no', JUDGED)])
+        self.assertEqual(groups.labels, {'A': 'yes', 'B': 'no'})
+        self.assertEqual(groups.waiting(), 0)
+
+    def test_retry_last_member(self):
+        groups = PayloadGroups()
+        shown, rows = self.session([item('a1', 'A')] + ITEMS[1:],
+                                   {'a1': UNABLE, 'b1': 'no', 'a2': UNABLE,
+                                    'a3': 'no', 'c1': 'yes'},
+                                   duplicates=groups)
+        self.assertEqual(shown, ['a1', 'b1', 'a2', 'a3', 'c1'])
+        self.assertNotIn(PROPAGATED, [row[-1] for row in rows])
+
+    def test_resume_retry_labels(self):
+        groups = PayloadGroups()
+        resume = ResumeIndex(retrylabels=('skip',))
+        shown, rows = self.session(ITEMS, {'a1': UNABLE, 'b1': 'no',
+                                           'c1': 'no'},
+                                   duplicates=groups, resume=resume)
+        self.assertEqual(groups.retrylabels, frozenset(['skip']))
+        self.assertEqual(shown, ['a1', 'b1', 'c1'])
+        self.assertEqual(groups.labels['A'], UNABLE)
+
+    def test_rerun_seeded_from_output(self):
+        dirname = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dirname)
+        outfn = os.path.join(dirname, 'out.csv')
+        with open(outfn, 'w') as output:
+            sink = CSVSink(output)
+            engine = ClassificationEngine(
+                ITEMS[:2] + [item('d1', 'D')],
+                labels=['yes', 'no', UNABLE], sink=sink,
+                duplicates=PayloadGroups())
+            for label in ['yes', 'no', UNABLE]:
+                engine.next()
+                engine.classify(label)
+        # New members of the labelled groups turn up on a later run, after
+        # the items already done, which the resume index skips
+        groups = PayloadGroups(fn=outfn)
+        self.assertEqual(groups.labels, {'A': 'yes', 'B': 'no'})
+        shown, rows = self.session(
+            ITEMS + [item('d1', 'D'), item('d2', 'D')],
+            {'c1': 'no', 'd2': 'yes'},
+            resume=ResumeIndex(outfn), duplicates=groups)
+        # d1, marked unable last time, is retried at the end and so comes
+        # after d2, which takes its place as representative
+        self.assertEqual(shown, ['c1', 'd2'])
+        self.assertEqual(sorted((row[0], row[1], row[-1]) for row in rows),
+                         [('a2', 'yes', PROPAGATED), ('a3', 'yes', PROPAGATED),
+                          ('c1', 'no', JUDGED), ('d1', 'yes', PROPAGATED),
+                          ('d2', 'yes', JUDGED)])
+
+    def test_bytes_digests(self):
+        groups = PayloadGroups()
+        groups.load_rows([['a1', 'yes', 200, 'text/html', 'sha1:AAAA']])
+        self.assertEqual(groups.label(item(b'a2', b'sha1:AAAA')), 'yes')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""Tests for prefetch.Prefetcher."""
+
+import threading
+import unittest
+
+from handclassifier.prefetch import Prefetcher
+
+class PrefetcherTest(unittest.TestCase):
+    def test_prefetch(self):
+        prepared = []
+        def prepare(item):
+            prepared.append(item[0])
+            return item[0].upper()
+        prefetcher = Prefetcher(prepare, nthreads=2)
+        self.addCleanup(prefetcher.shutdown)
+        items = [('a',), ('b',), ('c',)]
+        prefetcher.prefetch(items)
+        prefetcher.prefetch(items[:2])
+        self.assertEqual(len(prefetcher), 3)
+        self.assertEqual([prefetcher.get(item) for item in items],
+                         ['A', 'B', 'C'])
+        self.assertEqual(sorted(prepared), ['a', 'b', 'c'])
+        # Not prefetched: prepared in this thread
+        self.assertEqual(prefetcher.get(('d',)), 'D')
+        self.assertEqual(len(prefetcher), 0)
+
+    def test_error(self):
+        def prepare(item):
+            raise ValueError(item[0])
+        prefetcher = Prefetcher(prepare, nthreads=1)
+        self.addCleanup(prefetcher.shutdown)
+        item = ('a',)
+        prefetcher.prefetch([item])
+        self.assertRaises(ValueError, prefetcher.get, item)
+
+    def test_discard(self):
+        started = threading.Event()
+        release = threading.Event()
+        prepared = []
+        def prepare(item):
+            if item[0] == 'slow':
+                started.set()
+                release.wait(10)
+            prepared.append(item[0])
+            return item[0]
+        prefetcher = Prefetcher(prepare, nthreads=1)
+        slow, dropped, kept = ('slow',), ('dropped',), ('kept',)
+        prefetcher.prefetch([slow, dropped, kept])
+        started.wait(10)
+        # Still queued behind slow, so never prepared
+        prefetcher.discard(dropped)
+        release.set()
+        self.assertEqual(prefetcher.get(kept), 'kept')
+        self.assertEqual(prepared, ['slow', 'kept'])
+        prefetcher.shutdown()
+        self.assertEqual(len(prefetcher), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""Tests for warcsampler.WarcSampler and stratsampler.StratifiedWarcSampler,
+over small generated WARC files.
+
+This needs warctools ('pip install warctools').
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import hanzo.warctools
+except ImportError:
+    raise unittest.SkipTest("warctools is not installed")
+
+from handclassifier.bench import make_warcs
+from handclassifier.warcsampler import WarcSampler
+from handclassifier.stratsampler import StratifiedWarcSampler
+
+class WarcSamplerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dirname = tempfile.mkdtemp()
+        make_warcs(cls.dirname, 2, 100, 200)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dirname)
+
+    def check_repeatable(self, sampler):
+        first = list(sampler)
+        rejects = dict(sampler.rejects)
+        self.assertTrue(rejects)
+        self.assertEqual(sampler.nscanned, 2)
+        self.assertEqual(list(sampler), first)
+        self.assertEqual(dict(sampler.rejects), rejects)
+        self.assertEqual(sampler.nscanned, 2)
+        return first, rejects
+
+    def test_iterate_twice(self):
+        sampler = WarcSampler(self.dirname, 0.2, processes=1,
+                              discardurls=('http://site0.example.gov.uk/'
+                                           'section/1/',))
+        items, rejects = self.check_repeatable(sampler)
+        self.assertIn('discardurls', rejects)
+        self.assertEqual(len(items) + sum(rejects.values()), 200)
+        self.assertEqual(sampler.sample(), items)
+        self.assertEqual(dict(sampler.rejects), rejects)
+
+    def test_stratified_iterate_twice(self):
+        sampler = StratifiedWarcSampler(self.dirname, 'mime', default=10,
+                                        processes=1)
+        items, rejects = self.check_repeatable(sampler)
+        self.assertEqual(len(items) + sum(rejects.values()), 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""Tests for webserve.WebFrontend, over HTTP on the loopback interface.
+
+This needs Python 3.
+"""
+
+import json
+import asyncio
+import unittest
+from urllib.parse import urlencode
+
+from handclassifier.engine import ClassificationEngine
+from handclassifier.webserve import WebFrontend
+
+class ListSink(object):
+    def __init__(self):
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+    def flush(self):
+        pass
+
+ITEMS = [('a', 'text <a>'), ('b', 'text b')]
+
+class WebFrontendTest(unittest.TestCase):
+    def setUp(self):
+        self.sinks = {}
+        self.loop = asyncio.new_event_loop()
+        self.frontend = WebFrontend(self.session, port=0)
+        self.loop.run_until_complete(self.frontend.start())
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.frontend.stop())
+        self.loop.close()
+
+    def session(self, annotator):
+        if annotator == 'broken':
+            raise ValueError("no items for you")
+        self.sinks[annotator] = ListSink()
+        return ClassificationEngine(list(ITEMS), labels=['yes', 'no'],
+                                    sink=self.sinks[annotator])
+
+    async def _request(self, method, path, form=None):
+        reader, writer = await asyncio.open_connection('127.0.0.1',
+                                                       self.frontend.port)
+        body = urlencode(form or {}).encode('utf-8')
+        writer.write(('%s %s HTTP/1.1\r\nHost: localhost\r\n'
+                      'Content-Length: %d\r\n\r\n' %
+                      (method, path, len(body))).encode('latin-1') + body)
+        await writer.drain()
+        data = await reader.read()
+        writer.close()
+        head, _, body = data.partition(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        headers = dict(line.split(': ', 1) for line in lines[1:])
+        return int(lines[0].split()[1]), headers, body
+
+    def request(self, method, path, form=None):
+        return self.loop.run_until_complete(self._request(method, path,
+                                                          form))
+
+    def state(self, annotator):
+        status, headers, body = self.request('GET', '/%s/item.json' %
+                                             annotator)
+        self.assertEqual(status, 200)
+        return json.loads(body.decode('utf-8'))
+
+    def test_session(self):
+        status, _, body = self.request('GET', '/alice/')
+        self.assertEqual(status, 200)
+        self.assertIn(b'text &lt;a&gt;', body)
+        self.assertEqual(self.state('alice')['item'], ['a', 'text <a>'])
+        status, headers, _ = self.request('POST', '/alice/classify',
+                                          {'label': 1, 'position': 0})
+        self.assertEqual(status, 303)
+        self.assertEqual(headers['Location'], '/alice/')
+        # A resubmitted form is ignored
+        self.request('POST', '/alice/classify', {'label': 0, 'position': 0})
+        state = self.state('alice')
+        self.assertEqual((state['position'], state['item'][0],
+                          state['classified']), (1, 'b', 1))
+        self.request('POST', '/alice/classify', {'label': 0, 'position': 1})
+        status, _, body = self.request('GET', '/alice/')
+        self.assertIn(b'Finished', body)
+        self.assertTrue(self.state('alice')['finished'])
+        self.assertEqual(self.sinks['alice'].rows, [['a', 'no'],
+                                                    ['b', 'yes']])
+
+    def test_annotators_separate(self):
+        # Nothing has been shown to classify yet
+        self.assertEqual(self.request('POST', '/alice/classify',
+                                      {'label': 0})[0], 400)
+        self.state('alice')
+        self.state('bob')
+        self.request('POST', '/alice/classify', {'label': 0})
+        self.assertEqual(self.state('bob')['item'][0], 'a')
+        self.assertEqual(self.state('alice')['classified'], 1)
+
+    def test_errors(self):
+        self.assertEqual(self.request('GET', '/alice/classify')[0], 405)
+        self.assertEqual(self.request('POST', '/alice/classify',
+                                      {'label': 7})[0], 400)
+        self.assertEqual(self.request('GET', '/alice/other')[0], 404)
+        self.assertEqual(self.request('GET', '/?annotator=a%20b')[0], 400)
+        status, headers, _ = self.request('GET', '/?annotator=carol')
+        self.assertEqual((status, headers['Location']), (303, '/carol/'))
+        self.assertEqual(self.request('GET', '/broken/')[0], 500)
+        # A failed session is tried again on the next request
+        self.assertEqual(self.request('GET', '/broken/')[0], 500)
+
+if __name__ == '__main__':
+    unittest.main()